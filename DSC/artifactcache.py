@@ -0,0 +1,175 @@
+#!/usr/bin/env python2
+#
+# Copyright (C) Microsoft Corporation, All rights reserved.
+
+"""Content-addressed cache of the downloaded MOF, meta MOF and resource module files."""
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+import serializerfactory
+
+INDEX_FILE_NAME = "index.json"
+OBJECTS_DIR_NAME = "objects"
+CHUNK_SIZE = 64 * 1024
+
+json = serializerfactory.get_serializer(sys.version_info)
+
+
+class ArtifactCache:
+    """Keeps the last download of every URI with its ETag/Last-Modified, stored under the SHA-256 of its content.
+
+    Layout of cache_dir:
+        index.json                  : {"artifacts": {uri: entry}, "applied": {operation: {"sha256", "output"}}}
+        objects/<sha256>/<file_name>: the content, under its original file name since InstallModule.py derives the
+                                      module name from it
+
+    The "applied" records remember the content last applied successfully by each operation (ApplyMof, ApplyMetaMof,
+    InstallModule) so that identical content is not applied again.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, OBJECTS_DIR_NAME)
+        self.index_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+        self.index = None
+
+    def load(self):
+        if self.index is None:
+            try:
+                with open(self.index_path) as f:
+                    self.index = json.load(f)
+            except (IOError, ValueError):
+                self.index = {}
+            self.index.setdefault("artifacts", {})
+            self.index.setdefault("applied", {})
+        return self.index
+
+    def save(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.index, f)
+        os.rename(temp_path, self.index_path)
+
+    def get_path(self, entry):
+        return os.path.join(self.objects_dir, entry["sha256"], entry["file_name"])
+
+    def lookup(self, uri):
+        """Returns the cache entry of uri, or None if uri was never downloaded or its file is gone.
+
+        Args:
+            uri : string, the download uri.
+
+        Returns:
+            A dictionary with the sha256, file_name, etag and last_modified of the last download
+        """
+        entry = self.load()["artifacts"].get(uri)
+        if entry is None or not os.path.isfile(self.get_path(entry)):
+            return None
+        return entry
+
+    def get_conditional_headers(self, uri):
+        """Returns the headers which make a GET of uri return 304 if the cached content is still current."""
+        headers = {}
+        entry = self.lookup(uri)
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_current(self, uri, etag, last_modified):
+        """Returns True if the cached content of uri has the given ETag, or Last-Modified when there is no ETag."""
+        entry = self.lookup(uri)
+        if entry is None:
+            return False
+        if etag:
+            return entry.get("etag") == etag
+        return bool(last_modified) and entry.get("last_modified") == last_modified
+
+    def add_stream(self, uri, stream, file_name, etag=None, last_modified=None):
+        """Copies stream into the cache as the content of uri.
+
+        Returns:
+            The path of the cached file
+        """
+        temp_path = self.get_temp_path()
+        try:
+            with open(temp_path, "wb") as dest:
+                shutil.copyfileobj(stream, dest, CHUNK_SIZE)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return self.add_file(uri, temp_path, file_name, etag, last_modified)
+
+    def get_temp_path(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+        os.close(fd)
+        return temp_path
+
+    def add_file(self, uri, temp_path, file_name, etag=None, last_modified=None):
+        """Moves temp_path, which must be in cache_dir, into the cache as the content of uri.
+
+        Returns:
+            The path of the cached file
+        """
+        entry = {"sha256": get_sha256(temp_path),
+                 "file_name": file_name,
+                 "etag": etag,
+                 "last_modified": last_modified}
+        path = self.get_path(entry)
+        if os.path.isfile(path):
+            os.remove(temp_path)
+        else:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            os.rename(temp_path, path)
+
+        artifacts = self.load()["artifacts"]
+        previous = artifacts.get(uri)
+        artifacts[uri] = entry
+        self.save()
+        if previous is not None and previous["sha256"] != entry["sha256"]:
+            self.remove_unreferenced(previous["sha256"])
+        return path
+
+    def remove_unreferenced(self, sha256):
+        for entry in self.load()["artifacts"].values():
+            if entry["sha256"] == sha256:
+                return
+        shutil.rmtree(os.path.join(self.objects_dir, sha256), ignore_errors=True)
+
+    def get_applied(self, operation, file_path):
+        """Returns the output recorded when the content of file_path was last applied by operation, or None if
+        operation last applied something else.
+        """
+        applied = self.load()["applied"].get(operation)
+        if applied is None or applied["sha256"] != get_sha256(file_path):
+            return None
+        return applied["output"]
+
+    def set_applied(self, operation, file_path, output):
+        self.load()["applied"][operation] = {"sha256": get_sha256(file_path), "output": output}
+        self.save()
+
+    def clear_applied(self, operation):
+        if self.load()["applied"].pop(operation, None) is not None:
+            self.save()
+
+
+def get_sha256(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        chunk = f.read(CHUNK_SIZE)
+        while chunk:
+            sha256.update(chunk)
+            chunk = f.read(CHUNK_SIZE)
+    return sha256.hexdigest()
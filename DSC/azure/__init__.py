@@ -30,8 +30,16 @@ else:
     _strtype = str
 
 from datetime import datetime
+from io import BytesIO
 from xml.dom import minidom
 from xml.sax.saxutils import escape as xml_escape
+try:
+    from xml.etree import cElementTree as ETree
+except ImportError:
+    try:
+        from xml.etree import ElementTree as ETree
+    except ImportError:
+        ETree = None
 
 #--------------------------------------------------------------------------
 # constants
@@ -216,6 +224,31 @@ def _get_entry_properties_from_node(entry, include_id, id_prefix_to_skip=None, u
     return properties
 
 
+def _get_entry_properties_from_etree(entry, include_id, id_prefix_to_skip=None, use_title_as_id=False):
+    ''' get properties from an ElementTree entry element '''
+    properties = {}
+
+    etag = _etree_attribute(entry, '{' + METADATA_NS + '}etag')
+    if etag:
+        properties['etag'] = etag
+    for updated in _get_etree_child_nodes(entry, 'updated'):
+        properties['updated'] = _etree_text(updated)
+    for name in _get_etree_children_from_path(entry, 'author', 'name'):
+        if name.text is not None:
+            properties['author'] = _etree_text(name)
+
+    if include_id:
+        if use_title_as_id:
+            for title in _get_etree_child_nodes(entry, 'title'):
+                properties['name'] = _etree_text(title)
+        else:
+            for id in _get_etree_child_nodes(entry, 'id'):
+                properties['name'] = _get_readable_id(
+                    _etree_text(id), id_prefix_to_skip)
+
+    return properties
+
+
 def _get_entry_properties(xmlstr, include_id, id_prefix_to_skip=None):
     ''' get properties from entry xml '''
     xmldoc = minidom.parseString(xmlstr)
@@ -265,6 +298,112 @@ def _get_child_nodesNS(node, ns, tagName):
             if childNode.parentNode == node]
 
 
+#--------------------------------------------------------------------------
+# ElementTree parsing helpers.
+#
+# These mirror the minidom helpers above, but operate on ElementTree
+# elements so that responses can be converted in a single iterparse pass.
+# Every element handed to an iterparse callback is released from the tree as
+# soon as it has been converted, so memory stays bounded by the size of a
+# single item rather than by the size of the whole response.
+#
+# To match elements exactly the way minidom's getElementsByTagName does,
+# _iterparse_etree renames elements in the default namespace to their bare
+# local name, while prefixed elements keep their '{uri}name' tag.
+
+def _etree_local_name(tag):
+    if tag[:1] == '{':
+        return tag[tag.find('}') + 1:]
+    return tag
+
+
+def _etree_unicode(value):
+    if value is not None and not isinstance(value, _unicode_type):
+        value = value.decode('utf-8')
+    return value
+
+
+def _etree_text(element):
+    return _etree_unicode(element.text)
+
+
+def _etree_attribute(element, name, default=None):
+    return _etree_unicode(element.get(name, default))
+
+
+def _etree_source(body):
+    if isinstance(body, _unicode_type):
+        body = body.encode('utf-8')
+    return BytesIO(body)
+
+
+def _get_etree_child_nodes(element, tag_name):
+    return [child for child in element if child.tag == tag_name]
+
+
+def _get_etree_children_from_path(element, *path):
+    '''same as _get_children_from_path, but the path starts below the given
+    element instead of at the document.'''
+    cur = element
+    for index, child in enumerate(path):
+        next = _get_etree_child_nodes(cur, child)
+        if index == len(path) - 1:
+            return next
+        elif not next:
+            break
+
+        cur = next[0]
+    return []
+
+
+def _iterparse_etree(body, item_paths, item_callback):
+    '''Parses body in one streaming pass.
+
+    item_paths is a collection of tuples of element names, starting with the
+    root element, e.g. ('EnumerationResults', 'Blobs', 'Blob').  Each time an
+    element at one of those paths has been completely parsed,
+    item_callback(path, element) is called and the element is then dropped
+    from the tree.  Returns the root element, which only holds what was not
+    handed to item_callback.'''
+    root = None
+    names = []
+    elements = []
+    default_namespaces = [None]
+    declared = []
+    for event, element in ETree.iterparse(_etree_source(body),
+                                          events=('start', 'end',
+                                                  'start-ns')):
+        if event == 'start-ns':
+            declared.append(element)
+            continue
+        if event == 'start':
+            if root is None:
+                root = element
+            default_namespace = default_namespaces[-1]
+            for prefix, uri in declared:
+                if not prefix:
+                    default_namespace = uri
+            declared = []
+            default_namespaces.append(default_namespace)
+            if default_namespace and \
+                element.tag.startswith('{' + default_namespace + '}'):
+                element.tag = element.tag[len(default_namespace) + 2:]
+            names.append(element.tag)
+            elements.append(element)
+            continue
+
+        path = tuple(names)
+        names.pop()
+        elements.pop()
+        default_namespaces.pop()
+        if path in item_paths:
+            item_callback(path, element)
+            element.clear()
+            if elements:
+                elements[-1].remove(element)
+    return root
+
+
 def _create_entry(entry_body):
     ''' Adds common part of entry to a given entry body and return the whole
     xml. '''
@@ -419,6 +558,14 @@ def _clone_node_with_namespaces(node_to_clone, original_doc):
     return clone
 
 
+# Converters taking a serialized feed entry (as passed to
+# _convert_response_to_feeds) mapped to equivalent converters which take the
+# parsed ElementTree entry element directly.  Callbacks listed here are fed
+# straight from the streaming parser; any other string callback goes through
+# minidom so that it receives exactly the xml it always did.
+_etree_feed_converters = {}
+
+
 def _convert_response_to_feeds(response, convert_callback):
     if response is None:
         return None
@@ -432,6 +579,20 @@ def _convert_response_to_feeds(response, convert_callback):
     if x_ms_continuation:
         setattr(feeds, 'x_ms_continuation', x_ms_continuation)
 
+    if ETree is not None:
+        if inspect.isclass(convert_callback) and issubclass(convert_callback, WindowsAzureData):
+            entry_callback = convert_callback
+        else:
+            entry_callback = _etree_feed_converters.get(convert_callback)
+        if entry_callback is not None:
+            try:
+                feeds.extend(_convert_response_to_feeds_etree(response.body,
+                                                              entry_callback))
+                return feeds
+            except SyntaxError:
+                # not something ElementTree can handle, let minidom decide
+                pass
+
     xmldoc = minidom.parseString(response.body)
     xml_entries = _get_children_from_path(xmldoc, 'feed', 'entry')
     if not xml_entries:
@@ -457,6 +618,37 @@ def _convert_response_to_feeds(response, convert_callback):
     return feeds
 
 
+def _convert_response_to_feeds_etree(body, entry_callback):
+    '''Streaming counterpart of _convert_response_to_feeds.  entry_callback is
+    either a WindowsAzureData class or a converter taking an ElementTree entry
+    element.'''
+    entries = []
+
+    def convert_entry(path, xml_entry):
+        if inspect.isclass(entry_callback) and issubclass(entry_callback, WindowsAzureData):
+            return_obj = entry_callback()
+            for node in _get_etree_children_from_path(xml_entry,
+                                                      'content',
+                                                      entry_callback.__name__):
+                _fill_data_to_return_object_etree(node, return_obj)
+            for name, value in _get_entry_properties_from_etree(xml_entry,
+                                                                include_id=True,
+                                                                use_title_as_id=True).items():
+                setattr(return_obj, name, value)
+            entries.append(return_obj)
+        else:
+            entries.append(entry_callback(xml_entry))
+
+    root = _iterparse_etree(body,
+                            [('feed', 'entry')],
+                            convert_entry)
+    if root is not None and not entries and \
+        root.tag == 'entry':
+        # in some cases, response contains only entry but no feed
+        convert_entry(('entry',), root)
+    return entries
+
+
 def _validate_type_bytes(param_name, param):
     if not isinstance(param, bytes):
         raise TypeError(_ERROR_VALUE_SHOULD_BE_BYTES.format(param_name))
@@ -594,6 +786,91 @@ def _get_node_value(xmlelement, data_type):
         return data_type(value)
 
 
+def _fill_list_of_etree(element, element_type, xml_element_name):
+    xmlelements = _get_etree_child_nodes(element, xml_element_name)
+    return [_parse_response_body_from_etree_node(xmlelement, element_type) \
+        for xmlelement in xmlelements]
+
+
+def _fill_scalar_list_of_etree(element, element_type, parent_xml_element_name,
+                               xml_element_name):
+    '''ElementTree counterpart of _fill_scalar_list_of'''
+    xmlelements = _get_etree_child_nodes(element, parent_xml_element_name)
+    if xmlelements:
+        xmlelements = _get_etree_child_nodes(xmlelements[0], xml_element_name)
+        return [_get_etree_node_value(xmlelement, element_type) \
+            for xmlelement in xmlelements]
+
+
+def _fill_dict_etree(element, element_name):
+    xmlelements = _get_etree_child_nodes(element, element_name)
+    if xmlelements:
+        return_obj = {}
+        for child in xmlelements[0]:
+            if child.text is not None:
+                return_obj[_etree_local_name(child.tag)] = _etree_text(child)
+        return return_obj
+
+
+def _fill_dict_of_etree(element, parent_xml_element_name, pair_xml_element_name,
+                        key_xml_element_name, value_xml_element_name):
+    '''ElementTree counterpart of _fill_dict_of'''
+    return_obj = {}
+
+    xmlelements = _get_etree_child_nodes(element, parent_xml_element_name)
+    if xmlelements:
+        xmlelements = _get_etree_child_nodes(xmlelements[0], pair_xml_element_name)
+        for pair in xmlelements:
+            keys = _get_etree_child_nodes(pair, key_xml_element_name)
+            values = _get_etree_child_nodes(pair, value_xml_element_name)
+            if keys and values:
+                return_obj[_etree_text(keys[0])] = _etree_text(values[0])
+
+    return return_obj
+
+
+def _fill_instance_child_etree(element, element_name, return_type):
+    xmlelements = _get_etree_child_nodes(
+        element, _get_serialization_name(element_name))
+
+    if not xmlelements:
+        return None
+
+    return_obj = return_type()
+    _fill_data_to_return_object_etree(xmlelements[0], return_obj)
+
+    return return_obj
+
+
+def _fill_data_etree(element, element_name, data_member):
+    xmlelements = _get_etree_child_nodes(
+        element, _get_serialization_name(element_name))
+
+    if not xmlelements or xmlelements[0].text is None:
+        return None
+
+    value = _etree_text(xmlelements[0])
+
+    if data_member is None:
+        return value
+    elif isinstance(data_member, datetime):
+        return _to_datetime(value)
+    elif type(data_member) is bool:
+        return value.lower() != 'false'
+    else:
+        return type(data_member)(value)
+
+
+def _get_etree_node_value(xmlelement, data_type):
+    value = _etree_text(xmlelement)
+    if data_type is datetime:
+        return _to_datetime(value)
+    elif data_type is bool:
+        return value.lower() != 'false'
+    else:
+        return data_type(value)
+
+
 def _get_request_body_bytes_only(param_name, param_value):
     '''Validates the request body passed in and converts it to bytes
     if our policy allows it.'''
@@ -657,6 +934,14 @@ containers member populated with the results.
     #       </Queue>
     #   </Queues>
     # </EnumerationResults>
+    if ETree is not None:
+        try:
+            return _parse_enum_results_list_etree(response, return_type,
+                                                  resp_type, item_type)
+        except SyntaxError:
+            # not something ElementTree can handle, let minidom decide
+            pass
+
     respbody = response.body
     return_obj = return_type()
     doc = minidom.parseString(respbody)
@@ -683,6 +968,34 @@ containers member populated with the results.
     return return_obj
 
 
+def _parse_enum_results_list_etree(response, return_type, resp_type, item_type):
+    '''Streaming counterpart of _parse_enum_results_list.  Each item is
+    converted and released as soon as its closing tag has been read.'''
+    return_obj = return_type()
+    items = []
+
+    def add_item(path, element):
+        items.append(_parse_response_body_from_etree_node(element, item_type))
+
+    # path is something like EnumerationResults, Queues, Queue
+    root = _iterparse_etree(response.body,
+                            [('EnumerationResults', resp_type, resp_type[:-1])],
+                            add_item)
+
+    if root is not None and root.tag == 'EnumerationResults':
+        for name, value in vars(return_obj).items():
+            if name == resp_type.lower():
+                continue
+            value = _fill_data_etree(root, name, value)
+            if value is not None:
+                setattr(return_obj, name, value)
+    else:
+        del items[:]
+
+    setattr(return_obj, resp_type.lower(), items)
+    return return_obj
+
+
 def _parse_simple_list(response, type, item_type, list_name):
     respbody = response.body
     res = type()
@@ -763,6 +1076,56 @@ def _fill_data_to_return_object(node, return_obj):
                 setattr(return_obj, name, value)
 
 
+def _fill_data_to_return_object_etree(element, return_obj):
+    '''ElementTree counterpart of _fill_data_to_return_object'''
+    members = dict(vars(return_obj))
+    for name, value in members.items():
+        if isinstance(value, _list_of):
+            setattr(return_obj,
+                    name,
+                    _fill_list_of_etree(element,
+                                        value.list_type,
+                                        value.xml_element_name))
+        elif isinstance(value, _scalar_list_of):
+            setattr(return_obj,
+                    name,
+                    _fill_scalar_list_of_etree(element,
+                                               value.list_type,
+                                               _get_serialization_name(name),
+                                               value.xml_element_name))
+        elif isinstance(value, _dict_of):
+            setattr(return_obj,
+                    name,
+                    _fill_dict_of_etree(element,
+                                        _get_serialization_name(name),
+                                        value.pair_xml_element_name,
+                                        value.key_xml_element_name,
+                                        value.value_xml_element_name))
+        elif isinstance(value, _xml_attribute):
+            real_value = _etree_attribute(element, value.xml_element_name)
+            if real_value is not None:
+                setattr(return_obj, name, real_value)
+        elif isinstance(value, WindowsAzureData):
+            setattr(return_obj,
+                    name,
+                    _fill_instance_child_etree(element, name, value.__class__))
+        elif isinstance(value, dict):
+            setattr(return_obj,
+                    name,
+                    _fill_dict_etree(element, _get_serialization_name(name)))
+        elif isinstance(value, _Base64String):
+            value = _fill_data_etree(element, name, '')
+            if value is not None:
+                value = _decode_base64_to_text(value)
+            # always set the attribute, so we don't end up returning an object
+            # with type _Base64String
+            setattr(return_obj, name, value)
+        else:
+            value = _fill_data_etree(element, name, value)
+            if value is not None:
+                setattr(return_obj, name, value)
+
+
 def _parse_response_body_from_xml_node(node, return_type):
     '''
     parse the xml and fill all the data into a class of return_type
@@ -773,13 +1136,35 @@ def _parse_response_body_from_xml_node(node, return_type):
     return return_obj
 
 
+def _parse_response_body_from_etree_node(element, return_type):
+    '''
+    fill all the data of an ElementTree element into a class of return_type
+    '''
+    return_obj = return_type()
+    _fill_data_to_return_object_etree(element, return_obj)
+
+    return return_obj
+
+
 def _parse_response_body_from_xml_text(respbody, return_type):
     '''
     parse the xml and fill all the data into a class of return_type
     '''
+    xml_name = return_type._xml_name if hasattr(return_type, '_xml_name') else return_type.__name__
+    if ETree is not None:
+        try:
+            root = _iterparse_etree(respbody, (), None)
+        except SyntaxError:
+            # not something ElementTree can handle, let minidom decide
+            root = None
+        if root is not None:
+            return_obj = return_type()
+            if root.tag == xml_name:
+                _fill_data_to_return_object_etree(root, return_obj)
+            return return_obj
+
     doc = minidom.parseString(respbody)
     return_obj = return_type()
-    xml_name = return_type._xml_name if hasattr(return_type, '_xml_name') else return_type.__name__ 
     for node in _get_child_nodes(doc, xml_name):
         _fill_data_to_return_object(node, return_obj)
 
@@ -19,20 +19,30 @@ from datetime import datetime
 from xml.dom import minidom
 from azure import (WindowsAzureData,
                    WindowsAzureError,
+                   ETree,
                    METADATA_NS,
                    xml_escape,
                    _create_entry,
                    _decode_base64_to_text,
                    _decode_base64_to_bytes,
                    _encode_base64,
+                   _etree_attribute,
+                   _etree_feed_converters,
+                   _etree_local_name,
+                   _etree_text,
+                   _fill_data_etree,
                    _fill_data_minidom,
                    _fill_instance_element,
                    _get_child_nodes,
                    _get_child_nodesNS,
                    _get_children_from_path,
                    _get_entry_properties,
+                   _get_entry_properties_from_etree,
+                   _get_etree_children_from_path,
                    _general_error_handler,
+                   _iterparse_etree,
                    _list_of,
+                   _parse_response_body_from_etree_node,
                    _parse_response_for_dict,
                    _sign_string,
                    _unicode_type,
@@ -378,6 +388,13 @@ class Table(WindowsAzureData):
 
 
 def _parse_blob_enum_results_list(response):
+    if ETree is not None:
+        try:
+            return _parse_blob_enum_results_list_etree(response)
+        except SyntaxError:
+            # not something ElementTree can handle, let minidom decide
+            pass
+
     respbody = response.body
     return_obj = BlobEnumResults()
     doc = minidom.parseString(respbody)
@@ -402,6 +419,38 @@ def _parse_blob_enum_results_list(response):
     return return_obj
 
 
+def _parse_blob_enum_results_list_etree(response):
+    ''' Streaming counterpart of _parse_blob_enum_results_list. Blobs and
+    prefixes are converted and released one at a time, so listing a large
+    container does not hold the whole document in memory. '''
+    return_obj = BlobEnumResults()
+
+    def add_item(path, element):
+        if path[-1] == 'Blob':
+            return_obj.blobs.append(
+                _parse_response_body_from_etree_node(element, Blob))
+        else:
+            return_obj.prefixes.append(
+                _parse_response_body_from_etree_node(element, BlobPrefix))
+
+    root = _iterparse_etree(response.body,
+                            [('EnumerationResults', 'Blobs', 'Blob'),
+                             ('EnumerationResults', 'Blobs', 'BlobPrefix')],
+                            add_item)
+
+    if root is None or root.tag != 'EnumerationResults':
+        return BlobEnumResults()
+
+    for name, value in vars(return_obj).items():
+        if name == 'blobs' or name == 'prefixes':
+            continue
+        value = _fill_data_etree(root, name, value)
+        if value is not None:
+            setattr(return_obj, name, value)
+
+    return return_obj
+
+
 def _update_storage_header(request):
     ''' add additional headers for storage request. '''
     if request.body:
@@ -862,6 +911,57 @@ def _convert_xml_to_entity(xmlstr):
     return entity
 
 
+def _convert_etree_to_entity(xml_entry):
+    ''' Same as _convert_xml_to_entity, but takes the already parsed
+    ElementTree entry element. '''
+    xml_properties = None
+    for content in _get_etree_children_from_path(xml_entry, 'content'):
+        xml_properties = [child for child in content
+                          if child.tag == '{' + METADATA_NS + '}properties']
+
+    if not xml_properties:
+        return None
+
+    entity = Entity()
+    # extract each property node and get the type from attribute and node value
+    for xml_property in xml_properties[0]:
+        name = _etree_local_name(xml_property.tag)
+        # exclude the Timestamp since it is auto added by azure when
+        # inserting entity. We don't want this to mix with real properties
+        if name in ['Timestamp']:
+            continue
+
+        value = _etree_text(xml_property)
+        if value is None:
+            value = ''
+
+        isnull = _etree_attribute(xml_property, '{' + METADATA_NS + '}null', '')
+        mtype = _etree_attribute(xml_property, '{' + METADATA_NS + '}type', '')
+
+        # if not isnull and no type info, then it is a string and we just
+        # need the str type to hold the property.
+        if not isnull and not mtype:
+            _set_entity_attr(entity, name, value)
+        elif isnull == 'true':
+            if mtype:
+                property = EntityProperty(mtype, None)
+            else:
+                property = EntityProperty('Edm.String', None)
+        else:  # need an object to hold the property
+            conv = _ENTITY_TO_PYTHON_CONVERSIONS.get(mtype)
+            if conv is not None:
+                property = conv(value)
+            else:
+                property = EntityProperty(mtype, value)
+            _set_entity_attr(entity, name, property)
+
+    for name, value in _get_entry_properties_from_etree(xml_entry, True).items():
+        if name in ['etag']:
+            _set_entity_attr(entity, name, value)
+
+    return entity
+
+
 def _set_entity_attr(entity, name, value):
     try:
         setattr(entity, name, value)
@@ -884,6 +984,21 @@ def _convert_xml_to_table(xmlstr):
     return table
 
 
+def _convert_etree_to_table(xml_entry):
+    ''' Same as _convert_xml_to_table, but takes the already parsed
+    ElementTree entry element. '''
+    table = Table()
+    entity = _convert_etree_to_entity(xml_entry)
+    setattr(table, 'name', entity.TableName)
+    for name, value in _get_entry_properties_from_etree(xml_entry, False).items():
+        setattr(table, name, value)
+    return table
+
+# let table query feeds be converted straight from the streaming parser
+_etree_feed_converters[_convert_xml_to_entity] = _convert_etree_to_entity
+_etree_feed_converters[_convert_xml_to_table] = _convert_etree_to_table
+
+
 def _storage_error_handler(http_error):
     ''' Simple error handler for storage service. '''
     return _general_error_handler(http_error)
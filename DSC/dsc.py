@@ -28,10 +28,14 @@ import time
 import platform
 import json
 import datetime
+import random
 import serializerfactory
 import httpclient
 import urllib2httpclient
 import httpclientfactory
+import heartbeatclient
+import artifactcache
+import packagestate
 
 from azure.storage import BlobService
 from Utils.WAAgentUtil import waagent
@@ -42,6 +46,7 @@ import Utils.HandlerUtil as Util
 ExtensionName = 'Microsoft.OSTCExtensions.DSCForLinux'
 ExtensionShortName = 'DSCForLinux'
 DownloadDirectory = 'download'
+ArtifactCacheDirectory = 'cache'
 
 omi_package_prefix = 'packages/omi-1.1.0.ssl_'
 dsc_package_prefix = 'packages/dsc-1.1.1-294.ssl_'
@@ -56,8 +61,19 @@ dsc_release = 294
 package_pattern = '(\d+).(\d+).(\d+).(\d+)'
 nodeid_path = '/etc/opt/omi/conf/dsc/agentid'
 date_time_format = "%Y-%m-%dT%H:%M:%SZ"
+oaas_cert_path = '/etc/opt/omi/ssl/oaas.crt'
+oaas_key_path = '/etc/opt/omi/ssl/oaas.key'
+lcm_config_script = '/opt/microsoft/dsc/Scripts/GetDscLocalConfigurationManager.py'
 extension_handler_version = "2.70.0.10"
 
+# Cached for the lifetime of the process
+lcm_config = None
+heartbeat_client = None
+artifact_cache = None
+package_state = None
+vm_uuid = None
+oms_cloud_id = None
+
 # DSC-specific Operation
 class Operation:
     Download = "Download"
@@ -223,37 +239,41 @@ def enable():
         hutil.error('Failed to enable the extension with error: %s, stack trace: %s' %(str(e), traceback.format_exc()))
         hutil.do_exit(1, 'Enable', 'error', '1', 'Enable failed: {0}'.format(e))
 
+def get_lcm_config():
+    global lcm_config
+    if lcm_config is None:
+        code,output = run_cmd("python " + lcm_config_script)
+        if code != 0:
+            return code,output
+        lcm_config = output
+    return 0,lcm_config
+
+def get_heartbeat_client():
+    global heartbeat_client
+    if heartbeat_client is None:
+        heartbeat_client = heartbeatclient.HeartbeatClient(oaas_cert_path, oaas_key_path)
+    return heartbeat_client
+
 def send_heart_beat_msg_to_agent_service(status_event_type):
     response = None
     try:
-        retry_count = 0
-        canRetry = True 
-        while retry_count <= 5 and canRetry:
-            waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="In send_heart_beat_msg_to_agent_service method")
-            code,output = run_cmd("python /opt/microsoft/dsc/Scripts/GetDscLocalConfigurationManager.py")
-            if code == 0 and "RefreshMode=Pull" in output:
-                waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="sends heartbeat message in pullmode")
-                m = re.search("ServerURL=([^\n]+)", output)
-                if not m:
-                    return
-                registration_url = m.group(1)
-                agent_id = get_nodeid(nodeid_path)
-                node_extended_properties_url = registration_url + "/Nodes(AgentId='" + agent_id + "')/ExtendedProperties"
-                waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="Url is " + node_extended_properties_url)
-                headers = {'Content-Type': "application/json; charset=utf-8", 'Accept': "application/json", "ProtocolVersion" : "2.0"}
-                data = construct_node_extension_properties(output, status_event_type)
-                
-                http_client_factory = httpclientfactory.HttpClientFactory("/etc/opt/omi/ssl/oaas.crt", "/etc/opt/omi/ssl/oaas.key")
-                http_client = http_client_factory.create_http_client(sys.version_info)
-                
-                response = http_client.post(node_extended_properties_url, headers=headers, data=data)
-                waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="response code is " + str(response.status_code))
-                if response.status_code >=500 and response.status_code < 600:
-                    canRetry = True
-                    time.sleep(10)
-                else:
-                    canRetry = False
-            retry_count += 1
+        waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="In send_heart_beat_msg_to_agent_service method")
+        code,output = get_lcm_config()
+        if code == 0 and "RefreshMode=Pull" in output:
+            waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="sends heartbeat message in pullmode")
+            m = re.search("ServerURL=([^\n]+)", output)
+            if not m:
+                return
+            registration_url = m.group(1)
+            agent_id = get_nodeid(nodeid_path)
+            node_extended_properties_url = registration_url + "/Nodes(AgentId='" + agent_id + "')/ExtendedProperties"
+            waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="Url is " + node_extended_properties_url)
+            headers = {'Content-Type': "application/json; charset=utf-8", 'Accept': "application/json", "ProtocolVersion" : "2.0"}
+            data = construct_node_extension_properties(output, status_event_type)
+
+            # Retries 5xx and throttled responses with a jittered backoff
+            response = get_heartbeat_client().post(node_extended_properties_url, headers=headers, data=data)
+            waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="response code is " + str(response.status_code))
     except Exception as e:
         waagent.AddExtensionEvent(name=ExtensionShortName, op='HeartBeatInProgress', isSuccess=True, message="Failed to send heartbeat message to DSC agent service: {0}, stacktrace: {1} ".format(str(e), traceback.format_exc()))
         hutil.error('Failed to send heartbeat message to DSC agent service: %s, stack trace: %s' %(str(e), traceback.format_exc()))
@@ -361,22 +381,27 @@ def get_config(key):
             return str(value).strip()
     return ''
 
+def get_package_state():
+    global package_state
+    if package_state is None:
+        if distro_category == DistroCategory.debian:
+            package_state = packagestate.PackageState(packagestate.DEB, run_cmd)
+        else:
+            package_state = packagestate.PackageState(packagestate.RPM, run_cmd)
+    return package_state
+
 def remove_old_dsc_packages():
     waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="Deleting DSC and omi packages")
-    if distro_category == DistroCategory.debian:
-        deb_remove_incomptible_dsc_package()
-        # remove the package installed by Linux DSC 1.0, in later versions the package name is changed to 'omi'
-        deb_remove_old_oms_package('omiserver', '1.0.8.2')
-    elif distro_category == DistroCategory.redhat or distro_category == DistroCategory.suse:
-        rpm_remove_incomptible_dsc_package()
-        # remove the package installed by Linux DSC 1.0, in later versions the package name is changed to 'omi'
-        rpm_remove_old_oms_package('omiserver', '1.0.8-2')
-
-def deb_remove_incomptible_dsc_package():
-    version = deb_get_pkg_version('dsc')
+    package_names = []
+    version = get_package_state().get_version('dsc')
     if version is not None and is_incomptible_dsc_package(version):
-        deb_uninstall_package('dsc')
-            
+        package_names.append('dsc')
+    # remove the package installed by Linux DSC 1.0, in later versions the package name is changed to 'omi'
+    if get_package_state().is_installed('omiserver'):
+        package_names.append('omiserver')
+    if package_names:
+        uninstall_packages(package_names)
+
 def is_incomptible_dsc_package(package_version):
     version = re.match(package_pattern, package_version)
     #uninstall DSC package if the version is 1.0.x because upgrading from 1.0 to 1.1 is broken
@@ -384,49 +409,46 @@ def is_incomptible_dsc_package(package_version):
         return True
     return False
 
-def is_old_oms_server(package_name):
-    if package_name == 'omiserver':
-        return True
-    return False    
-            
-def deb_remove_old_oms_package(package_name, version):
-    system_pkg_version = deb_get_pkg_version(package_name)
-    if system_pkg_version is not None and is_old_oms_server(package_name):
-        deb_uninstall_package(package_name)
-
-def deb_get_pkg_version(package_name):
-    code,output = run_cmd('dpkg -s ' + package_name + ' | grep Version:')
-    if code == 0:
-        code,output = run_cmd("dpkg -s " + package_name + " | grep Version: | awk '{print $2}'")
-        if code == 0:
-            return output
-
-def rpm_remove_incomptible_dsc_package():
-    code,version = run_cmd('rpm -q --queryformat "%{VERSION}.%{RELEASE}" dsc')
-    if code == 0 and is_incomptible_dsc_package(version):
-        rpm_uninstall_package('dsc')
-            
-def rpm_remove_old_oms_package(package_name, version):
-    if rpm_check_old_oms_package(package_name, version):
-        rpm_uninstall_package(package_name)
-        
-def rpm_check_old_oms_package(package_name, version):
-    code,output = run_cmd('rpm -q ' + package_name)
-    if code == 0 and is_old_oms_server(package_name):
-        return True
-    return False
-
 def install_dsc_packages():
     openssl_version = get_openssl_version()
     omi_package_path = omi_package_prefix + openssl_version
     dsc_package_path = dsc_package_prefix + openssl_version
     waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="Installing omipackage version: " + omi_package_path + "; dsc package version: " +  dsc_package_path)
     if distro_category == DistroCategory.debian:
-        deb_install_pkg(omi_package_path + '.x64.deb', 'omi', omi_major_version, omi_minor_version, omi_build, omi_release, ' --force-confold --force-confdef --refuse-downgrade ')
-        deb_install_pkg(dsc_package_path + '.x64.deb', 'dsc', dsc_major_version, dsc_minor_version, dsc_build, dsc_release, '')
+        package_extension = '.x64.deb'
     elif distro_category == DistroCategory.redhat or distro_category == DistroCategory.suse:
-        rpm_install_pkg(omi_package_path + '.x64.rpm', 'omi', omi_major_version, omi_minor_version, omi_build, omi_release)
-        rpm_install_pkg(dsc_package_path + '.x64.rpm', 'dsc', dsc_major_version, dsc_minor_version, dsc_build, dsc_release)
+        package_extension = '.x64.rpm'
+    else:
+        return
+    packages = [(omi_package_path + package_extension, 'omi', omi_major_version, omi_minor_version, omi_build, omi_release),
+                (dsc_package_path + package_extension, 'dsc', dsc_major_version, dsc_minor_version, dsc_build, dsc_release)]
+    package_paths = get_package_paths_to_install(packages)
+    if not package_paths:
+        return
+    # omi and dsc are installed in one transaction
+    if distro_category == DistroCategory.debian:
+        cmd = 'dpkg -i --force-confold --force-confdef --refuse-downgrade ' + ' '.join(package_paths)
+    else:
+        cmd = 'rpm -Uvh ' + ' '.join(package_paths)
+    code,output = run_cmd(cmd)
+    get_package_state().invalidate()
+    if code == 0:
+        hutil.log(' '.join(package_paths) + ' installed successfully')
+    else:
+        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=False, message="Failed to install packages :" + ' '.join(package_paths))
+        raise Exception('Failed to install packages {0}: {1}'.format(' '.join(package_paths), output))
+
+def get_package_paths_to_install(packages):
+    package_paths = []
+    for package_path, package_name, major_version, minor_version, build, release in packages:
+        version = get_package_state().get_version(package_name)
+        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="package name: " + package_name + ";  existing package version:" + str(version))
+        if version is not None and compare_pkg_version(version, major_version, minor_version, build, release) == 1:
+            # package is already installed
+            hutil.log(package_name + ' version ' + version + ' is already installed')
+        else:
+            package_paths.append(package_path)
+    return package_paths
 
 def compare_pkg_version(system_package_version, major_version, minor_version, build, release):
     version = re.match(package_pattern, system_package_version)
@@ -434,42 +456,9 @@ def compare_pkg_version(system_package_version, major_version, minor_version, bu
         return 1
     return 0
 
-def rpm_check_pkg_exists(package_name, major_version, minor_version, build, release):
-    code,output = run_cmd('rpm -q --queryformat "%{VERSION}.%{RELEASE}" ' + package_name)
-    waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="package name: " + package_name + ";  existing package version:" + output)
-    hutil.log("package name: " + package_name + ";  existing package version:" + output)
-    if code == 0: 
-        return compare_pkg_version(output, major_version, minor_version, build, release)
-
-def rpm_install_pkg(package_path, package_name, major_version, minor_version, build, release):
-    if rpm_check_pkg_exists(package_name, major_version, minor_version, build, release) == 1:
-        # package is already installed
-        return
-    else:
-        code,output = run_cmd('rpm -Uvh ' + package_path)
-        if code == 0:
-            hutil.log(package_name + ' is installed successfully')
-        else:
-            waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="Failed to install RPM package :" + package_path)
-            raise Exception('Failed to install package {0}: {1}'.format(package_name, output))
-
-def deb_install_pkg(package_path, package_name, major_version, minor_version, build, release, install_options):
-    version = deb_get_pkg_version(package_name)
-    if version is not None and compare_pkg_version(version, major_version, minor_version, build, release) == 1:
-        # package is already installed
-        hutil.log(package_name + ' version ' + version + ' is already installed')
-        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="dsc package with version: " + version + "is already installed.")
-        return
-    else:
-        cmd = 'dpkg -i ' + install_options + ' ' + package_path    
-        code,output = run_cmd(cmd)
-        if code == 0:
-            hutil.log(package_name + ' version ' + str(major_version) + '.' + str(minor_version) + '.' + str(build) + '.' + str(release) + ' is installed successfully')
-        else:
-            waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=False, message="Failed to install debian package :" + package_path)
-            raise Exception('Failed to install package {0}: {1}'.format(package_name, output))
-
 def install_package(package):
+    if get_package_state().is_installed(package):
+        return
     if distro_category == DistroCategory.debian:
         apt_package_install(package)
     elif distro_category == DistroCategory.redhat:
@@ -478,31 +467,23 @@ def install_package(package):
         zypper_package_install(package)
 
 def zypper_package_install(package):
-    hutil.log('zypper --non-interactive in ' + package)
-    code,output = run_cmd('zypper --non-interactive in ' + package)
-    if code == 0:
-        hutil.log('Package ' + package + ' is installed successfully')
-    else:
-        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="Failed to install zypper package :" + package)
-        raise Exception('Failed to install package {0}: {1}'.format(package, output))
+    package_manager_install('zypper --non-interactive in ', package)
 
 def yum_package_install(package):
-    hutil.log('yum install -y ' + package)
-    code,output = run_cmd('yum install -y ' + package)
-    if code == 0:
-        hutil.log('Package ' + package + ' is installed successfully')
-    else:
-        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="Failed to install yum package :" + package)
-        raise Exception('Failed to install package {0}: {1}'.format(package, output))
+    package_manager_install('yum install -y ', package)
 
 def apt_package_install(package):
-    hutil.log('apt-get install -y --force-yes ' + package)
-    code,output = run_cmd('apt-get install -y --force-yes ' + package)
+    package_manager_install('apt-get install -y --force-yes ', package)
+
+def package_manager_install(cmd, package):
+    hutil.log(cmd + package)
+    code,output = run_cmd(cmd + package)
+    get_package_state().invalidate()
     if code == 0:
         hutil.log('Package ' + package + ' is installed successfully')
     else:
-        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="Failed to install apt package :" + package)
-        raise Exception('Failed to install package {0}: {1}'.format(package, output))    
+        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="Failed to install package with " + cmd + ":" + package)
+        raise Exception('Failed to install package {0}: {1}'.format(package, output))
 
 def get_openssl_version():
     cmd_result = waagent.RunGetOutput("openssl version")
@@ -525,9 +506,18 @@ def start_omiservice():
     else:
         raise Exception('Failed to start service omid, status : {0}'.format(output))
 
+def get_artifact_cache():
+    global artifact_cache
+    if artifact_cache is None:
+        artifact_cache = artifactcache.ArtifactCache(os.path.join(os.getcwd(), DownloadDirectory, ArtifactCacheDirectory))
+    return artifact_cache
+
+def get_retry_delay(retry):
+    # Exponential backoff with jitter, so that VMs enabled together don't retry together
+    return random.uniform(1, 2 ** (retry + 1))
+
 def download_file():
     waagent.AddExtensionEvent(name=ExtensionShortName, op="EnableInProgress", isSuccess=True, message="Downloading file")
-    download_dir = prepare_download_dir(hutil.get_seq_no())
     storage_account_name = get_config('StorageAccountName')
     storage_account_key = get_config('StorageAccountKey')
     file_uri = get_config('FileUri')
@@ -542,40 +532,50 @@ def download_file():
 
     if storage_account_name and storage_account_key:
         hutil.log('Downloading file from azure storage...')
-        path = download_azure_blob(storage_account_name, storage_account_key, file_uri, download_dir)
+        path = download_azure_blob(storage_account_name, storage_account_key, file_uri)
         return path
     else:
         hutil.log('Downloading file from external link...')
         waagent.AddExtensionEvent(name=ExtensionShortName, op="EnableInProgress", isSuccess=True, message="Downloading file from external link...")        
-        path = download_external_file(file_uri, download_dir)
+        path = download_external_file(file_uri)
         return path
 
-def download_azure_blob(account_name, account_key, file_uri, download_dir):
+def download_azure_blob(account_name, account_key, file_uri):
     waagent.AddExtensionEvent(name=ExtensionShortName, op="EnableInProgress", isSuccess=True, message="Downloading from azure blob")
     try:
         (blob_name, container_name) = parse_blob_uri(file_uri)
         host_base = get_host_base_from_uri(file_uri)
-        
-        blob_parent_path = os.path.join(download_dir, os.path.dirname(blob_name))
-        if not os.path.exists(blob_parent_path):
-            os.makedirs(blob_parent_path)
-
-        download_path = os.path.join(download_dir, blob_name)
         blob_service = BlobService(account_name, account_key, host_base=host_base)
     except Exception as e:
         waagent.AddExtensionEvent(name=ExtensionShortName, op='DownloadInProgress', isSuccess=True, message='Enable failed with the azure storage error : {0}, stack trace: {1}'.format(str(e), traceback.format_exc()))
         hutil.error('Failed to enable the extension with error: %s, stack trace: %s' %(str(e), traceback.format_exc()))
         hutil.do_exit(1, 'Enable', 'error', '1', 'Enable failed: {0}'.format(e))
     
+    cache = get_artifact_cache()
     max_retry = 3
     for retry in range(1, max_retry + 1):
         try:
-            blob_service.get_blob_to_path(container_name, blob_name, download_path)
+            properties = blob_service.get_blob_properties(container_name, blob_name)
+            etag = properties.get('etag')
+            last_modified = properties.get('last-modified')
+            if cache.is_current(file_uri, etag, last_modified):
+                hutil.log('The blob is unchanged since it was last downloaded: ' + blob_name)
+                download_path = cache.get_path(cache.lookup(file_uri))
+            else:
+                temp_path = cache.get_temp_path()
+                try:
+                    blob_service.get_blob_to_path(container_name, blob_name, temp_path)
+                except Exception:
+                    os.remove(temp_path)
+                    raise
+                download_path = cache.add_file(file_uri, temp_path, os.path.basename(blob_name), etag, last_modified)
+            break
         except Exception:
             hutil.error('Failed to download Azure blob, retry = ' + str(retry) + ', max_retry = ' + str(max_retry))
             if retry != max_retry:
-                hutil.log('Sleep 10 seconds')
-                time.sleep(10)
+                delay = get_retry_delay(retry)
+                hutil.log('Sleep %.1f seconds' % delay)
+                time.sleep(delay)
             else:
                 waagent.AddExtensionEvent(name=ExtensionShortName,
                                           op=Operation.Download,
@@ -609,22 +609,22 @@ def get_host_base_from_uri(blob_uri):
         return None
     return netloc[netloc.find('.'):]
 
-def download_external_file(file_uri, download_dir):
+def download_external_file(file_uri):
     waagent.AddExtensionEvent(name=ExtensionShortName, op="EnableInProgress", isSuccess=True, message="Downloading from external file")
     path = get_path_from_uri(file_uri)
     file_name = path.split('/')[-1]
-    file_path = os.path.join(download_dir, file_name)
     max_retry = 3
     for retry in range(1, max_retry + 1):
         try:
-            download_and_save_file(file_uri, file_path)
+            file_path = download_and_save_file(file_uri, file_name)
             waagent.AddExtensionEvent(name=ExtensionShortName, op=Operation.Download, isSuccess=True, message="(03302)Succeeded to download file from public URI")            
             return file_path
         except Exception as e:
             hutil.error('Failed to download public file, retry = ' + str(retry) + ', max_retry = ' + str(max_retry))
             if retry != max_retry:
-                hutil.log('Sleep 10 seconds')
-                time.sleep(10)
+                delay = get_retry_delay(retry)
+                hutil.log('Sleep %.1f seconds' % delay)
+                time.sleep(delay)
             else:
                 waagent.AddExtensionEvent(name=ExtensionShortName,
                                           op=Operation.Download,
@@ -632,30 +632,37 @@ def download_external_file(file_uri, download_dir):
                                           message='(03304)Failed to download file from public URI,  error : %s, stack trace: %s' %(str(e), traceback.format_exc()))
                 raise Exception('Failed to download public file: ' + file_name)
 
-def download_and_save_file(uri, file_path):
-    src = urllib2.urlopen(uri)
-    dest = open(file_path, 'wb')
-    buf_size = 1024
-    buf = src.read(buf_size)
-    while(buf):
-        dest.write(buf)
-        buf = src.read(buf_size)    
-    
-def prepare_download_dir(seq_no):
-    main_download_dir = os.path.join(os.getcwd(), DownloadDirectory)
-    if not os.path.exists(main_download_dir):
-        os.makedirs(main_download_dir)
-    cur_download_dir = os.path.join(main_download_dir, seq_no)
-    if not os.path.exists(cur_download_dir):
-        os.makedirs(cur_download_dir)
-    return cur_download_dir
+def download_and_save_file(uri, file_name):
+    """
+    Conditional GET of uri: the cached file is returned as is if the server
+    answers 304 Not Modified.
+    """
+    cache = get_artifact_cache()
+    request = urllib2.Request(uri, headers=cache.get_conditional_headers(uri))
+    try:
+        src = urllib2.urlopen(request)
+    except urllib2.HTTPError as e:
+        if e.code != 304:
+            raise
+        hutil.log('The file is unchanged since it was last downloaded: ' + uri)
+        return cache.get_path(cache.lookup(uri))
+    try:
+        return cache.add_stream(uri, src, file_name, src.info().getheader('ETag'), src.info().getheader('Last-Modified'))
+    finally:
+        src.close()
 
 def apply_dsc_configuration(config_file_path):
+    applied_output = get_artifact_cache().get_applied(Operation.ApplyMof, config_file_path)
+    if applied_output is not None:
+        waagent.AddExtensionEvent(name=ExtensionShortName, op='EnableInProgress', isSuccess=True, message='The MOF configuration is unchanged since it was last applied, skip applying it')
+        return applied_output
     cmd = '/opt/microsoft/dsc/Scripts/StartDscConfiguration.py -configurationmof ' + config_file_path
     waagent.AddExtensionEvent(name=ExtensionShortName, op='EnableInProgress', isSuccess=True, message='running the cmd: ' + cmd)    
     code,output = run_cmd(cmd)    
     if code == 0:
         code,output = run_cmd('/opt/microsoft/dsc/Scripts/GetDscConfiguration.py')
+        if check_dsc_configuration(output):
+            get_artifact_cache().set_applied(Operation.ApplyMof, config_file_path, output)
         return output
     else:
         error_msg = 'Failed to apply MOF configuration: {0}'.format(output)
@@ -664,11 +671,22 @@ def apply_dsc_configuration(config_file_path):
         raise Exception(error_msg)
 
 def apply_dsc_meta_configuration(config_file_path):
+    global lcm_config
+    applied_output = get_artifact_cache().get_applied(Operation.ApplyMetaMof, config_file_path)
+    if applied_output is not None:
+        waagent.AddExtensionEvent(name=ExtensionShortName, op='EnableInProgress', isSuccess=True, message='The meta MOF configuration is unchanged since it was last applied, skip applying it')
+        lcm_config = applied_output
+        return applied_output
     cmd = '/opt/microsoft/dsc/Scripts/SetDscLocalConfigurationManager.py -configurationmof ' + config_file_path
     waagent.AddExtensionEvent(name=ExtensionShortName, op='EnableInProgress', isSuccess=True, message='running the cmd: ' + cmd)
     code,output = run_cmd(cmd)
     if code == 0:
-        code,output = run_cmd('/opt/microsoft/dsc/Scripts/GetDscLocalConfigurationManager.py')
+        lcm_config = None
+        code,output = run_cmd(lcm_config_script)
+        if code == 0:
+            lcm_config = output
+        if check_dsc_configuration(output):
+            get_artifact_cache().set_applied(Operation.ApplyMetaMof, config_file_path, output)
         return output
     else:
         error_msg = 'Failed to apply Meta MOF configuration: {0}'.format(output)
@@ -757,18 +775,20 @@ def get_nodeid(file_path):
     return id
 
 def get_vmuuid():
-    UUID = None
-    code, output = run_cmd("sudo dmidecode | grep UUID | sed -e 's/UUID: //'")
-    if code == 0:
-        UUID = output.strip()
-    return UUID
+    global vm_uuid
+    if vm_uuid is None:
+        code, output = run_cmd("sudo dmidecode | grep UUID | sed -e 's/UUID: //'")
+        if code == 0:
+            vm_uuid = output.strip()
+    return vm_uuid
 
 def get_omscloudid():
-    OMSCLOUD_ID = None
-    code, output = run_cmd("sudo dmidecode | grep 'Tag: 77' | sed -e 's/Asset Tag: //'")
-    if code == 0:
-        OMSCLOUD_ID = output.strip()
-    return OMSCLOUD_ID
+    global oms_cloud_id
+    if oms_cloud_id is None:
+        code, output = run_cmd("sudo dmidecode | grep 'Tag: 77' | sed -e 's/Asset Tag: //'")
+        if code == 0:
+            oms_cloud_id = output.strip()
+    return oms_cloud_id
 
 def check_dsc_configuration(current_config):
     outputlist = re.split("\n", current_config)
@@ -778,6 +798,9 @@ def check_dsc_configuration(current_config):
     return False
 
 def install_module(file_path):
+    if get_artifact_cache().get_applied(Operation.InstallModule, file_path) is not None:
+        waagent.AddExtensionEvent(name=ExtensionShortName, op="InstallModuleInProgress", isSuccess=True, message="The module package is unchanged since it was last installed, skip installing it")
+        return
     install_package('unzip')
     cmd = '/opt/microsoft/dsc/Scripts/InstallModule.py ' + file_path
     code,output = run_cmd(cmd)
@@ -797,6 +820,7 @@ def install_module(file_path):
                               op=Operation.InstallModule,
                               isSuccess=True,
                               message="(03101)Succeeded to install DSC Module")
+    get_artifact_cache().set_applied(Operation.InstallModule, file_path, '')
 
 def remove_module():
     module_name = get_config('ResourceName')
@@ -818,33 +842,26 @@ def remove_module():
                               op=Operation.RemoveModule,
                               isSuccess=True,
                               message="(03103)Succeeded to remove DSC Module")
+    get_artifact_cache().clear_applied(Operation.InstallModule)
 
-def uninstall_package(package_name):
-    waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="uninstalling the package" + package_name)
+def uninstall_packages(package_names):
+    waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="uninstalling the packages " + ' '.join(package_names))
     if distro_category == DistroCategory.debian:
-        deb_uninstall_package(package_name)
+        cmd = 'dpkg -P ' + ' '.join(package_names)
     elif distro_category == DistroCategory.redhat or distro_category == DistroCategory.suse:
-        rpm_uninstall_package(package_name)
-
-def deb_uninstall_package(package_name):
-    cmd = 'dpkg -P ' + package_name
-    code,output = run_cmd(cmd)
-    if code == 0:
-        hutil.log('Package ' + package_name + ' was removed successfully')
+        cmd = 'rpm -e ' + ' '.join(package_names)
     else:
-        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="failed to remove the package" + package_name)
-        raise Exception('Failed to remove package ' + package_name)
-
-def rpm_uninstall_package(package_name):
-    cmd = 'rpm -e ' + package_name
+        return
     code,output = run_cmd(cmd)
+    get_package_state().invalidate()
     if code == 0:
-        hutil.log('Package ' + package_name + ' was removed successfully')
+        hutil.log('Packages ' + ' '.join(package_names) + ' were removed successfully')
     else:
-        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="failed to remove the package" + package_name)
-        raise Exception('Failed to remove package ' + package_name)
+        waagent.AddExtensionEvent(name=ExtensionShortName, op='InstallInProgress', isSuccess=True, message="failed to remove the packages " + ' '.join(package_names))
+        raise Exception('Failed to remove packages ' + ' '.join(package_names))
 
 def register_automation(registration_key, registation_url, node_configuration_name, refresh_freq, configuration_mode_freq, configuration_mode):
+    global lcm_config
     if (registration_key == '' or registation_url == ''):
         err_msg = "Either the Registration Key or Registration URL is NOT provided"
         hutil.error(err_msg)
@@ -871,6 +888,9 @@ def register_automation(registration_key, registation_url, node_configuration_na
                                   isSuccess=True,
                                   message="Registration URL " + registation_url + "Optional parameters to Registration" + optional_parameters)
     code,output = run_cmd(cmd + optional_parameters)
+    # Registration rewrites the LCM configuration
+    lcm_config = None
+    get_artifact_cache().clear_applied(Operation.ApplyMetaMof)
     if not code == 0:
         error_msg = '(03109)Failed to register with Azure Automation DSC: {0}'.format(output)
         hutil.error(error_msg)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python2
+#
+# Copyright (C) Microsoft Corporation, All rights reserved.
+
+"""Heartbeat client for the DSC pull server."""
+
+import httplib
+import random
+import socket
+import sys
+import time
+import urlparse
+
+import httpclientfactory
+from httpclient import *
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+# Status codes after which the request is retried
+THROTTLED_STATUS_CODE = 429
+SERVER_ERROR_STATUS_CODES = range(500, 600)
+
+RETRY_AFTER_HEADER_KEY = "retry-after"
+
+
+class HeartbeatClient:
+    """Sends requests to the pull server over one persistent mutual-TLS connection.
+
+    The connection is opened in-process with the client certificate loaded once, and reused until the server
+    closes it or the host changes. Throttled (429) and failed (5xx) requests are retried with exponential backoff
+    and full jitter, honoring Retry-After, so that nodes restarted together don't retry together.
+
+    Without ssl.SSLContext (python < 2.7.9) there is no strict certificate verification in-process and the client
+    falls back to the HttpClient of HttpClientFactory for every attempt.
+    """
+
+    def __init__(self, cert_path, key_path, timeout=30, max_retry_count=5, base_delay=2, max_delay=60):
+        self.cert_path = cert_path
+        self.key_path = key_path
+        self.timeout = timeout
+        self.max_retry_count = max_retry_count
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.connection = None
+        self.connection_key = None
+        self.ssl_context = None
+        self.fallback_client = None
+        self.json = serializerfactory.get_serializer(sys.version_info)
+
+    @staticmethod
+    def has_ssl_context():
+        return ssl is not None and hasattr(ssl, "SSLContext")
+
+    def get_ssl_context(self):
+        if self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+            self.ssl_context.load_cert_chain(self.cert_path, self.key_path)
+        return self.ssl_context
+
+    def get_connection(self, scheme, host):
+        """Returns the open connection to host, or opens a new one.
+
+        Args:
+            scheme  : string, http or https.
+            host    : string, the host and optional port.
+
+        Returns:
+            An httplib connection
+        """
+        key = (scheme, host)
+        if self.connection is not None and self.connection_key == key:
+            return self.connection
+        self.close()
+        if scheme == "https":
+            self.connection = httplib.HTTPSConnection(host, timeout=self.timeout, context=self.get_ssl_context())
+        else:
+            self.connection = httplib.HTTPConnection(host, timeout=self.timeout)
+        self.connection_key = key
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self.connection_key = None
+
+    def get_backoff_delay(self, attempt, retry_after=None):
+        """Returns the seconds to wait before the attempt following attempt (0 based).
+
+        Args:
+            attempt     : int   , the number of the failed attempt.
+            retry_after : string, the Retry-After header of the response, if any.
+
+        Returns:
+            A random delay between 0 and base_delay * 2^attempt capped at max_delay, or the Retry-After delay plus
+            up to base_delay of jitter.
+        """
+        if retry_after is not None:
+            try:
+                return min(self.max_delay, int(retry_after)) + random.uniform(0, self.base_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def send(self, method, url, headers, body):
+        """Issues one request over the persistent connection.
+
+        Returns:
+            A (RequestResponse, retry_after) tuple
+        """
+        parsed = urlparse.urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        connection = self.get_connection(parsed.scheme, parsed.netloc)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            # The response must be read entirely before the connection can be reused
+            data = response.read()
+        except (httplib.HTTPException, socket.error):
+            self.close()
+            raise
+        if response.getheader("connection", "").lower() == "close":
+            self.close()
+        return RequestResponse(response.status, data), response.getheader(RETRY_AFTER_HEADER_KEY)
+
+    def send_fallback(self, method, url, headers, data):
+        if self.fallback_client is None:
+            factory = httpclientfactory.HttpClientFactory(self.cert_path, self.key_path)
+            self.fallback_client = factory.create_http_client(sys.version_info)
+        if method == HttpClient.POST:
+            return self.fallback_client.post(url, headers=headers, data=data), None
+        return self.fallback_client.get(url, headers=headers), None
+
+    def post(self, url, headers=None, data=None):
+        """Issues a POST request to the provided url, retrying throttled and failed requests.
+
+        Args:
+            url     : string    , the url.
+            headers : dictionary, contains the headers key value pair.
+            data    : dictionary, contains the non-serialized request body.
+
+        Returns:
+            A RequestResponse, the one of the last attempt
+        """
+        return self.issue_request(HttpClient.POST, url, headers, data)
+
+    def issue_request(self, method, url, headers, data):
+        request_headers = {HttpClient.ACCEPT_HEADER_KEY: HttpClient.APP_JSON_HEADER_VALUE,
+                           HttpClient.CONNECTION_HEADER_KEY: HttpClient.KEEP_ALIVE_HEADER_VALUE}
+        if headers is not None:
+            request_headers.update(headers)
+        body = None
+        if data is not None:
+            body = self.json.dumps(data)
+            if HttpClient.CONTENT_TYPE_HEADER_KEY not in request_headers:
+                request_headers[HttpClient.CONTENT_TYPE_HEADER_KEY] = HttpClient.APP_JSON_HEADER_VALUE
+
+        response = None
+        for attempt in range(0, self.max_retry_count + 1):
+            retry_after = None
+            try:
+                if self.has_ssl_context():
+                    response, retry_after = self.send(method, url, request_headers, body)
+                else:
+                    response, retry_after = self.send_fallback(method, url, request_headers, data)
+            except (httplib.HTTPException, socket.error):
+                if attempt >= self.max_retry_count:
+                    raise
+            else:
+                if response.status_code != THROTTLED_STATUS_CODE and \
+                        response.status_code not in SERVER_ERROR_STATUS_CODES:
+                    return response
+            if attempt < self.max_retry_count:
+                time.sleep(self.get_backoff_delay(attempt, retry_after))
+        return response
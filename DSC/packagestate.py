@@ -0,0 +1,75 @@
+#!/usr/bin/env python2
+#
+# Copyright (C) Microsoft Corporation, All rights reserved.
+
+"""Installed package database, read once per run."""
+
+DPKG_STATUS_FILE = "/var/lib/dpkg/status"
+RPM_QUERY_ALL_CMD = 'rpm -qa --queryformat "%{NAME}\\t%{VERSION}.%{RELEASE}\\n"'
+
+DEB = "deb"
+RPM = "rpm"
+
+
+class PackageState:
+    """Maps the name of every installed package to its version.
+
+    The dpkg status file is parsed in-process; for rpm, a single rpm -qa lists all the packages. The state is read
+    on first use and must be invalidated after packages are installed or removed.
+
+    Versions are formatted as dpkg -s and rpm -q --queryformat "%{VERSION}.%{RELEASE}" print them, so they can be
+    compared with compare_pkg_version.
+    """
+
+    def __init__(self, package_format, run_cmd, dpkg_status_file=DPKG_STATUS_FILE):
+        self.package_format = package_format
+        self.run_cmd = run_cmd
+        self.dpkg_status_file = dpkg_status_file
+        self.packages = None
+
+    def load(self):
+        if self.packages is None:
+            if self.package_format == DEB:
+                self.packages = self.read_dpkg_status()
+            else:
+                self.packages = self.query_rpm()
+        return self.packages
+
+    def invalidate(self):
+        self.packages = None
+
+    def get_version(self, package_name):
+        """Returns the installed version of package_name, or None if it is not installed."""
+        return self.load().get(package_name)
+
+    def is_installed(self, package_name):
+        return package_name in self.load()
+
+    def read_dpkg_status(self):
+        packages = {}
+        try:
+            with open(self.dpkg_status_file) as f:
+                content = f.read()
+        except IOError:
+            return packages
+        for stanza in content.split("\n\n"):
+            fields = {}
+            for line in stanza.split("\n"):
+                # Continuation lines of multi-line fields start with a space
+                if line and not line[0].isspace() and ":" in line:
+                    key, value = line.split(":", 1)
+                    fields[key] = value.strip()
+            if "Package" in fields and "Version" in fields and fields.get("Status", "").endswith(" installed"):
+                packages[fields["Package"]] = fields["Version"]
+        return packages
+
+    def query_rpm(self):
+        packages = {}
+        code, output = self.run_cmd(RPM_QUERY_ALL_CMD)
+        if code != 0:
+            return packages
+        for line in output.split("\n"):
+            fields = line.split("\t")
+            if len(fields) == 2:
+                packages[fields[0]] = fields[1]
+        return packages
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# DSC Extension For Linux
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import env
+import dsc
+import os
+import shutil
+import tempfile
+import threading
+import BaseHTTPServer
+import artifactcache
+from Utils.WAAgentUtil import waagent
+from MockUtil import MockUtil
+
+waagent.LoggerInit('/tmp/test.log','/dev/null')
+
+class FileServerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        etag = '"%d"' % self.server.version
+        if self.headers.getheader('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = 'instance of MSFT_nxFile { version = %d; };' % self.server.version
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestArtifactCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        dsc.hutil = MockUtil(self)
+        dsc.artifact_cache = artifactcache.ArtifactCache(self.cache_dir)
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), FileServerHandler)
+        self.server.version = 1
+        self.server.requests = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.uri = 'http://127.0.0.1:%d/config/localhost.mof' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_conditional_download(self):
+        path = dsc.download_external_file(self.uri)
+        self.assertEqual('localhost.mof', os.path.basename(path))
+        self.assertTrue('version = 1' in open(path).read())
+
+        # Unchanged: the server answers 304 and the cached file is reused
+        self.assertEqual(path, dsc.download_external_file(self.uri))
+        self.assertEqual(2, self.server.requests)
+
+        # Changed: the new content replaces the old one
+        self.server.version = 2
+        new_path = dsc.download_external_file(self.uri)
+        self.assertNotEqual(path, new_path)
+        self.assertTrue('version = 2' in open(new_path).read())
+        self.assertFalse(os.path.exists(path))
+
+    def test_applied(self):
+        cache = dsc.artifact_cache
+        path = dsc.download_external_file(self.uri)
+        self.assertEqual(None, cache.get_applied(dsc.Operation.ApplyMof, path))
+        cache.set_applied(dsc.Operation.ApplyMof, path, 'ReturnValue=0')
+
+        # The record survives a new process
+        cache = artifactcache.ArtifactCache(self.cache_dir)
+        self.assertEqual('ReturnValue=0', cache.get_applied(dsc.Operation.ApplyMof, path))
+        self.assertEqual(None, cache.get_applied(dsc.Operation.ApplyMetaMof, path))
+
+        self.server.version = 2
+        dsc.artifact_cache = cache
+        new_path = dsc.download_external_file(self.uri)
+        self.assertEqual(None, cache.get_applied(dsc.Operation.ApplyMof, new_path))
+
+        cache.clear_applied(dsc.Operation.ApplyMof)
+        self.assertEqual({}, artifactcache.ArtifactCache(self.cache_dir).load()["applied"])
+
+if __name__ == '__main__':
+    unittest.main()
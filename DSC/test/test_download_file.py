@@ -28,7 +28,7 @@ waagent.LoggerInit('/tmp/test.log','/dev/null')
 class TestDownloadFile(unittest.TestCase):
     def test_download_file(self):
         dsc.hutil = MockUtil(self)	
-        dsc.download_external_file('https://raw.githubusercontent.com/balukambala/azure-linux-extensions/master/DSC/test/mof/dscnode.nxFile.meta.mof', '/tmp')
+        dsc.download_external_file('https://raw.githubusercontent.com/balukambala/azure-linux-extensions/master/DSC/test/mof/dscnode.nxFile.meta.mof')
         
 if __name__ == '__main__':
     unittest.main()
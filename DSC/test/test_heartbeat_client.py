@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# DSC Extension For Linux
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import env
+import threading
+import BaseHTTPServer
+import heartbeatclient
+
+
+class PullServerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('content-length', 0)))
+        self.server.clients.add(self.client_address)
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = '{"status": %d}' % status
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHeartbeatClient(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), PullServerHandler)
+        self.server.statuses = []
+        self.server.requests = 0
+        self.server.clients = set()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/Nodes(AgentId=\'1\')/ExtendedProperties' % self.server.server_port
+        self.client = heartbeatclient.HeartbeatClient(None, None, base_delay=0.01, max_delay=0.05)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_with_persistent_connection(self):
+        self.server.statuses = [503, 429, 200]
+        response = self.client.post(self.url, data={"ExtensionStatusEvent": "install"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(200, response.deserialized_data["status"])
+        self.assertEqual(3, self.server.requests)
+        self.assertEqual(1, len(self.server.clients))
+
+    def test_give_up_after_max_retry_count(self):
+        self.server.statuses = [500] * 10
+        response = self.client.post(self.url, data={})
+        self.assertEqual(500, response.status_code)
+        self.assertEqual(self.client.max_retry_count + 1, self.server.requests)
+
+    def test_backoff_delay(self):
+        for attempt in range(0, 10):
+            self.assertTrue(0 <= self.client.get_backoff_delay(attempt) <= self.client.max_delay)
+        client = heartbeatclient.HeartbeatClient(None, None)
+        self.assertTrue(client.get_backoff_delay(0, '10') >= 10)
+        self.assertTrue(client.get_backoff_delay(0, '3600') <= client.max_delay + client.base_delay)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# DSC Extension For Linux
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import env
+import dsc
+import os
+import tempfile
+import packagestate
+from Utils.WAAgentUtil import waagent
+from MockUtil import MockUtil
+
+waagent.LoggerInit('/tmp/test.log','/dev/null')
+
+DpkgStatus = """Package: omi
+Status: install ok installed
+Version: 1.1.0.0
+Description: Open Management Infrastructure
+ continuation line: not a field
+
+Package: dsc
+Status: deinstall ok config-files
+Version: 1.0.0.254
+
+Package: unzip
+Status: install ok installed
+Priority: optional
+Version: 6.0-20ubuntu1
+"""
+
+RpmQueryAll = "omi\t1.1.0.0\ndsc\t1.0.0.254\n"
+
+class TestPackageState(unittest.TestCase):
+    def setUp(self):
+        fd, self.status_file = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write(DpkgStatus)
+        self.commands = []
+
+    def tearDown(self):
+        os.remove(self.status_file)
+
+    def run_cmd(self, cmd):
+        self.commands.append(cmd)
+        return 0, RpmQueryAll
+
+    def test_dpkg_status(self):
+        state = packagestate.PackageState(packagestate.DEB, self.run_cmd, self.status_file)
+        self.assertEqual('1.1.0.0', state.get_version('omi'))
+        self.assertEqual('6.0-20ubuntu1', state.get_version('unzip'))
+        self.assertFalse(state.is_installed('dsc'))
+        self.assertEqual([], self.commands)
+
+    def test_rpm_query_once(self):
+        state = packagestate.PackageState(packagestate.RPM, self.run_cmd)
+        self.assertEqual('1.1.0.0', state.get_version('omi'))
+        self.assertEqual('1.0.0.254', state.get_version('dsc'))
+        self.assertFalse(state.is_installed('unzip'))
+        self.assertEqual(1, len(self.commands))
+        state.invalidate()
+        state.is_installed('omi')
+        self.assertEqual(2, len(self.commands))
+
+    def test_packages_to_install(self):
+        dsc.hutil = MockUtil(self)
+        dsc.package_state = packagestate.PackageState(packagestate.RPM, self.run_cmd)
+        packages = [('omi.rpm', 'omi', 1, 1, 0, 0), ('dsc.rpm', 'dsc', 1, 1, 1, 294)]
+        self.assertEqual(['dsc.rpm'], dsc.get_package_paths_to_install(packages))
+        self.assertTrue(dsc.is_incomptible_dsc_package(dsc.package_state.get_version('dsc')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+# Load generator for the dynamic JSON ingest protocol of a locally running mdsd,
+# the protocol out_mdsd of fluentd/omsagent speaks over the <prefix>_djson.socket
+# Unix socket. Sends events as fast as the window of unacked events allows and
+# prints the events per second and the mdsd CPU time per event.
+#
+# The source given with --source must be used in the mdsd configuration,
+# otherwise every event is acked with ACK_INVALID_SOURCE.
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+SCHEMA_ID = 1
+SCHEMA = [3, ["Message", "FT_STRING"], ["Count", "FT_INT64"], ["Value", "FT_DOUBLE"], ["Time", "FT_TIME"]]
+
+
+def ParseCmdLine():
+    parser = argparse.ArgumentParser(sys.argv[0])
+    parser.add_argument("-s", "--socket", type=str, required=True,
+                        help="path of the mdsd dynamic JSON socket, e.g. /var/run/mdsd/default_djson.socket")
+    parser.add_argument("-p", "--pid", type=int, required=False,
+                        help="mdsd pid, read from the <prefix>.pidport file next to the socket when omitted")
+    parser.add_argument("-n", "--events", type=int, default=200000, help="number of events to send")
+    parser.add_argument("-w", "--window", type=int, default=1000, help="maximum number of unacked events")
+    parser.add_argument("--source", type=str, default="bench", help="source name of the events")
+    parser.add_argument("--size", type=int, default=200, help="length of the message field of each event")
+    return parser.parse_args()
+
+
+def GetMdsdPid(args):
+    if args.pid:
+        return args.pid
+    suffix = "_djson.socket"
+    if args.socket.endswith(suffix):
+        pidport = args.socket[:-len(suffix)] + ".pidport"
+        if os.path.exists(pidport):
+            with open(pidport) as f:
+                return int(f.readline().strip())
+    return None
+
+
+def GetCpuSeconds(pid):
+    """Returns the user plus system CPU time of all the threads of pid."""
+    with open("/proc/%d/stat" % pid) as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime are the 14th and 15th fields, the 2nd (comm) was split off above
+    return float(int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def FormatEvent(args, msg_id, payload):
+    schema = SCHEMA if msg_id == 1 else None
+    now = time.time()
+    data = [payload, msg_id, msg_id * 0.5, [int(now), int((now % 1) * 1e9)]]
+    msg = json.dumps([args.source, msg_id, SCHEMA_ID, schema, data], separators=(",", ":"))
+    return ("%d\n%s" % (len(msg), msg)).encode("utf-8")
+
+
+def SendEvents(args, sock, window):
+    payload = "x" * args.size
+    pending = []
+    for msg_id in range(1, args.events + 1):
+        if not window.acquire(False):
+            # the window is full; what is pending must reach mdsd before its acks can open it
+            if pending:
+                sock.sendall(b"".join(pending))
+                pending = []
+            window.acquire()
+        pending.append(FormatEvent(args, msg_id, payload))
+        # write what accumulated while the window was open, like a batching client would
+        if len(pending) >= 64 or msg_id == args.events:
+            sock.sendall(b"".join(pending))
+            pending = []
+
+
+def Main():
+    args = ParseCmdLine()
+    pid = GetMdsdPid(args)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(args.socket)
+
+    window = threading.Semaphore(args.window)
+    sender = threading.Thread(target=SendEvents, args=(args, sock, window))
+    sender.daemon = True
+
+    cpu_before = GetCpuSeconds(pid) if pid else None
+    start = time.time()
+    sender.start()
+
+    acked = 0
+    errors = {}
+    partial = b""
+    while acked < args.events:
+        data = sock.recv(65536)
+        if not data:
+            print("mdsd closed the connection after %d acks" % acked)
+            return 1
+        lines = (partial + data).split(b"\n")
+        partial = lines.pop()
+        for line in lines:
+            code = int(line.split(b":")[1])
+            if code != 0:
+                errors[code] = errors.get(code, 0) + 1
+            acked += 1
+            window.release()
+
+    elapsed = time.time() - start
+    sock.close()
+
+    print("events: %d in %.3f s, %.0f events/s" % (acked, elapsed, acked / elapsed))
+    if cpu_before is not None:
+        cpu = GetCpuSeconds(pid) - cpu_before
+        print("mdsd cpu: %.3f s, %.2f us/event" % (cpu, cpu * 1e6 / acked))
+    else:
+        print("mdsd cpu: unknown, pass --pid")
+    for code in sorted(errors):
+        print("ack code %d: %d events" % (code, errors[code]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -2,6 +2,9 @@
 // Licensed under the MIT license.
 
 #include <sstream>
+#include <algorithm>
+#include <cstring>
+#include <cstdio>
 #include "ProtocolHandlerJSON.hh"
 
 #include "Logger.hh"
@@ -25,22 +28,14 @@ ProtocolHandlerJSON::~ProtocolHandlerJSON()
 void ProtocolHandlerJSON::Run()
 {
     Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::Run");
-    msg_data_t msg_data;
     while(true)
     {
         try
         {
-            mdsdinput::Ack ack;
-
-            // Read message
-            size_t msg_size = readMsgSize();
-            readMsgData(msg_data, msg_size);
-
-            // Process message
-            ack = handleMsg(msg_data);
-
-            // Ack message
-            writeAck(ack.msgId, ack.code);
+            // Read as much as is available, then handle and ack every complete message read
+            fillReadBuffer();
+            handleBufferedMsgs();
+            writeAcks();
         }
         catch (mdsdinput::eof_exception)
         {
@@ -60,14 +55,21 @@ void ProtocolHandlerJSON::Run()
     }
 }
 
-size_t ProtocolHandlerJSON::readMsgSize()
+void ProtocolHandlerJSON::fillReadBuffer()
 {
-    Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::readMsgSize");
-    char sbuf[8];
-    size_t sidx = 0;
+    Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::fillReadBuffer");
+
+    // Move the partial message left by the last read to the front, so that it can be completed in place
+    if (_read_start > 0)
+    {
+        memmove(&_read_buffer[0], &_read_buffer[_read_start], _read_end - _read_start);
+        _read_end -= _read_start;
+        _read_start = 0;
+    }
 
-    do {
-        ssize_t n = read(_fd, &sbuf[sidx], 1);
+    while (true)
+    {
+        ssize_t n = read(_fd, &_read_buffer[_read_end], READ_BUFFER_SIZE - _read_end);
         if (n < 0)
         {
             if (errno != EINTR)
@@ -81,83 +83,102 @@ size_t ProtocolHandlerJSON::readMsgSize()
         }
         else
         {
-            if (sbuf[sidx] == '\n')
-            {
-                break;
-            }
-            sidx++;
+            _read_end += n;
+            return;
         }
-    } while (sidx < sizeof(sbuf));
+    }
+}
+
+void ProtocolHandlerJSON::handleBufferedMsgs()
+{
+    Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::handleBufferedMsgs");
+
+    size_t prefix_length;
+    size_t size;
+    try
+    {
+        while (parseMsgSize(prefix_length, size) && _read_end - _read_start >= prefix_length + size)
+        {
+            char* msg_data = &_read_buffer[_read_start + prefix_length];
+            _read_start += prefix_length + size;
+
+            // The message is parsed in place; the byte after it belongs to the next message
+            char next = msg_data[size];
+            msg_data[size] = 0;
+            auto ack = handleMsg(msg_data, size);
+            msg_data[size] = next;
 
-    if (sidx == sizeof(sbuf))
+            addAck(ack.msgId, ack.code);
+        }
+    }
+    catch (...)
     {
-        throw mdsdinput::msg_too_large_error("ProtocolHandlerJSON: Message size string is too long");
+        // Ack the messages handled before the connection is dropped, so that they are not resent
+        writeAcks();
+        throw;
     }
+}
+
+bool ProtocolHandlerJSON::parseMsgSize(size_t& prefix_length, size_t& size)
+{
+    const char* start = &_read_buffer[_read_start];
+    size_t available = std::min(_read_end - _read_start, MAX_MSG_SIZE_LENGTH);
+    const char* end = static_cast<const char*>(memchr(start, '\n', available));
 
-    sbuf[sidx] = 0;
+    if (end == nullptr)
+    {
+        if (available == MAX_MSG_SIZE_LENGTH)
+        {
+            throw mdsdinput::msg_too_large_error("ProtocolHandlerJSON: Message size string is too long");
+        }
+        return false;
+    }
 
-    size_t size = std::stoul(sbuf);
+    size = std::stoul(std::string(start, end));
     if (size == 0 || size > MAX_MSG_DATA_SIZE)
     {
         throw std::runtime_error("Invalid message size");
     }
+    prefix_length = end - start + 1;
 
-    return size;
+    return true;
 }
 
-void ProtocolHandlerJSON::readMsgData(msg_data_t& msg_data, size_t size)
+void ProtocolHandlerJSON::addAck(uint64_t msgId, mdsdinput::ResponseCode rcode)
 {
-    Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::readMsgData");
-
-    char* ptr = &msg_data[0];
-    size_t idx = 0;
-    do {
-        ssize_t n = read(_fd, ptr, size - idx);
-        if (n < 0)
-        {
-            if (errno != EINTR)
-            {
-                throw std::system_error(errno, std::system_category());
-            }
-        }
-        else if (n == 0)
-        {
-            throw mdsdinput::eof_exception();
-        }
-        else
-        {
-            idx += n;
-            ptr += n;
-        }
-    } while (idx < size);
-    msg_data[size] = 0;
+    char ack[48];
+    int n = snprintf(ack, sizeof(ack), "%llu:%d\n", static_cast<unsigned long long>(msgId), static_cast<int>(rcode));
+    _acks.append(ack, n);
 }
 
-void ProtocolHandlerJSON::writeAck(uint64_t msgId, mdsdinput::ResponseCode rcode)
+void ProtocolHandlerJSON::writeAcks()
 {
-    Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::writeAck");
+    Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::writeAcks");
+
+    if (_acks.empty())
+    {
+        return;
+    }
 
-    std::ostringstream out;
-    out << msgId << ":" << rcode << std::endl;
-    auto str = out.str();
-    ssize_t n = write(_fd, str.c_str(), str.size());
+    ssize_t n = write(_fd, _acks.data(), _acks.size());
     if (n < 0)
     {
         throw std::system_error(errno, std::system_category());
     }
-    else if (n < static_cast<ssize_t>(str.size()))
+    else if (n < static_cast<ssize_t>(_acks.size()))
     {
         throw mdsdinput::eof_exception();
     }
+    _acks.clear();
 }
 
-mdsdinput::Ack ProtocolHandlerJSON::decodeMsg(msg_data_t& msg_data, std::string& source, CanonicalEntity& ce)
+mdsdinput::Ack ProtocolHandlerJSON::decodeMsg(char* msg_data, std::string& source, CanonicalEntity& ce)
 {
     Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::decodeMsg");
 
     mdsdinput::Ack ack;
     rapidjson::Document d;
-    d.ParseInsitu(&msg_data[0]);
+    d.ParseInsitu(msg_data);
 
     ack.code = mdsdinput::ACK_DECODE_ERROR;
 
@@ -370,7 +391,7 @@ mdsdinput::Ack ProtocolHandlerJSON::decodeMsg(msg_data_t& msg_data, std::string&
 
 
 mdsdinput::Ack
-ProtocolHandlerJSON::handleMsg(msg_data_t& msg_data)
+ProtocolHandlerJSON::handleMsg(char* msg_data, size_t size)
 {
     Trace trace(Trace::EventIngest, "ProtocolHandlerJSON::handleMsg");
 
@@ -388,9 +409,7 @@ ProtocolHandlerJSON::handleMsg(msg_data_t& msg_data)
     {
         std::ostringstream strm;
         strm << "ProtocolHandlerJSON: Error decoding message '";
-        for(auto c: msg_data) {
-            strm << c;
-        }
+        strm.write(msg_data, size);
         strm << "' from fd " << _fd << ": " << ex.what();
 
         Logger::LogWarn(strm);
@@ -25,10 +25,14 @@ class ProtocolHandlerJSON: public ProtocolHandlerBase
 {
 public:
     static constexpr size_t MAX_MSG_DATA_SIZE = 128 * 1024-1;
-    typedef std::array<char, MAX_MSG_DATA_SIZE+1> msg_data_t;
+    // Longest message size prefix, including its terminating '\n'
+    static constexpr size_t MAX_MSG_SIZE_LENGTH = 8;
+    // Large enough for a whole message of the maximum size and its prefix
+    static constexpr size_t READ_BUFFER_SIZE = 256 * 1024;
 
     explicit ProtocolHandlerJSON(int fd)
-        : _fd(fd), _schema_cache(std::make_shared<mdsdinput::SchemaCache>())
+        : _fd(fd), _schema_cache(std::make_shared<mdsdinput::SchemaCache>()),
+          _read_start(0), _read_end(0)
     {}
 
     ~ProtocolHandlerJSON();
@@ -36,17 +40,28 @@ public:
     void Run();
 
 private:
-    size_t readMsgSize();
-    void readMsgData(msg_data_t& msg_data, size_t size);
+    void fillReadBuffer();
+    void handleBufferedMsgs();
+    bool parseMsgSize(size_t& prefix_length, size_t& size);
 
-    void writeAck(uint64_t msgId, mdsdinput::ResponseCode rcode);
+    void addAck(uint64_t msgId, mdsdinput::ResponseCode rcode);
+    void writeAcks();
 
-    mdsdinput::Ack decodeMsg(msg_data_t& msg_data, std::string& source, CanonicalEntity& ce);
+    mdsdinput::Ack decodeMsg(char* msg_data, std::string& source, CanonicalEntity& ce);
 
-    mdsdinput::Ack handleMsg(msg_data_t& msg_data);
+    mdsdinput::Ack handleMsg(char* msg_data, size_t size);
 
     int _fd;
     std::shared_ptr<mdsdinput::SchemaCache> _schema_cache;
+
+    // Bytes read from _fd; [_read_start, _read_end) is not parsed yet.
+    // The extra byte lets a message that ends the buffer be NUL terminated.
+    std::array<char, READ_BUFFER_SIZE+1> _read_buffer;
+    size_t _read_start;
+    size_t _read_end;
+
+    // Acks of the messages handled since the last write
+    std::string _acks;
 };
 
 // vim: set ai sw=8:
@@ -10,3 +10,6 @@ int XTableConstants::_sdkRetryPolicyInterval = 3;
 int XTableConstants::_sdkRetryPolicyLimit = 5;
 int XTableConstants::_initialOpTimeout = 30;
 int XTableConstants::_defaultOpTimeout = 30;
+
+unsigned long XTableConstants::_maxPendingBytes = 16000000;
+unsigned int XTableConstants::_maxConcurrentRequests = 16;
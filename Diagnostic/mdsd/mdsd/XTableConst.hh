@@ -21,6 +21,10 @@ public:
 	static int DefaultOpTimeout()       { return _defaultOpTimeout; }
 
 	static unsigned int MaxItemPerBatch() { return 100; }	// Not alterable
+	static unsigned long MaxBytesPerBatch() { return 4000000; }	// XStore limit is 4MiB; not alterable
+
+	static unsigned long MaxPendingBytes()      { return _maxPendingBytes; }
+	static unsigned int MaxConcurrentRequests() { return _maxConcurrentRequests; }
 
 
     // Setters
@@ -32,6 +36,9 @@ public:
 	static void SetInitialOpTimeout(int val) { _initialOpTimeout = val; }
 	static void SetDefaultOpTimeout(int val) { _defaultOpTimeout = val; }
 
+	static void SetMaxPendingBytes(unsigned long val) { _maxPendingBytes = val; }
+	static void SetMaxConcurrentRequests(unsigned int val) { _maxConcurrentRequests = val; }
+
 private:
 	XTableConstants();
 	XTableConstants(const XTableConstants&) = delete;
@@ -43,6 +50,9 @@ private:
 	static int _sdkRetryPolicyLimit;
 	static int _initialOpTimeout;
 	static int _defaultOpTimeout;
+
+	static unsigned long _maxPendingBytes;
+	static unsigned int _maxConcurrentRequests;
 };
 
 #endif // _XTABLECONST_HH_
@@ -10,8 +10,12 @@
 #include <algorithm>
 #include <sstream>
 
+std::mutex XTableRequest::_slotMutex;
+unsigned int XTableRequest::_inFlight = 0;
+std::deque<std::shared_ptr<XTableRequest>> XTableRequest::_waiting;
+
 XTableRequest::XTableRequest(const std::string& connStr, const std::string& tablename)
-	: _tablename(tablename), _rowCount(0)
+	: _tablename(tablename), _rowCount(0), _holdsSlot(false)
 {
 	Trace trace(Trace::XTable, "XTR Constructor");
 
@@ -31,6 +35,15 @@ XTableRequest::XTableRequest(const std::string& connStr, const std::string& tabl
 	_useUpsert = (tablename == "SchemasTable"); // Ugh - such a hack
 }
 
+// The request is done, successfully or not, when the last continuation holding it lets go.
+// That's the point at which its in-flight slot can go to the next waiting request.
+XTableRequest::~XTableRequest()
+{
+	if (_holdsSlot) {
+		ReleaseSlot();
+	}
+}
+
 bool
 XTableRequest::AddRow(const azure::storage::table_entity & row)
 {
@@ -62,9 +75,69 @@ XTableRequest::Send(std::unique_ptr<XTableRequest> req)
 		trace.NOTE("Shortcut completion: zero row count");
 		return;
 	}
+	CountRowsPerRequest(req->_rowCount);
 
 	// Need to convert the unique_ptr to shared_ptr for lambda capture inside
-	XTableRequest::DoWork(std::shared_ptr<XTableRequest>(req.release()), boost::system::error_code());
+	std::shared_ptr<XTableRequest> shared(req.release());
+	{
+		std::lock_guard<std::mutex> lock(_slotMutex);
+		if (_inFlight >= XTableConstants::MaxConcurrentRequests()) {
+			trace.NOTE("Too many requests in flight; queueing");
+			MdsdMetrics::Count("XTable_sendQueued");
+			_waiting.push_back(std::move(shared));
+			return;
+		}
+		_inFlight++;
+		shared->_holdsSlot = true;
+	}
+
+	XTableRequest::DoWork(shared, boost::system::error_code());
+}
+
+// Hand the slot of a completed request to the oldest waiting request, if there is one.
+/*static*/ void
+XTableRequest::ReleaseSlot()
+{
+	Trace trace(Trace::XTable, "XTR::ReleaseSlot");
+	std::shared_ptr<XTableRequest> next;
+	{
+		std::lock_guard<std::mutex> lock(_slotMutex);
+		if (_waiting.empty()) {
+			_inFlight--;
+			return;
+		}
+		next = std::move(_waiting.front());
+		_waiting.pop_front();
+		next->_holdsSlot = true;
+	}
+
+	try {
+		XTableRequest::DoWork(next, boost::system::error_code());
+	}
+	catch (std::exception & e) {
+		MdsdMetrics::Count("XTable_failedGeneralException");
+		Logger::LogError(std::string("XTR::ReleaseSlot() caught exception starting queued request: ") + e.what());
+	}
+	catch (...) {
+		MdsdMetrics::Count("XTable_failedUnknownException");
+		Logger::LogError("XTR::ReleaseSlot() caught unknown exception starting queued request.");
+	}
+}
+
+// Entities per batch request, bucketed. XTable_rowsSent / XTable_send gives the average;
+// these show whether that average comes from full batches or from a stream of tiny ones.
+/*static*/ void
+XTableRequest::CountRowsPerRequest(size_t rowCount)
+{
+	if (rowCount >= XTableConstants::MaxItemPerBatch()) {
+		MdsdMetrics::Count("XTable_sendRows100");
+	} else if (rowCount >= 10) {
+		MdsdMetrics::Count("XTable_sendRows10to99");
+	} else if (rowCount >= 2) {
+		MdsdMetrics::Count("XTable_sendRows2to9");
+	} else {
+		MdsdMetrics::Count("XTable_sendRows1");
+	}
 }
 
 /*static*/ void
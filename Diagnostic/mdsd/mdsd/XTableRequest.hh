@@ -8,6 +8,8 @@
 #include <vector>
 #include <cstdlib>
 #include <memory>
+#include <deque>
+#include <mutex>
 #include <was/storage_account.h>
 #include <was/table.h>
 #include <boost/system/error_code.hpp>
@@ -16,6 +18,7 @@ class XTableRequest
 {
 public:
 	XTableRequest(const std::string& connStr, const std::string& tablename);
+	~XTableRequest();
 
 	bool AddRow(const azure::storage::table_entity &row);
 	static void Send(std::unique_ptr<XTableRequest> req);
@@ -30,7 +33,15 @@ private:
 
 	size_t _rowCount;
 	bool _useUpsert;
+	bool _holdsSlot;	// True while this request counts against MaxConcurrentRequests
 
+	// Requests sent while MaxConcurrentRequests are in flight wait here for a slot
+	static std::mutex _slotMutex;
+	static unsigned int _inFlight;
+	static std::deque<std::shared_ptr<XTableRequest>> _waiting;
+
+	static void ReleaseSlot();
+	static void CountRowsPerRequest(size_t rowCount);
 	static void DoWork(std::shared_ptr<XTableRequest> req, const boost::system::error_code&);
 	static void DoContinuation(std::shared_ptr<XTableRequest> req, pplx::task<std::vector<azure::storage::table_result> > t);
 };
@@ -15,6 +15,7 @@
 #include "Trace.hh"
 #include "MdsdMetrics.hh"
 #include "XTableRequest.hh"
+#include "XTableConst.hh"
 #include "StoreType.hh"
 
 #include "stdafx.h"
@@ -44,7 +45,7 @@ XTableSink::XTableSink(MdsdConfig* config, const MdsEntityName &target, const Cr
 		unsigned long long N = MdsdUtil::EasyHash(_identColumnString) % (unsigned long long)(_config->PartitionCount());
 		_N = MdsdUtil::ZeroFill(N, 19);
 	}
-	_estimatedBytes = 0;
+	_pendingBytes = 0;
 }
 
 void
@@ -68,8 +69,30 @@ XTableSink::~XTableSink()
 	Trace trace(Trace::XTable, "XTS::Destructor");
 }
 
-// Convert the CanonicalEntity to a table_entity and add it to our internal request. Flush
-// the request if it fills up.
+// Give a pending batch a fresh request. Returns false if the request couldn't be created.
+bool
+XTableSink::StartRequest(PendingBatch& batch)
+{
+	Trace trace(Trace::XTable, "XTS::StartRequest");
+
+	try {
+		ComputeConnString();
+		batch.request.reset(new XTableRequest(_connString, _fullTableName));
+	}
+	catch (std::exception &ex) {
+		std::ostringstream msg;
+
+		msg << "Exception (" << ex.what() << ") caught while creating new XTableRequest; dropping row";
+		trace.NOTE(msg.str());
+		Logger::LogError(msg.str());
+		return false;
+	}
+	return true;
+}
+
+// Convert the CanonicalEntity to a table_entity and add it to the pending batch for its
+// partition. Flush that batch if it fills up, and flush the biggest batch if the rows
+// pending across all partitions grow past the budget.
 //
 // Note that AddRow() doesn't keep the CanonicalEntity; we copy anything we need from it.
 void
@@ -77,33 +100,10 @@ XTableSink::AddRow(const CanonicalEntity &row, const MdsTime& qibase)
 {
 	Trace trace(Trace::XTable, "XTS::AddRow");
 
-	// If this row is for a different partition, flush what we have and track the new partition
-	if (row.PartitionKey() != _pkey) {
-		Flush();
-		_pkey = row.PartitionKey();
-	}
-
-	// If we have no in-progress request, either because we just flushed or because we're just
-	// starting up, make one.
-	if (! _request) {
-		try {
-			ComputeConnString();
-			_request.reset(new XTableRequest(_connString, _fullTableName));
-		}
-		catch (std::exception &ex) {
-			std::ostringstream msg;
-
-			msg << "Exception (" << ex.what() << ") caught while creating new XTableRequest; dropping row";
-			trace.NOTE(msg.str());
-			Logger::LogError(msg.str());
-			MdsdMetrics::Count("Dropped_Entities");
-			return;
-		}
-	}
-
-	azure::storage::table_entity e { _pkey, row.RowKey() };
+	string pkey = row.PartitionKey();
+	azure::storage::table_entity e { pkey, row.RowKey() };
 	azure::storage::table_entity::properties_type& properties = e.properties();
-	size_t byteCount = 2 * (_pkey.length() + row.RowKey().length()) + 4;
+	size_t byteCount = 2 * (pkey.length() + row.RowKey().length()) + 4;
 	bool oversize = false;
 
 	for (const auto & col : row) {
@@ -158,60 +158,103 @@ XTableSink::AddRow(const CanonicalEntity &row, const MdsTime& qibase)
 		return;
 	}
 
-	if ((_estimatedBytes + byteCount) > 4000000) {
+	auto it = _pending.find(pkey);
+	if (it != _pending.end() && (it->second.estimatedBytes + byteCount) > XTableConstants::MaxBytesPerBatch()) {
 		trace.NOTE("Batch would be too big; flushing before adding this entity");
-		Flush();
-		try {
-			ComputeConnString();
-			_request.reset(new XTableRequest(_connString, _fullTableName));
-		}
-		catch (std::exception & ex) {
-			std::ostringstream msg;
+		MdsdMetrics::Count("XTable_flushBytes");
+		FlushPartition(it);
+		it = _pending.end();
+	}
+	if (it == _pending.end()) {
+		it = _pending.emplace(pkey, PendingBatch()).first;
+	}
 
-			msg << "Exception (" << ex.what() << ") caught while creating new XTableRequest; dropping row";
-			trace.NOTE(msg.str());
-			Logger::LogError(msg.str());
-			MdsdMetrics::Count("Dropped_Entities");
-			return;
-		}
+	// If this partition has no in-progress request, either because we just flushed it or
+	// because it's new, make one.
+	PendingBatch& batch = it->second;
+	if (!batch.request && !StartRequest(batch)) {
+		_pending.erase(it);
+		MdsdMetrics::Count("Dropped_Entities");
+		return;
 	}
-	_request->AddRow(e);
-	_estimatedBytes += byteCount;
+	batch.request->AddRow(e);
+	batch.estimatedBytes += byteCount;
+	_pendingBytes += byteCount;
 
 	if (trace.IsActive()) {
 		std::ostringstream msg;
-		msg << "We have " << _request->Size() << " rows";
+		msg << "We have " << batch.request->Size() << " rows for partition " << pkey
+			<< ", " << _pending.size() << " partitions pending";
 		trace.NOTE(msg.str());
 	}
-	if (_request->Size() == 100) {
-		Flush();
+	if (batch.request->Size() == XTableConstants::MaxItemPerBatch()) {
+		MdsdMetrics::Count("XTable_flushFull");
+		FlushPartition(it);
+	}
+	else if (_pendingBytes > XTableConstants::MaxPendingBytes()) {
+		trace.NOTE("Too much data pending across partitions; flushing the largest batch");
+		MdsdMetrics::Count("XTable_flushPendingBytes");
+		FlushLargestPartition();
 	}
 }
 
-// Flush any data we're holding. We might never have allocated a request, or it might
-// be empty, or we might have data.
-// Post-condition: _request is nullptr. Next call to AddRow() will create a new request on demand.
+// Send the pending batch for one partition and forget the partition. Send() is fire-and-forget;
+// the request object is responsible for deleting itself after that point.
 void
-XTableSink::Flush()
+XTableSink::FlushPartition(pending_map_t::iterator it)
 {
-	Trace trace(Trace::XTable, "XTS::Flush");
+	Trace trace(Trace::XTable, "XTS::FlushPartition");
 
-	if (!_request) {
-		// First time through. Just make the post-condition true
-		trace.NOTE("Null _request; no action.");
+	PendingBatch& batch = it->second;
+	if (batch.request && batch.request->Size() > 0) {
+		trace.NOTE("Writing partition " + it->first + " to " + _fullTableName + " with connection string " + _connString);
+		XTableRequest::Send(std::move(batch.request));
 	} else {
-		if (_request->Size() > 0) {
-			// Detach the request and send it. Send() is fire-and-forget; the request object
-			// is responsible for deleting itself after that point.
-			trace.NOTE("Writing to " + _fullTableName + " with connection string " + _connString);
-			XTableRequest::Send(std::move(_request));
-		} else {
-			// Since we create these on demand, this really shouldn't happen.
-			trace.NOTE("Empty _request; no action (deleting).");
+		// Since we create these on demand, this really shouldn't happen.
+		trace.NOTE("Empty request; no action (deleting).");
+	}
+	_pendingBytes -= batch.estimatedBytes;
+	_pending.erase(it);
+}
+
+void
+XTableSink::FlushLargestPartition()
+{
+	auto largest = _pending.begin();
+	for (auto it = _pending.begin(); it != _pending.end(); ++it) {
+		if (it->second.estimatedBytes > largest->second.estimatedBytes) {
+			largest = it;
 		}
-		_request.reset();
-		_estimatedBytes = 0;
 	}
+	if (largest != _pending.end()) {
+		FlushPartition(largest);
+	}
+}
+
+// Flush any data we're holding, for every partition. Called by the Batch at the end of its
+// interval and when the query interval base changes.
+// Post-condition: _pending is empty. Next call to AddRow() will create requests on demand.
+void
+XTableSink::Flush()
+{
+	Trace trace(Trace::XTable, "XTS::Flush");
+
+	if (_pending.empty()) {
+		trace.NOTE("No pending rows; no action.");
+		return;
+	}
+
+	if (trace.IsActive()) {
+		std::ostringstream msg;
+		msg << "Flushing " << _pending.size() << " partitions, " << _pendingBytes << " estimated bytes";
+		trace.NOTE(msg.str());
+	}
+	MdsdMetrics::Count("XTable_flushInterval");
+	MdsdMetrics::Count("XTable_flushPartitions", _pending.size());
+	while (!_pending.empty()) {
+		FlushPartition(_pending.begin());
+	}
+	_pendingBytes = 0;
 }
 
 // vim: se sw=8 :
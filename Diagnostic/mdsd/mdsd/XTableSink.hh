@@ -9,6 +9,7 @@
 #include <vector>
 #include <string>
 #include <memory>
+#include <map>
 #include "stdafx.h"
 #include "IdentityColumns.hh"
 #include "MdsTime.hh"
@@ -35,6 +36,21 @@ private:
 	XTableSink();
 	void ComputeConnString();
 
+	// Rows waiting to be sent to one partition. A table batch must stay within a single
+	// partition, so rows for interleaved partitions accumulate side by side.
+	struct PendingBatch
+	{
+		std::unique_ptr<XTableRequest> request;
+		unsigned long estimatedBytes;
+
+		PendingBatch() : estimatedBytes(0) {}
+	};
+	typedef std::map<std::string, PendingBatch> pending_map_t;
+
+	bool StartRequest(PendingBatch& batch);
+	void FlushPartition(pending_map_t::iterator it);
+	void FlushLargestPartition();
+
 	MdsdConfig* _config;
 	MdsEntityName _target;
 	const Credentials* _creds;
@@ -43,7 +59,6 @@ private:
 	std::string _identColumnString;
 
 	MdsTime _QIBase;
-	std::string _pkey;
 	std::string _TIMESTAMP;
 	std::string _N;
 
@@ -51,8 +66,8 @@ private:
 	std::string _fullTableName;
 	MdsTime _rebuildTime;
 
-	std::unique_ptr<XTableRequest> _request;
-	unsigned long _estimatedBytes;
+	pending_map_t _pending;
+	unsigned long _pendingBytes;	// Sum of estimatedBytes over all of _pending
 };
 
 #endif // _XTABLESINK_HH_
@@ -20,6 +20,7 @@ import os
 import sys
 import re
 import json
+import glob
 import random
 import shutil
 import time
@@ -29,6 +30,9 @@ import logging.handlers
 
 from Utils.WAAgentUtil import waagent
 from ConfigOptions import ConfigOptions
+import RestartAnalysis
+from UpdateDiscovery import UpdateDiscovery
+from ResourceGovernor import ResourceGovernor
 
 mfile = os.path.join(os.getcwd(), 'HandlerManifest.json')
 with open(mfile,'r') as f:
@@ -99,6 +103,14 @@ class AbstractPatching(object):
         self.gap_between_stage = 60
         self.current_configs = dict()
 
+        # Maximum number of packages handed to the package manager at once
+        self.max_transaction_size = 50
+
+        # Load-aware throttling
+        self.governor = ResourceGovernor(self.log_and_syslog)
+        # How long to wait for a busy VM to become idle with pauseWhenBusy
+        self.idle_wait_duration = 900
+
         self.category_required = ConfigOptions.category["required"]
         self.category_all = ConfigOptions.category["all"]
 
@@ -119,11 +131,19 @@ class AbstractPatching(object):
         self.dist_upgrade_all = False
         self.dist_upgrade_all_key = 'distUpgradeAll'
 
+        # Update Discovery
+        # Files whose mtime changes when the repository metadata or the
+        # installed packages change
+        self.metadata_paths = []
+        self.update_discovery = UpdateDiscovery(self, os.path.join(self.cwd, 'updates.cache'))
+
         # Reboot Requirements
         self.reboot_required = False
-        self.open_deleted_files_before = list()
-        self.open_deleted_files_after = list()
+        self.open_deleted_files_before = dict()
+        self.open_deleted_files_after = dict()
         self.needs_restart = list()
+        self.needs_restart_processes = list()
+        self.needs_restart_services = list()
 
     def is_string_none_or_empty(self, str):
         if str is None or len(str) < 1:
@@ -228,6 +248,9 @@ class AbstractPatching(object):
             hr_min = download_duration.split(':')
             self.download_duration = int(hr_min[0]) * 3600 + int(hr_min[1]) * 60
 
+        # The parameter "resourceGovernor" is not exposed to users either.
+        self.governor.configure(settings.get('resourceGovernor'))
+
         oneoff = settings.get('oneoff')
         if oneoff is None or str(oneoff).lower() not in ConfigOptions.oneoff:
             msg = "The value of parameter \"oneoff\" is empty or invalid. Set it False by default."
@@ -406,26 +429,29 @@ class AbstractPatching(object):
         if self.exists_stop_flag():
             self.log_and_syslog(logging.INFO, "Downloading patches is stopped/canceled")
             return
+        self.governor.throttle()
 
         waagent.SetFileContents(self.package_downloaded_path, '')
         waagent.SetFileContents(self.package_patched_path, '')
 
         start_download_time = time.time()
         # Installing security patches is mandatory
-        self._download(self.category_required)
-        if self.category == self.category_all:
-            self._download(self.category_all)
-        self.retry_download()
+        self.update_discovery.timed("download(" + self.category_required + ")", self._download, self.category_required)
+        if self.category == self.category_all and not self.governor.should_skip(self.category_all, self.category_required):
+            self.update_discovery.timed("download(" + self.category_all + ")", self._download, self.category_all)
+        self.update_discovery.timed("retry", self.retry_download)
         end_download_time = time.time()
+        timings = self.update_discovery.format_timings()
+        self.log_and_syslog(logging.INFO, "Download phases: " + timings)
         waagent.AddExtensionEvent(name=self.hutil.get_name(),
                                   op=waagent.WALAEventOperation.Download,
                                   isSuccess=True,
                                   version=Version,
-                                  message=" ".join(["Real downloading time is", str(round(end_download_time-start_download_time,3)), "s"]))
+                                  message=" ".join(["Real downloading time is", str(round(end_download_time-start_download_time,3)), "s", timings]))
 
     def _download(self, category):
         self.log_and_syslog(logging.INFO, "Start to check&download patches (Category:" + category + ")")
-        retcode, downloadlist = self.check(category)
+        retcode, downloadlist = self.update_discovery.get_updates(category)
         if retcode > 0:
             msg = "Failed to check valid upgrades"
             self.log_and_syslog(logging.ERROR, msg)
@@ -437,53 +463,173 @@ class AbstractPatching(object):
             return
         self.log_and_syslog(logging.INFO, "There are " + str(len(downloadlist)) + " packages to upgrade.")
         self.log_and_syslog(logging.INFO, "Download list: " + ' '.join(downloadlist))
-        for pkg_name in downloadlist:
-            if pkg_name in self.downloaded:
-                continue
-            retcode = self.download_package(pkg_name)
-            if retcode != 0:
-                self.log_and_syslog(logging.ERROR, "Failed to download the package: " + pkg_name)
-                self.log_and_syslog(logging.INFO, "Put {0} into a retry queue".format(pkg_name))
-                self.download_retry_queue.append((pkg_name, category))
-                continue
+        already_downloaded = set(self.downloaded)
+        downloadlist = [pkg_name for pkg_name in downloadlist if pkg_name not in already_downloaded]
+
+        def downloaded(pkg_name):
             self.downloaded.append(pkg_name)
             self.log_and_syslog(logging.INFO, "Package " + pkg_name + " is downloaded.")
             waagent.AppendFileContents(self.package_downloaded_path, pkg_name + ' ' + category + '\n')
 
+        def failed(pkg_name):
+            self.log_and_syslog(logging.ERROR, "Failed to download the package: " + pkg_name)
+            self.log_and_syslog(logging.INFO, "Put {0} into a retry queue".format(pkg_name))
+            self.download_retry_queue.append((pkg_name, category))
+
+        self.run_transactions(downloadlist, self.download_packages, downloaded, failed)
+
     def retry_download(self):
         retry_count = 0
         max_retry_count = 12
         self.log_and_syslog(logging.INFO, "Retry queue: {0}".format(
             " ".join([pkg_name for pkg_name,category in self.download_retry_queue])))
         while self.download_retry_queue:
-            pkg_name, category = self.download_retry_queue[0]
-            self.download_retry_queue = self.download_retry_queue[1:]
-            retcode = self.download_package(pkg_name)
-            if retcode == 0:
+            # The whole queue is retried at once, backing off between rounds
+            retry_queue = self.download_retry_queue
+            self.download_retry_queue = []
+            categories = dict(retry_queue)
+
+            def downloaded(pkg_name):
                 self.downloaded.append(pkg_name)
                 self.log_and_syslog(logging.INFO, "Package " + pkg_name + " is downloaded.")
-                waagent.AppendFileContents(self.package_downloaded_path, pkg_name + ' ' + category + '\n')
-            else:
+                waagent.AppendFileContents(self.package_downloaded_path, pkg_name + ' ' + categories[pkg_name] + '\n')
+
+            def failed(pkg_name):
                 self.log_and_syslog(logging.ERROR, "Failed to download the package: " + pkg_name)
                 self.log_and_syslog(logging.INFO, "Put {0} back into a retry queue".format(pkg_name))
-                self.download_retry_queue.append((pkg_name,category))
-                retry_count = retry_count + 1
-                if retry_count > max_retry_count:
-                    err_msg = ("Failed to download after {0} retries, "
-                        "retry queue: {1}").format(max_retry_count,
-                        " ".join([pkg_name for pkg_name,category in self.download_retry_queue]))
-                    self.log_and_syslog(logging.ERROR, err_msg)
-                    waagent.AddExtensionEvent(name=self.hutil.get_name(),
-                                              op=waagent.WALAEventOperation.Download,
-                                              isSuccess=False,
-                                              version=Version,
-                                              message=err_msg)
-                    break
-                k = retry_count if (retry_count < 10) else 10
-                interval = int(random.uniform(0, 2 ** k))
-                self.log_and_syslog(logging.INFO, ("Sleep {0}s before "
-                    "the next retry, current retry_count = {1}").format(interval, retry_count))
-                time.sleep(interval)
+                self.download_retry_queue.append((pkg_name, categories[pkg_name]))
+
+            self.run_transactions([pkg_name for pkg_name,category in retry_queue],
+                                  self.download_packages, downloaded, failed)
+            if not self.download_retry_queue:
+                break
+            retry_count = retry_count + 1
+            if retry_count > max_retry_count:
+                err_msg = ("Failed to download after {0} retries, "
+                    "retry queue: {1}").format(max_retry_count,
+                    " ".join([pkg_name for pkg_name,category in self.download_retry_queue]))
+                self.log_and_syslog(logging.ERROR, err_msg)
+                waagent.AddExtensionEvent(name=self.hutil.get_name(),
+                                          op=waagent.WALAEventOperation.Download,
+                                          isSuccess=False,
+                                          version=Version,
+                                          message=err_msg)
+                break
+            k = retry_count if (retry_count < 10) else 10
+            interval = int(random.uniform(0, 2 ** k))
+            self.log_and_syslog(logging.INFO, ("Sleep {0}s before "
+                "the next retry, current retry_count = {1}").format(interval, retry_count))
+            time.sleep(interval)
+
+    def download_packages(self, packages):
+        """
+        Download the packages in a single package manager transaction.
+        Return 0 if all of them are downloaded.
+        Distros without a batched command download one package at a time.
+        """
+        for package in packages:
+            if self.download_package(package) != 0:
+                return 1
+        return 0
+
+    def patch_packages(self, packages):
+        """
+        Install the packages in a single package manager transaction.
+        Return 0 if all of them are installed.
+        Distros without a batched command install one package at a time.
+        """
+        for package in packages:
+            if self.patch_package(package) != 0:
+                return 1
+        return 0
+
+    def run_transactions(self, packages, transaction, on_success, on_failure, deadline=None):
+        """
+        Apply transaction (download_packages or patch_packages) to packages
+        in as few package manager invocations as possible, at most
+        max_transaction_size packages at a time, so that repository
+        metadata is loaded and dependencies are resolved once per batch
+        instead of once per package.
+        A failed transaction is split in halves until the failing packages
+        are isolated. on_success/on_failure are called for every package.
+        If deadline is given, no transaction is started after it, and a
+        batch is shrunk to what the time measured so far says will fit.
+        Return the packages left pending because the deadline was reached.
+        """
+        size = max(1, self.max_transaction_size)
+        queue = [packages[i:i + size] for i in range(0, len(packages), size)]
+        spent_time = 0.0
+        done_count = 0
+        while queue:
+            batch = queue.pop(0)
+            # Give way to the applications while the VM is busy (pauseWhenBusy)
+            self.governor.wait_for_idle(deadline)
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return batch + [pkg for pending in queue for pkg in pending]
+                if done_count > 0 and len(batch) > 1:
+                    fit = max(1, int(remaining / (spent_time / done_count)))
+                    if fit < len(batch):
+                        queue.insert(0, batch[fit:])
+                        batch = batch[:fit]
+            start_time = time.time()
+            retcode = transaction(batch)
+            if retcode == 0:
+                spent_time += time.time() - start_time
+                done_count += len(batch)
+                for pkg_name in batch:
+                    on_success(pkg_name)
+            elif len(batch) == 1:
+                on_failure(batch[0])
+            else:
+                half = len(batch) // 2
+                self.log_and_syslog(logging.WARNING, "Transaction of {0} packages failed, "
+                    "splitting it to find the failing packages".format(len(batch)))
+                queue[0:0] = [batch[:half], batch[half:]]
+        return []
+
+    def discover_updates(self):
+        """
+        Return (retcode, dict of category -> package list) for all the
+        categories. Distros which can classify the updates from a single
+        package manager query override it; this one checks each category.
+        """
+        updates = dict()
+        for category in (self.category_required, self.category_all):
+            retcode, updates[category] = self.check(category)
+            if retcode > 0:
+                return retcode, updates
+        return 0, updates
+
+    def get_metadata_timestamp(self):
+        """
+        Return the latest mtime of the files in metadata_paths, or None if
+        there is none.
+        """
+        timestamp = None
+        for pattern in self.metadata_paths:
+            for path in glob.glob(pattern):
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if timestamp is None or mtime > timestamp:
+                    timestamp = mtime
+        return timestamp
+
+    def get_discovery_key(self):
+        """
+        The discovered updates are reusable while this key stays the same.
+        Return None to disable caching.
+        """
+        timestamp = self.get_metadata_timestamp()
+        if timestamp is None:
+            return None
+        if not self.is_string_none_or_empty(self.dist_upgrade_list) and os.path.isfile(self.dist_upgrade_list):
+            timestamp = max(timestamp, os.path.getmtime(self.dist_upgrade_list))
+        return [timestamp, ",".join([self.dist_upgrade_all_key + "=" + str(self.dist_upgrade_all),
+                                     self.dist_upgrade_list_key + "=" + str(self.dist_upgrade_list)])]
 
     def patch(self):
         # Read the latest configuration for scheduled task
@@ -497,6 +643,7 @@ class AbstractPatching(object):
             self.log_and_syslog(logging.INFO, "Installing patches is stopped/canceled")
             self.delete_stop_flag()
             return
+        self.governor.throttle()
 
         # Record the scheduled time
         waagent.AppendFileContents(self.history_scheduled, time.strftime("%Y-%m-%d %a", time.localtime()) + '\n' )
@@ -518,17 +665,19 @@ class AbstractPatching(object):
         pkg_failed = []
         is_time_out = [False, False]
         patchlist = self.get_pkg_to_patch(self.category_required)
-        is_time_out[0],failed = self._patch(self.category_required, patchlist)
+        is_time_out[0],failed = self.update_discovery.timed("patch(" + self.category_required + ")",
+                                                            self._patch, self.category_required, patchlist)
         pkg_failed.extend(failed)
         if not self.exists_stop_flag():
-            if not is_time_out[0]:
+            if not is_time_out[0] and not self.governor.should_skip(self.category_all, self.category_required):
                 patchlist = self.get_pkg_to_patch(self.category_all)
                 if len(patchlist) == 0:
                     self.log_and_syslog(logging.INFO, "No packages are available for update. (Category:" + self.category_all + ")")
                 else:
                     self.log_and_syslog(logging.INFO, "Going to sleep for " + str(self.gap_between_stage) + "s")
                     time.sleep(self.gap_between_stage)
-                    is_time_out[1],failed = self._patch(self.category_all, patchlist)
+                    is_time_out[1],failed = self.update_discovery.timed("patch(" + self.category_all + ")",
+                                                                        self._patch, self.category_all, patchlist)
                     pkg_failed.extend(failed)
         else:
             msg = "Installing patches (Category:" + self.category_all + ") is stopped/canceled"
@@ -544,6 +693,9 @@ class AbstractPatching(object):
 
         self.open_deleted_files_after = self.check_open_deleted_files()
         self.delete_stop_flag()
+        # The installed packages changed, so nothing discovered so far is current
+        self.update_discovery.invalidate()
+        self.log_and_syslog(logging.INFO, "Patch phases: " + self.update_discovery.format_timings())
         #self.report()
         if StatusTest["Scheduled"]["Healthy"]:
             is_healthy = StatusTest["Scheduled"]["Healthy"]()
@@ -567,22 +719,23 @@ class AbstractPatching(object):
         self.log_and_syslog(logging.INFO, "Start to install " + str(len(patchlist)) +" patches (Category:" + category + ")")
         self.log_and_syslog(logging.INFO, "Patch list: " + ' '.join(patchlist))
         pkg_failed = []
-        for pkg_name in patchlist:
-            if pkg_name == 'walinuxagent':
-                continue
-            current_patch_time = time.time()
-            if current_patch_time - start_patch_time > self.install_duration:
-                msg = "Patching time exceeded. The pending package will be patched in the next cycle"
-                self.log_and_syslog(logging.WARNING, msg)
-                return True,pkg_failed
-            retcode = self.patch_package(pkg_name)
-            if retcode != 0:
-                self.log_and_syslog(logging.ERROR, "Failed to patch the package:" + pkg_name)
-                pkg_failed.append(' '.join([pkg_name, category]))
-                continue
+
+        def patched(pkg_name):
             self.patched.append(pkg_name)
             self.log_and_syslog(logging.INFO, "Package " + pkg_name + " is patched.")
             waagent.AppendFileContents(self.package_patched_path, pkg_name + ' ' + category + '\n')
+
+        def failed(pkg_name):
+            self.log_and_syslog(logging.ERROR, "Failed to patch the package:" + pkg_name)
+            pkg_failed.append(' '.join([pkg_name, category]))
+
+        patchlist = [pkg_name for pkg_name in patchlist if pkg_name != 'walinuxagent']
+        pending = self.run_transactions(patchlist, self.patch_packages, patched, failed,
+                                        deadline=start_patch_time + self.install_duration)
+        if pending:
+            msg = "Patching time exceeded. The pending package will be patched in the next cycle"
+            self.log_and_syslog(logging.WARNING, msg)
+            return True,pkg_failed
         return False,pkg_failed
 
     def patch_one_off(self):
@@ -592,6 +745,7 @@ class AbstractPatching(object):
         self.provide_vm_status_test(StatusTest["Oneoff"])
         if not self.check_vm_idle(StatusTest["Oneoff"]):
             return
+        self.governor.throttle()
 
         global start_patch_time
         start_patch_time = time.time()
@@ -605,7 +759,7 @@ class AbstractPatching(object):
 
         pkg_failed = []
         is_time_out = [False, False]
-        retcode, patchlist_required = self.check(self.category_required)
+        retcode, patchlist_required = self.update_discovery.get_updates(self.category_required)
         if retcode > 0:
             msg = "Failed to check valid upgrades"
             self.log_and_syslog(logging.ERROR, msg)
@@ -613,12 +767,13 @@ class AbstractPatching(object):
         if not patchlist_required:
             self.log_and_syslog(logging.INFO, "No packages are available for update. (Category:" + self.category_required + ")")
         else:
-            is_time_out[0],failed = self._patch(self.category_required, patchlist_required)
+            is_time_out[0],failed = self.update_discovery.timed("patch(" + self.category_required + ")",
+                                                                self._patch, self.category_required, patchlist_required)
             pkg_failed.extend(failed)
         if self.category == self.category_all:
             if not self.exists_stop_flag():
-                if not is_time_out[0]:
-                    retcode, patchlist_other = self.check(self.category_all)
+                if not is_time_out[0] and not self.governor.should_skip(self.category_all, self.category_required):
+                    retcode, patchlist_other = self.update_discovery.get_updates(self.category_all)
                     if retcode > 0:
                         msg = "Failed to check valid upgrades"
                         self.log_and_syslog(logging.ERROR, msg)
@@ -630,7 +785,8 @@ class AbstractPatching(object):
                         self.log_and_syslog(logging.INFO, "Going to sleep for " + str(self.gap_between_stage) + "s")
                         time.sleep(self.gap_between_stage)
                         self.log_and_syslog(logging.INFO, "Going to patch one-off (Category:" + self.category_all + ")")
-                        is_time_out[1],failed = self._patch(self.category_all, patchlist_other)
+                        is_time_out[1],failed = self.update_discovery.timed("patch(" + self.category_all + ")",
+                                                                            self._patch, self.category_all, patchlist_other)
                         pkg_failed.extend(failed)
             else:
                 self.log_and_syslog(logging.INFO, "Installing patches (Category:" + self.category_all + ") is stopped/canceled")
@@ -648,6 +804,9 @@ class AbstractPatching(object):
 
         self.open_deleted_files_after = self.check_open_deleted_files()
         self.delete_stop_flag()
+        # The installed packages changed, so nothing discovered so far is current
+        self.update_discovery.invalidate()
+        self.log_and_syslog(logging.INFO, "Patch phases: " + self.update_discovery.format_timings())
         #self.report()
         if StatusTest["Oneoff"]["Healthy"]:
             is_healthy = StatusTest["Oneoff"]["Healthy"]()
@@ -710,26 +869,14 @@ class AbstractPatching(object):
 
     def check_needs_restart(self):
         self.needs_restart.extend(self.get_pkg_needs_restart())
-        patched_files = dict()
-        for pkg in self.get_pkg_patched():
-            cmd = ' '.join([self.pkg_query_cmd, pkg])
-            try:
-                retcode, output = waagent.RunGetOutput(cmd)
-                patched_files[os.path.basename(pkg)] = [filename for filename in output.split("\n") if os.path.isfile(filename)]
-            except Exception:
-                self.log_and_syslog(logging.ERROR, "Failed to " + cmd)
-        # for k,v in patched_files.items():
-        #     self.log_and_syslog(logging.INFO, k + ": " + " ".join(v))
-        open_deleted_files = list()
-        for filename in self.open_deleted_files_after:
-            if filename not in self.open_deleted_files_before:
-                open_deleted_files.append(filename)
-        # self.log_and_syslog(logging.INFO, "Open deleted files: " + " ".join(open_deleted_files))
-        for pkg,files in patched_files.items():
-            for filename in files:
-                realpath = os.path.realpath(filename)
-                if realpath in open_deleted_files and pkg not in self.needs_restart:
-                     self.needs_restart.append(pkg)
+        patched_files = self.get_patched_files(self.get_pkg_patched() or [])
+        open_deleted_files = dict((filename, pids) for filename, pids in self.open_deleted_files_after.items()
+                                  if filename not in self.open_deleted_files_before)
+        packages, pids = RestartAnalysis.find_packages_to_restart(patched_files, open_deleted_files)
+        for pkg in packages:
+            if pkg not in self.needs_restart:
+                self.needs_restart.append(pkg)
+        self.needs_restart_processes, self.needs_restart_services = RestartAnalysis.describe_processes(pids)
         msg = "Packages needs to restart: "
         pkgs = " ".join(self.needs_restart)
         if pkgs:
@@ -737,20 +884,34 @@ class AbstractPatching(object):
         else:
             msg = "There is no package which needs to restart"
         self.log_and_syslog(logging.INFO, msg)
+        if self.needs_restart_processes:
+            self.log_and_syslog(logging.INFO, "Processes needs to restart: " + " ".join(self.needs_restart_processes))
+        if self.needs_restart_services:
+            self.log_and_syslog(logging.INFO, "Services needs to restart: " + " ".join(self.needs_restart_services))
 
     def get_pkg_needs_restart(self):
         return []
 
+    def get_patched_files(self, packages):
+        """
+        Return a dict of os.path.basename(package) -> files of the package.
+        The distros override it with one batched query.
+        """
+        patched_files = dict()
+        for pkg in packages:
+            cmd = ' '.join([self.pkg_query_cmd, pkg])
+            try:
+                retcode, output = waagent.RunGetOutput(cmd)
+                patched_files[os.path.basename(pkg)] = [filename for filename in output.split("\n") if filename]
+            except Exception:
+                self.log_and_syslog(logging.ERROR, "Failed to " + cmd)
+        return patched_files
+
     def check_open_deleted_files(self):
-        ret = list()
-        retcode,output = waagent.RunGetOutput('lsof | grep "DEL"')
-        if retcode == 0:
-            for line in output.split('\n'):
-                if line:
-                    filename = line.split()[-1]
-                    if filename not in ret:
-                        ret.append(filename)
-        return ret
+        """
+        Return a dict of deleted file -> pids still using it.
+        """
+        return RestartAnalysis.scan_deleted_files()
 
     def create_stop_flag(self):
         waagent.SetFileContents(self.stop_flag_path, '')
@@ -820,6 +981,16 @@ class AbstractPatching(object):
                                       message=msg)
             if not is_idle:
                 self.log_and_syslog(logging.WARNING, "Current Operation is skipped.")
+        elif not self.governor.wait_for_idle(time.time() + self.idle_wait_duration):
+            # No user-provided idle test. Being busy never skips the required
+            # patches; should_skip() decides for the other categories.
+            msg = "The VM is still busy, patching goes on with lowered priority"
+            self.log_and_syslog(logging.WARNING, msg)
+            waagent.AddExtensionEvent(name=self.hutil.get_name(),
+                                      op="Check idle",
+                                      isSuccess=False,
+                                      version=Version,
+                                      message=msg)
         return is_idle
 
     def log_and_syslog(self, level, message):
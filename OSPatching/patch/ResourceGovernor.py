@@ -0,0 +1,254 @@
+#!/usr/bin/python
+#
+# ResourceGovernor keeps patching out of the way of the applications on
+# the VM
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The VM is considered busy when any of these is above its limit:
+  - the 1 minute load average per CPU (/proc/loadavg)
+  - the share of time tasks stalled on cpu, io or memory over the last 10s
+    (/proc/pressure/*, "some avg10"), on kernels with PSI
+  - the number of I/Os in flight on any disk (/proc/diskstats)
+
+The package managers run as children of the patching process, so lowering
+the priority of this process with nice and ionice, and optionally capping
+it in a cgroup v2 group, applies to every download and install.
+
+By default the governor only throttles. With "pauseWhenBusy" patching
+also pauses while the VM is busy, and the optional categories are skipped
+if it stays busy. The required (security) category is never skipped.
+
+The limits can be changed with the settings key "resourceGovernor", e.g.
+{"enabled": true, "pauseWhenBusy": false, "maxLoad": 0.8, "maxPressure": 20,
+ "maxDiskQueue": 4, "nice": 10, "ioniceClass": 3, "cpuQuota": 50}
+"""
+
+import os
+import time
+import logging
+
+from Utils.WAAgentUtil import waagent
+
+PressureResources = ('cpu', 'io', 'memory')
+
+
+class ResourceGovernor(object):
+    def __init__(self, log):
+        self.log = log
+        self.enabled = True
+
+        # Idleness limits
+        self.max_load = 0.8                 # 1 minute load average per CPU
+        self.max_pressure = 20.0            # PSI "some avg10", in percent
+        self.max_disk_queue = 4             # I/Os in flight on a single disk
+
+        # Priority caps
+        self.nice = 10
+        self.ionice_class = 3               # 3 is idle, 2 is best-effort
+        self.cpu_quota = None               # Percent of one CPU, cgroup v2 only
+
+        # Pause/resume, opt-in
+        self.pause_when_busy = False
+        self.poll_interval = 30
+        self.max_pause = 1800
+
+        self.proc_root = '/proc'
+        self.cgroup_root = '/sys/fs/cgroup'
+        self.cgroup_name = 'ospatching'
+        self.throttled = False
+
+    def configure(self, settings):
+        """
+        Apply the valid values of the "resourceGovernor" settings and ignore
+        the rest.
+        """
+        if not isinstance(settings, dict):
+            return
+        if str(settings.get('enabled', 'true')).lower() == 'false':
+            self.enabled = False
+        if str(settings.get('pauseWhenBusy', 'false')).lower() == 'true':
+            self.pause_when_busy = True
+        for key, attr, convert in (('maxLoad', 'max_load', float),
+                                   ('maxPressure', 'max_pressure', float),
+                                   ('maxDiskQueue', 'max_disk_queue', int),
+                                   ('nice', 'nice', int),
+                                   ('ioniceClass', 'ionice_class', int),
+                                   ('cpuQuota', 'cpu_quota', int)):
+            value = settings.get(key)
+            if value is None:
+                continue
+            try:
+                value = convert(value)
+            except (TypeError, ValueError):
+                continue
+            if value >= 0:
+                setattr(self, attr, value)
+
+    def _read_file(self, path):
+        try:
+            with open(path, 'r') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def get_load(self):
+        content = self._read_file(os.path.join(self.proc_root, 'loadavg'))
+        if not content:
+            return None
+        try:
+            cpu_count = os.sysconf('SC_NPROCESSORS_ONLN')
+        except (ValueError, OSError):
+            cpu_count = 1
+        return float(content.split()[0]) / max(1, cpu_count)
+
+    def get_pressure(self, resource):
+        content = self._read_file(os.path.join(self.proc_root, 'pressure', resource))
+        if not content:
+            return None
+        for line in content.split('\n'):
+            # some avg10=2.81 avg60=2.53 avg300=3.07 total=41475402
+            fields = line.split()
+            if fields and fields[0] == 'some':
+                for field in fields[1:]:
+                    if field.startswith('avg10='):
+                        return float(field[len('avg10='):])
+        return None
+
+    def get_disk_queue(self):
+        """
+        Return the largest number of I/Os in flight on a disk. Partitions
+        are skipped, their I/Os are counted on the disk as well.
+        """
+        content = self._read_file(os.path.join(self.proc_root, 'diskstats'))
+        if not content:
+            return None
+        queue = 0
+        for line in content.split('\n'):
+            fields = line.split()
+            if len(fields) < 12 or fields[2].startswith(('loop', 'ram')):
+                continue
+            if not os.path.exists(os.path.join('/sys/block', fields[2])):
+                continue
+            queue = max(queue, int(fields[11]))
+        return queue
+
+    def get_busy_reasons(self):
+        """
+        Return why the VM is busy, or an empty list if it is idle.
+        """
+        reasons = []
+        load = self.get_load()
+        if load is not None and load > self.max_load:
+            reasons.append("load per CPU {0} > {1}".format(round(load, 2), self.max_load))
+        for resource in PressureResources:
+            pressure = self.get_pressure(resource)
+            if pressure is not None and pressure > self.max_pressure:
+                reasons.append("{0} pressure {1}% > {2}%".format(resource, pressure, self.max_pressure))
+        queue = self.get_disk_queue()
+        if queue is not None and queue > self.max_disk_queue:
+            reasons.append("disk queue {0} > {1}".format(queue, self.max_disk_queue))
+        return reasons
+
+    def is_idle(self):
+        if not self.enabled:
+            return True
+        reasons = self.get_busy_reasons()
+        if reasons:
+            self.log(logging.INFO, "The VM is busy: " + ", ".join(reasons))
+        return not reasons
+
+    def wait_for_idle(self, deadline=None):
+        """
+        Pause while the VM is busy, until deadline or for at most max_pause
+        seconds. Return True if the VM is idle, or if pausing is not enabled.
+        """
+        if not self.enabled or not self.pause_when_busy:
+            return True
+        reasons = self.get_busy_reasons()
+        if not reasons:
+            return True
+        until = time.time() + self.max_pause
+        if deadline is not None:
+            until = min(until, deadline)
+        self.log(logging.INFO, "Pause patching, the VM is busy: " + ", ".join(reasons))
+        paused_time = time.time()
+        while reasons and time.time() < until:
+            time.sleep(max(0, min(self.poll_interval, until - time.time())))
+            reasons = self.get_busy_reasons()
+        if reasons:
+            self.log(logging.WARNING, "The VM is still busy after {0}s: {1}".format(
+                int(time.time() - paused_time), ", ".join(reasons)))
+            return False
+        self.log(logging.INFO, "Resume patching after {0}s".format(int(time.time() - paused_time)))
+        return True
+
+    def should_skip(self, category, required_category):
+        """
+        Return True if patching category should be skipped because the VM
+        is busy. Only with pauseWhenBusy, and never for the required
+        category.
+        """
+        if not self.enabled or not self.pause_when_busy or category == required_category:
+            return False
+        reasons = self.get_busy_reasons()
+        if reasons:
+            self.log(logging.WARNING, "Skip the patches of category {0}, the VM is busy: {1}".format(
+                category, ", ".join(reasons)))
+        return bool(reasons)
+
+    def throttle(self):
+        """
+        Lower the CPU and I/O priority of this process and the package
+        managers it starts.
+        """
+        if not self.enabled or self.throttled:
+            return
+        self.throttled = True
+        applied = []
+        try:
+            os.nice(self.nice)
+            applied.append("nice " + str(self.nice))
+        except OSError:
+            pass
+        retcode = waagent.Run(' '.join(['ionice', '-c', str(self.ionice_class), '-p', str(os.getpid())]), False)
+        if retcode == 0:
+            applied.append("ionice class " + str(self.ionice_class))
+        if self.cpu_quota and self.join_cgroup():
+            applied.append("cpu quota {0}%".format(self.cpu_quota))
+        self.log(logging.INFO, "Patching runs with " + (", ".join(applied) or "no priority caps"))
+
+    def join_cgroup(self):
+        """
+        Move this process into a cgroup v2 group capped at cpu_quota
+        percent of one CPU.
+        """
+        controllers = self._read_file(os.path.join(self.cgroup_root, 'cgroup.controllers'))
+        if controllers is None or 'cpu' not in controllers.split():
+            return False
+        cgroup = os.path.join(self.cgroup_root, self.cgroup_name)
+        period = 100000
+        try:
+            if not os.path.isdir(cgroup):
+                os.mkdir(cgroup)
+            with open(os.path.join(cgroup, 'cpu.max'), 'w') as f:
+                f.write("{0} {1}".format(period * self.cpu_quota // 100, period))
+            with open(os.path.join(cgroup, 'cgroup.procs'), 'w') as f:
+                f.write(str(os.getpid()))
+        except (IOError, OSError) as e:
+            self.log(logging.WARNING, "Failed to cap the CPU usage in {0}: {1}".format(cgroup, e))
+            return False
+        return True
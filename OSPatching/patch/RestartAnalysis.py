@@ -0,0 +1,224 @@
+#!/usr/bin/python
+#
+# RestartAnalysis finds the processes and services which still use files
+# replaced by patching
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A file which is replaced while a process still maps it or holds it open
+shows up in /proc/<pid>/maps and as the target of /proc/<pid>/fd/<n> with a
+" (deleted)" suffix. Reading those directly is what lsof does, without
+resolving every other open file on the system on the way.
+"""
+
+import os
+
+from Utils.WAAgentUtil import waagent
+
+ProcRoot = '/proc'
+DpkgInfoDir = '/var/lib/dpkg/info'
+DeletedSuffix = ' (deleted)'
+
+# Deleted "files" which don't belong to any package: SysV and POSIX shared
+# memory, memfd and anonymous mappings.
+IgnoredPrefixes = ('/SYSV', '/dev/shm/', '/memfd:', '/dev/zero', '/drm', '/[aio]')
+
+RpmQueryFormat = '[%{NAME}\\t%{VERSION}\\t%{RELEASE}\\t%{ARCH}\\t%{FILENAMES}\\n]'
+
+
+def _list_pids(proc_root):
+    try:
+        return [name for name in os.listdir(proc_root) if name.isdigit()]
+    except OSError:
+        return []
+
+
+def _read_file(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except (IOError, OSError):
+        return ''
+
+
+def _deleted_path(path):
+    if not path.endswith(DeletedSuffix):
+        return None
+    path = path[:-len(DeletedSuffix)]
+    if not path.startswith('/') or path.startswith(IgnoredPrefixes):
+        return None
+    return path
+
+
+def _scan_maps(proc_root, pid):
+    deleted = set()
+    try:
+        with open(os.path.join(proc_root, pid, 'maps'), 'r') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line.endswith(DeletedSuffix):
+                    continue
+                fields = line.split(None, 5)
+                if len(fields) == 6:
+                    path = _deleted_path(fields[5])
+                    if path:
+                        deleted.add(path)
+    except (IOError, OSError):
+        # The process exited or isn't ours to look at
+        pass
+    return deleted
+
+
+def _scan_fds(proc_root, pid):
+    deleted = set()
+    fd_dir = os.path.join(proc_root, pid, 'fd')
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return deleted
+    for fd in fds:
+        try:
+            path = _deleted_path(os.readlink(os.path.join(fd_dir, fd)))
+        except OSError:
+            continue
+        if path:
+            deleted.add(path)
+    return deleted
+
+
+def scan_deleted_files(proc_root=ProcRoot):
+    """
+    Return a dict of deleted file path -> set of pids which still map the
+    file or hold it open.
+    """
+    deleted_files = dict()
+    for pid in _list_pids(proc_root):
+        paths = _scan_maps(proc_root, pid)
+        paths.update(_scan_fds(proc_root, pid))
+        for path in paths:
+            deleted_files.setdefault(path, set()).add(int(pid))
+    return deleted_files
+
+
+def get_process_name(pid, proc_root=ProcRoot):
+    return _read_file(os.path.join(proc_root, str(pid), 'comm')).strip()
+
+
+def get_process_service(pid, proc_root=ProcRoot):
+    """
+    Return the systemd unit a process belongs to, or None if it was not
+    started by a service.
+    """
+    cgroup = _read_file(os.path.join(proc_root, str(pid), 'cgroup'))
+    for line in cgroup.split('\n'):
+        fields = line.split(':', 2)
+        if len(fields) != 3:
+            continue
+        for component in reversed(fields[2].split('/')):
+            if component.endswith('.service'):
+                return component
+    return None
+
+
+def describe_processes(pids, proc_root=ProcRoot):
+    """
+    Return ("name[pid]" list, service list) for the given pids.
+    """
+    processes = list()
+    services = set()
+    for pid in sorted(pids):
+        processes.append('{0}[{1}]'.format(get_process_name(pid, proc_root), pid))
+        service = get_process_service(pid, proc_root)
+        if service:
+            services.add(service)
+    return processes, sorted(services)
+
+
+def query_rpm_files(packages, package_files=False):
+    """
+    List the files of all the packages with a single rpm query. packages
+    are installed package names ("bash" or "bash.x86_64") or, with
+    package_files, paths of rpm files. Returns a dict of
+    os.path.basename(package) -> set of files.
+    """
+    files = dict()
+    if not packages:
+        return files
+    wanted = set(os.path.basename(pkg) for pkg in packages)
+    cmd = ' '.join(['rpm', '-qp' if package_files else '-q',
+                    "--qf '" + RpmQueryFormat + "'"] + list(packages))
+    # rpm fails if any one of the packages is missing, the rest is still listed
+    retcode, output = waagent.RunGetOutput(cmd, False)
+    for line in output.split('\n'):
+        fields = line.split('\t', 4)
+        if len(fields) != 5:
+            continue
+        name, version, release, arch, filename = fields
+        for key in (name,
+                    name + '.' + arch,
+                    '{0}-{1}-{2}.{3}.rpm'.format(name, version, release, arch)):
+            if key in wanted:
+                files.setdefault(key, set()).add(filename)
+    return files
+
+
+def read_dpkg_files(packages, info_dir=DpkgInfoDir):
+    """
+    Read the file lists of the packages straight from the dpkg database
+    instead of running dpkg-query once per package. Returns a dict of
+    package -> set of files.
+    """
+    files = dict()
+    try:
+        lists = [name[:-len('.list')] for name in os.listdir(info_dir) if name.endswith('.list')]
+    except OSError:
+        return files
+    # Multi-arch packages are recorded as <name>:<arch>.list
+    lists_by_name = dict()
+    for name in lists:
+        lists_by_name.setdefault(name.split(':')[0], list()).append(name)
+    for pkg in packages:
+        if ':' in pkg:
+            candidates = [pkg] if pkg in lists_by_name.get(pkg.split(':')[0], []) else []
+        else:
+            candidates = lists_by_name.get(pkg, [])
+        for name in candidates:
+            content = _read_file(os.path.join(info_dir, name + '.list'))
+            files.setdefault(pkg, set()).update(line for line in content.split('\n') if line)
+    return files
+
+
+def find_packages_to_restart(patched_files, deleted_files):
+    """
+    patched_files is a dict of package -> files, deleted_files a dict of
+    deleted file path -> pids. Returns (packages, pids): the packages with
+    at least one file still in use after being replaced, and the processes
+    using them.
+    """
+    deleted_names = set(os.path.basename(path) for path in deleted_files)
+    packages = list()
+    pids = set()
+    for pkg, files in patched_files.items():
+        for filename in files:
+            # Only resolve symlinks for the few files which may match
+            if os.path.basename(filename) not in deleted_names:
+                continue
+            realpath = os.path.realpath(filename)
+            if realpath in deleted_files:
+                if pkg not in packages:
+                    packages.append(pkg)
+                pids.update(deleted_files[realpath])
+    return packages, pids
@@ -20,6 +20,7 @@ import shutil
 
 from Utils.WAAgentUtil import waagent
 from AbstractPatching import AbstractPatching
+import RestartAnalysis
 
 
 class SuSEPatching(AbstractPatching):
@@ -35,6 +36,7 @@ class SuSEPatching(AbstractPatching):
         self.download_cmd = 'zypper --non-interactive --pkg-cache-dir ' + self.cache_dir + ' install -d --auto-agree-with-licenses -t patch '
         self.patch_cmd = 'zypper --non-interactive --pkg-cache-dir ' + self.cache_dir + ' install --auto-agree-with-licenses -t patch '
         self.pkg_query_cmd = 'rpm -qlp'
+        self.metadata_paths = ['/var/cache/zypp/raw/*/repodata/repomd.xml', '/var/lib/rpm/*']
         waagent.Run('zypper -q --gpg-auto-import-keys --non-interactive refresh', False)
     
     def check(self, category):
@@ -59,14 +61,44 @@ class SuSEPatching(AbstractPatching):
                     patch_list.append(properties[name_position])
         return retcode, patch_list
 
+    def discover_updates(self):
+        """
+        list-patches reports the category of every patch, so a single
+        query covers both categories.
+        """
+        retcode, output = waagent.RunGetOutput(self.check_cmd)
+        updates = {self.category_required: [], self.category_all: []}
+        name_position = 1
+        category_position = None
+        for line in output.split('\n'):
+            properties = [elem.strip() for elem in line.split('|')]
+            if len(properties) > 1:
+                if 'Name' in properties:
+                    name_position = properties.index('Name')
+                    if 'Category' in properties:
+                        category_position = properties.index('Category')
+                elif not properties[name_position] in self.to_patch:
+                    updates[self.category_all].append(properties[name_position])
+                    if category_position is not None and properties[category_position] == 'security':
+                        updates[self.category_required].append(properties[name_position])
+        if category_position is None and retcode == 0 and updates[self.category_all]:
+            retcode, updates[self.category_required] = self.check(self.category_required)
+        return retcode, updates
+
     def download_package(self, package):
-        retcode = waagent.Run(self.download_cmd + package, False)
+        return self.download_packages([package])
+
+    def patch_package(self, package):
+        return self.patch_packages([package])
+
+    def download_packages(self, packages):
+        retcode = waagent.Run(self.download_cmd + ' '.join(packages), False)
         if 0 < retcode and retcode < 100:
             return 1
         else:
             return 0
 
-    def patch_package(self, package):
+    def patch_packages(self, packages):
         if self.patched_pkgs == None:
             self.patched_pkgs = list()
             for root,dirs,files in os.walk(self.cache_dir):
@@ -74,7 +106,7 @@ class SuSEPatching(AbstractPatching):
                     if filename.endswith('rpm'):
                         shutil.copy(os.path.join(root, filename), "/tmp/")
                         self.patched_pkgs.append("/tmp/"+filename)
-        retcode = waagent.Run(self.patch_cmd + package, False)
+        retcode = waagent.Run(self.patch_cmd + ' '.join(packages), False)
         if 0 < retcode and retcode < 100:
             return 1
         else:
@@ -87,3 +119,6 @@ class SuSEPatching(AbstractPatching):
 
     def get_pkg_patched(self):
         return self.patched_pkgs
+
+    def get_patched_files(self, packages):
+        return RestartAnalysis.query_rpm_files(packages, package_files=True)
@@ -19,6 +19,7 @@ import logging
 
 from Utils.WAAgentUtil import waagent
 from AbstractPatching import AbstractPatching
+import RestartAnalysis
 
 class UbuntuPatching(AbstractPatching):
     def __init__(self, hutil):
@@ -33,6 +34,7 @@ class UbuntuPatching(AbstractPatching):
         self.fix_cmd = 'dpkg --configure -a --force-confdef'
         self.status_cmd = 'apt-cache show'
         self.pkg_query_cmd = 'dpkg-query -L'
+        self.metadata_paths = ['/var/lib/apt/lists/*Release', '/var/lib/dpkg/status']
         # Avoid a config prompt
         os.environ['DEBIAN_FRONTEND']='noninteractive'
 
@@ -86,19 +88,62 @@ class UbuntuPatching(AbstractPatching):
         # Azure repo assumes upgrade may have dependency changes
         if retcode != 0:
             self.log_and_syslog(logging.WARNING, "Failed to get list of upgradeable packages")
-        elif self.is_string_none_or_empty(self.dist_upgrade_list):
+        else:
+            retcode, azure_to_download = self.check_dist_upgrade_list()
+            to_download += list(set(azure_to_download) - set(to_download))
+
+        return retcode, to_download
+
+    def check_dist_upgrade_list(self):
+        if self.is_string_none_or_empty(self.dist_upgrade_list):
             self.log_and_syslog(logging.INFO, "Dist upgrade list not specified, will perform normal patch")
-        elif not os.path.isfile(self.dist_upgrade_list):
+            return 0, []
+        if not os.path.isfile(self.dist_upgrade_list):
             self.log_and_syslog(logging.WARNING, "Dist upgrade list was specified but file [{0}] does not exist".format(self.dist_upgrade_list))
+            return 0, []
+        self.log_and_syslog(logging.INFO, "Running dist-upgrade using {0}".format(self.dist_upgrade_list))
+        self.check_azure_cmd = 'apt-get -qq -s dist-upgrade -o Dir::Etc::SourceList={0}'.format(self.dist_upgrade_list)
+        retcode, azoutput = self.try_package_with_autofix(self.check_azure_cmd)
+        return retcode, [line.split()[1] for line in azoutput.split('\n') if line.startswith('Inst')]
+
+    def discover_updates(self):
+        """
+        Simulate the upgrade once against all the sources and tell the
+        security updates apart by the origins apt reports for each package:
+        Inst bash [4.3-7ubuntu1.5] (4.3-7ubuntu1.7 Ubuntu:14.04/trusty-updates, Ubuntu:14.04/trusty-security [amd64])
+        The line only shows the origins of the candidate, so a security fix
+        superseded by a newer version in -updates is found by a second
+        simulation against the security sources alone.
+        """
+        if self.dist_upgrade_all:
+            self.log_and_syslog(logging.INFO, "Performing dist-upgrade for ALL packages")
+            check_cmd = self.check_cmd_distupgrade
         else:
-            self.log_and_syslog(logging.INFO, "Running dist-upgrade using {0}".format(self.dist_upgrade_list))
-            self.check_azure_cmd = 'apt-get -qq -s dist-upgrade -o Dir::Etc::SourceList={0}'.format(self.dist_upgrade_list)
-            retcode, azoutput = self.try_package_with_autofix(self.check_azure_cmd)
-            azure_to_download = [line.split()[1] for line in azoutput.split('\n') if line.startswith('Inst')]
+            check_cmd = self.check_cmd
+        retcode, output = self.try_package_with_autofix(check_cmd)
+        updates = {self.category_required: [], self.category_all: []}
+        for line in output.split('\n'):
+            if not line.startswith('Inst'):
+                continue
+            package = line.split()[1]
+            updates[self.category_all].append(package)
+            if '-security' in line[line.find('('):]:
+                updates[self.category_required].append(package)
+        if retcode != 0:
+            self.log_and_syslog(logging.WARNING, "Failed to get list of upgradeable packages")
+            return retcode, updates
+        retcode, output = self.try_package_with_autofix(check_cmd + self.check_security_suffix)
+        if retcode != 0:
+            self.log_and_syslog(logging.WARNING, "Failed to get list of upgradeable security packages")
+            return retcode, updates
+        for line in output.split('\n'):
+            if line.startswith('Inst') and line.split()[1] not in updates[self.category_required]:
+                updates[self.category_required].append(line.split()[1])
+        retcode, azure_to_download = self.check_dist_upgrade_list()
+        for to_download in updates.values():
             to_download += list(set(azure_to_download) - set(to_download))
+        return retcode, updates
 
-        return retcode, to_download
-        
     def download_package(self, package):
         return waagent.Run(self.download_cmd + ' ' + package)
 
@@ -106,6 +151,13 @@ class UbuntuPatching(AbstractPatching):
         retcode, output = self.try_package_with_autofix(self.patch_cmd + ' ' + package)
         return retcode
 
+    def download_packages(self, packages):
+        return waagent.Run(self.download_cmd + ' ' + ' '.join(packages))
+
+    def patch_packages(self, packages):
+        retcode, output = self.try_package_with_autofix(self.patch_cmd + ' ' + ' '.join(packages))
+        return retcode
+
     def check_reboot(self):
         self.reboot_required = os.path.isfile('/var/run/reboot-required')
 
@@ -115,6 +167,9 @@ class UbuntuPatching(AbstractPatching):
             return []
         return waagent.GetFileContents(fd).split('\n')
 
+    def get_patched_files(self, packages):
+        return RestartAnalysis.read_dpkg_files(packages)
+
     def report(self):
         """
         TODO: Report the detail status of patching
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+#
+# UpdateDiscovery finds the available updates once per run and caches them
+# across runs
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The patching class discovers the updates of every category in one pass
+(discover_updates) and UpdateDiscovery hands the result to the download,
+patch and one-off stages. The result is saved together with a key made of
+the repository metadata and package database timestamps, so that another
+run finds it again as long as neither the repositories nor the installed
+packages have changed.
+
+yum and zypper refresh expired repository metadata only while discovering,
+so an unchanged key can also mean the metadata was never refreshed. The
+result is therefore reused for at most max_age seconds, the default
+metadata_expire of yum.
+
+Example ./updates.cache
+{"key": [1500000000.25, "distUpgradeAll=False"], "time": 1500000100.5,
+ "updates": {"important": ["bash"], "importantandrecommended": ["bash", "vim"]}}
+"""
+
+import os
+import json
+import time
+import logging
+
+
+class UpdateDiscovery(object):
+    def __init__(self, patching, cache_file):
+        self.patching = patching
+        self.cache_file = cache_file
+        self.max_age = 6 * 3600
+        self.retcode = 0
+        self.updates = None
+        # (phase, seconds) in the order the phases ran
+        self.timings = []
+
+    def timed(self, phase, func, *args, **kwargs):
+        """
+        Call func and record the time it took as phase.
+        """
+        start_time = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.timings.append((phase, time.time() - start_time))
+
+    def format_timings(self):
+        return " ".join(["{0}={1}s".format(phase, round(seconds, 3)) for phase, seconds in self.timings])
+
+    def get_updates(self, category):
+        """
+        Return (retcode, package list) for category, discovering the
+        updates on first use.
+        """
+        if self.updates is None:
+            self.discover()
+        return self.retcode, list(self.updates.get(category, []))
+
+    def discover(self):
+        key = self.patching.get_discovery_key()
+        start_time = time.time()
+        updates = self._read_cache(key)
+        if updates is not None:
+            self.timings.append(("discover(cached)", time.time() - start_time))
+            self.patching.log_and_syslog(logging.INFO, "Reuse the updates discovered with the same repository metadata")
+            self.retcode = 0
+            self.updates = updates
+            return
+        self.retcode, self.updates = self.timed("discover", self.patching.discover_updates)
+        if self.retcode == 0 and key is not None:
+            self._write_cache(key, self.updates)
+
+    def invalidate(self):
+        self.updates = None
+        if os.path.isfile(self.cache_file):
+            os.remove(self.cache_file)
+
+    def _read_cache(self, key):
+        if key is None:
+            return None
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(cache, dict) or cache.get('key') != key or not isinstance(cache.get('updates'), dict):
+            return None
+        cache_time = cache.get('time')
+        if not isinstance(cache_time, (int, float)) or not 0 <= time.time() - cache_time <= self.max_age:
+            return None
+        return cache['updates']
+
+    def _write_cache(self, key, updates):
+        tmp = '{0}.tmp'.format(self.cache_file)
+        try:
+            with open(tmp, 'w+') as f:
+                f.write(json.dumps({'key': key, 'time': time.time(), 'updates': updates}))
+            os.rename(tmp, self.cache_file)
+        except (IOError, OSError):
+            pass
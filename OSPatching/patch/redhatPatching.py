@@ -14,10 +14,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import re
+import time
 
 from Utils.WAAgentUtil import waagent
 from AbstractPatching import AbstractPatching
+import RestartAnalysis
 
 
 class redhatPatching(AbstractPatching):
@@ -32,6 +35,10 @@ class redhatPatching(AbstractPatching):
         self.status_cmd = 'yum -q info'
         self.pkg_query_cmd = 'repoquery -l'
         self.cache_dir = '/var/cache/yum/'
+        self.updateinfo_security_cmd = 'yum -q updateinfo list security'
+        self.metadata_paths = [os.path.join(self.cache_dir, '*/*/*/repomd.xml'),
+                               os.path.join(self.cache_dir, '*/repomd.xml'),
+                               '/var/lib/rpm/*']
 
     def install(self):
         """
@@ -86,6 +93,34 @@ class redhatPatching(AbstractPatching):
         elif retcode == 1:
             return 1, to_download
 
+    def discover_updates(self):
+        """
+        List all the updates with one check-update, then pick the security
+        ones from the advisories in the updateinfo metadata instead of
+        resolving them again with --security.
+        """
+        retcode, to_download = self.check(self.category_all)
+        updates = {self.category_required: [], self.category_all: to_download}
+        if retcode > 0 or not to_download:
+            return retcode, updates
+        retcode, output = waagent.RunGetOutput(self.updateinfo_security_cmd, chk_err=False)
+        if retcode != 0:
+            # No updateinfo support (e.g. yum-plugin-security is missing)
+            retcode, updates[self.category_required] = self.check(self.category_required)
+            return retcode, updates
+        security = set()
+        for line in output.split('\n'):
+            # RHSA-2017:1100 Important/Sec. bash-4.2.46-21.el7_3.x86_64
+            fields = line.split()
+            if len(fields) != 3:
+                continue
+            name_ver_rel, sep, arch = fields[2].rpartition('.')
+            name = name_ver_rel.rsplit('-', 2)[0]
+            security.add(name)
+            security.add(name + '.' + arch)
+        updates[self.category_required] = [pkg for pkg in to_download if pkg in security]
+        return 0, updates
+
     def download_package(self, package):
         retcode = waagent.Run(self.download_cmd + ' ' + package, chk_err=False)
         # Yum exit code is not 0 even if succeed, so check if the package rpm exsits to verify that downloading succeeds.
@@ -94,6 +129,42 @@ class redhatPatching(AbstractPatching):
     def patch_package(self, package):
         return waagent.Run(self.patch_cmd + ' ' + package)
 
+    def download_packages(self, packages):
+        start_time = time.time()
+        retcode = waagent.Run(self.download_cmd + ' ' + ' '.join(packages), chk_err=False)
+        # Yum exit code is not 0 even if succeed, so check if the package rpms exist to verify that downloading succeeds.
+        # The rpms fetched by this transaction are matched by name first; only the rest are looked up one by one.
+        downloaded = self.get_downloaded_rpms(start_time)
+        for package in packages:
+            if package not in downloaded and self.check_download(package) != 0:
+                return 1
+        return 0
+
+    def patch_packages(self, packages):
+        return waagent.Run(self.patch_cmd + ' ' + ' '.join(packages))
+
+    def get_downloaded_rpms(self, since):
+        """
+        Return the names, with and without arch, of the rpms written to
+        the yum cache since the given time.
+        """
+        downloaded = set()
+        for root, dirs, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith('.rpm'):
+                    continue
+                try:
+                    if os.path.getmtime(os.path.join(root, filename)) < since:
+                        continue
+                except OSError:
+                    continue
+                # name-version-release.arch.rpm
+                nvr, _, arch = filename[:-len('.rpm')].rpartition('.')
+                name = nvr.rsplit('-', 2)[0]
+                downloaded.add(name)
+                downloaded.add(name + '.' + arch)
+        return downloaded
+
     def check_reboot(self):
         retcode,last_kernel = waagent.RunGetOutput("rpm -q --last kernel")
         last_kernel = last_kernel.split()[0][7:]
@@ -101,6 +172,11 @@ class redhatPatching(AbstractPatching):
         current_kernel = current_kernel.strip()
         self.reboot_required = (last_kernel != current_kernel)
 
+    def get_patched_files(self, packages):
+        # The patched packages are installed, so the local rpm database
+        # answers for all of them at once
+        return RestartAnalysis.query_rpm_files(packages)
+
     def report(self):
         """
         TODO: Report the detail status of patching
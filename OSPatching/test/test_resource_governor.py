@@ -0,0 +1,116 @@
+#!/usr/bin/python
+#
+# OSPatching extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.4+
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+sys.path.append('../patch')
+from ResourceGovernor import ResourceGovernor
+
+Required = 'important'
+All = 'all'
+
+
+def log(level, message):
+    pass
+
+
+class ScriptedGovernor(ResourceGovernor):
+    """
+    Report the busy reasons of a script, one entry per check, then idle.
+    """
+    def __init__(self, script):
+        ResourceGovernor.__init__(self, log)
+        self.script = list(script)
+        self.checks = 0
+
+    def get_busy_reasons(self):
+        self.checks += 1
+        if self.script:
+            return self.script.pop(0)
+        return []
+
+
+class TestResourceGovernor(unittest.TestCase):
+    def setUp(self):
+        self.proc_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.proc_root)
+
+    def write_proc(self, name, content):
+        path = os.path.join(self.proc_root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_busy_reasons(self):
+        governor = ResourceGovernor(log)
+        governor.proc_root = self.proc_root
+        self.write_proc('loadavg', '0.01 0.02 0.05 1/180 12345\n')
+        self.write_proc('pressure/io', 'some avg10=35.50 avg60=2.53 avg300=3.07 total=41475402\n'
+                                       'full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n')
+        self.assertEqual(['io pressure 35.5% > 20.0%'], governor.get_busy_reasons())
+        self.write_proc('loadavg', '100000.0 0.02 0.05 1/180 12345\n')
+        self.assertEqual(2, len(governor.get_busy_reasons()))
+
+    def test_wait_for_idle_not_opted_in(self):
+        governor = ScriptedGovernor([['load'], ['load']])
+        self.assertTrue(governor.wait_for_idle(time.time() + 60))
+        self.assertEqual(0, governor.checks)
+
+    def test_wait_for_idle_resumes(self):
+        governor = ScriptedGovernor([['load'], ['load']])
+        governor.pause_when_busy = True
+        governor.poll_interval = 0.01
+        self.assertTrue(governor.wait_for_idle(time.time() + 60))
+        self.assertEqual(3, governor.checks)
+
+    def test_wait_for_idle_deadline(self):
+        governor = ScriptedGovernor([['load']] * 1000)
+        governor.pause_when_busy = True
+        governor.poll_interval = 0.01
+        start = time.time()
+        self.assertFalse(governor.wait_for_idle(start + 0.1))
+        self.assertTrue(time.time() - start < 5)
+
+    def test_wait_for_idle_disabled(self):
+        governor = ScriptedGovernor([['load']])
+        governor.configure({'enabled': 'false', 'pauseWhenBusy': 'true'})
+        self.assertTrue(governor.wait_for_idle(time.time() + 60))
+
+    def test_should_skip(self):
+        governor = ScriptedGovernor([['load']] * 10)
+        # Throttle-only by default
+        self.assertFalse(governor.should_skip(All, Required))
+        governor.configure({'pauseWhenBusy': True})
+        # The required category is never skipped
+        self.assertFalse(governor.should_skip(Required, Required))
+        self.assertTrue(governor.should_skip(All, Required))
+        governor.script = []
+        self.assertFalse(governor.should_skip(All, Required))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+#
+# OSPatching extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.4+
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.append(os.path.abspath('../patch'))
+# AbstractPatching reads HandlerManifest.json from the working directory
+cwd = os.getcwd()
+os.chdir('..')
+try:
+    from UbuntuPatching import UbuntuPatching
+finally:
+    os.chdir(cwd)
+
+AllSimulation = """Inst bash [4.3-7ubuntu1.5] (4.3-7ubuntu1.7 Ubuntu:14.04/trusty-updates, Ubuntu:14.04/trusty-security [amd64])
+Inst openssl [1.0.1f-1ubuntu2.19] (1.0.1f-1ubuntu2.22 Ubuntu:14.04/trusty-updates [amd64])
+Inst vim [2:7.4.052-1ubuntu3] (2:7.4.052-1ubuntu3.1 Ubuntu:14.04/trusty-updates [amd64])
+Conf bash (4.3-7ubuntu1.7 Ubuntu:14.04/trusty-updates, Ubuntu:14.04/trusty-security [amd64])
+"""
+
+# openssl has a security fix, superseded in -updates by a newer version
+SecuritySimulation = """Inst bash [4.3-7ubuntu1.5] (4.3-7ubuntu1.7 Ubuntu:14.04/trusty-security [amd64])
+Inst openssl [1.0.1f-1ubuntu2.19] (1.0.1f-1ubuntu2.21 Ubuntu:14.04/trusty-security [amd64])
+"""
+
+
+class FakeUbuntuPatching(UbuntuPatching):
+    def __init__(self):
+        # Skip the constructor, it writes the apt security sources
+        self.category_required = 'important'
+        self.category_all = 'all'
+        self.dist_upgrade_all = False
+        self.dist_upgrade_list = None
+        self.check_cmd = 'apt-get -qq -s upgrade'
+        self.check_security_suffix = ' -o Dir::Etc::SourceList=/etc/apt/security.sources.list'
+        self.commands = []
+
+    def try_package_with_autofix(self, cmd):
+        self.commands.append(cmd)
+        if cmd.endswith(self.check_security_suffix):
+            return 0, SecuritySimulation
+        return 0, AllSimulation
+
+    def log_and_syslog(self, level, message):
+        pass
+
+
+class TestUbuntuPatching(unittest.TestCase):
+    def test_discover_updates(self):
+        patching = FakeUbuntuPatching()
+        retcode, updates = patching.discover_updates()
+        self.assertEqual(0, retcode)
+        self.assertEqual(['bash', 'openssl', 'vim'], updates['all'])
+        self.assertEqual(['bash', 'openssl'], updates['important'])
+        self.assertEqual(2, len(patching.commands))
+
+
+if __name__ == '__main__':
+    unittest.main()
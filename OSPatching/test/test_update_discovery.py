@@ -0,0 +1,87 @@
+#!/usr/bin/python
+#
+# OSPatching extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.4+
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+sys.path.append('../patch')
+from UpdateDiscovery import UpdateDiscovery
+
+
+class FakePatching(object):
+    """
+    The metadata timestamp never changes, like on yum or zypper when only
+    the discovery itself would refresh the expired metadata.
+    """
+    def __init__(self):
+        self.discover_count = 0
+
+    def get_discovery_key(self):
+        return [1500000000.25, "distUpgradeAll=False"]
+
+    def discover_updates(self):
+        self.discover_count += 1
+        return 0, {'important': ['bash'], 'all': ['bash', 'vim']}
+
+    def log_and_syslog(self, level, message):
+        pass
+
+
+class TestUpdateDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.work_dir, 'updates.cache')
+        self.patching = FakePatching()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_reuse_same_key(self):
+        UpdateDiscovery(self.patching, self.cache_file).get_updates('important')
+        retcode, updates = UpdateDiscovery(self.patching, self.cache_file).get_updates('all')
+        self.assertEqual(0, retcode)
+        self.assertEqual(['bash', 'vim'], updates)
+        self.assertEqual(1, self.patching.discover_count)
+
+    def test_stale_key(self):
+        UpdateDiscovery(self.patching, self.cache_file).get_updates('important')
+        with open(self.cache_file, 'r') as f:
+            cache = json.load(f)
+        # Same key, but discovered longer ago than the metadata may be kept
+        cache['time'] -= 7 * 3600
+        with open(self.cache_file, 'w') as f:
+            json.dump(cache, f)
+        UpdateDiscovery(self.patching, self.cache_file).get_updates('important')
+        self.assertEqual(2, self.patching.discover_count)
+
+    def test_cache_without_time(self):
+        with open(self.cache_file, 'w') as f:
+            json.dump({'key': self.patching.get_discovery_key(), 'updates': {'important': []}}, f)
+        retcode, updates = UpdateDiscovery(self.patching, self.cache_file).get_updates('important')
+        self.assertEqual(['bash'], updates)
+        self.assertEqual(1, self.patching.discover_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,6 +30,7 @@ import inspect
 import urllib
 import urllib2
 import watcherutil
+import Utils.SeqNoUtil as SeqNoUtil
 
 try:
     from Utils.WAAgentUtil import waagent
@@ -1157,21 +1158,10 @@ def get_latest_seq_no():
             config_dir = os.path.join(os.getcwd(), 'config')
 
         latest_seq_no = -1
-        cur_seq_no = -1
-        latest_time = None
         try:
-            for dir_name, sub_dirs, file_names in os.walk(config_dir):
-                for file_name in file_names:
-                    file_basename = os.path.basename(file_name)
-                    match = re.match(r'[0-9]{1,10}\.settings', file_basename)
-                    if match is None:
-                        continue
-                    cur_seq_no = int(file_basename.split('.')[0])
-                    file_path = os.path.join(config_dir, file_name)
-                    cur_time = os.path.getmtime(file_path)
-                    if latest_time is None or cur_time > latest_time:
-                        latest_time = cur_time
-                        latest_seq_no = cur_seq_no
+            # Validates a persisted index instead of stat'ing every
+            # historical settings file
+            latest_seq_no = SeqNoUtil.get_current_seq_no(config_dir)
         except:
             pass
         if latest_seq_no < 0:
@@ -31,6 +31,13 @@ class CommonVariables:
     configurations
     """
     wrapper_package_name = 'msft-rdma-drivers'
+    driver_package_name = 'msft-lis-rdma-kmp-default'
+    hv_utils_package_name = 'hyper-v'
+    rdma_repo_name = 'msft-rdma-pack'
+    rdma_repo_url = 'https://drivers.suse.com/microsoft/Microsoft-LIS-RDMA/sle-12/updates'
+    rdma_package_dir = '/opt/microsoft/rdma'
+    kvp_pool_file = '/var/lib/hyperv/.kvp_pool_0'
+    kvp_daemon_name = 'hv_kvp_daemon'
 
     """
     error code definitions
@@ -34,6 +34,7 @@ from Common import *
 from CommandExecuter import CommandExecuter
 from RdmaException import RdmaException
 from SecondStageMarkConfig import SecondStageMarkConfig
+from UpdateOrchestrator import UpdateOrchestrator
 
 class SuSEPatching(AbstractPatching):
     def __init__(self,logger,distro_info):
@@ -58,6 +59,7 @@ class SuSEPatching(AbstractPatching):
             self.resize2fs_path = '/sbin/resize2fs'
             self.reboot_path = '/sbin/reboot'
             self.rmmod_path = '/sbin/rmmod'
+            self.rpm_path = '/bin/rpm'
             self.service_path='/usr/sbin/service'
             self.umount_path = '/bin/umount'
             self.zypper_path = '/usr/bin/zypper'
@@ -80,34 +82,22 @@ class SuSEPatching(AbstractPatching):
             self.resize2fs_path = '/sbin/resize2fs'
             self.reboot_path = '/sbin/reboot'
             self.rmmod_path = '/usr/sbin/rmmod'
+            self.rpm_path = '/usr/bin/rpm'
             self.service_path = '/usr/sbin/service'
             self.umount_path = '/usr/bin/umount'
             self.zypper_path = '/usr/bin/zypper'
 
     def rdmaupdate(self):
-        check_install_result = self.check_install_hv_utils()
-        if(check_install_result == CommonVariables.process_success):
-            time.sleep(40)
-            check_result = self.check_rdma()
-
-            if(check_result == CommonVariables.UpToDate):
-                return
-            elif(check_result == CommonVariables.OutOfDate):
-                nd_driver_version = self.get_nd_driver_version()
-                rdma_package_installed_version = self.get_rdma_package_version()
-                update_rdma_driver_result = self.update_rdma_driver(nd_driver_version, rdma_package_installed_version)
-            elif(check_result == CommonVariables.DriverVersionNotFound):
-                raise RdmaException(CommonVariables.driver_version_not_found)
-            elif(check_result == CommonVariables.Unknown):
-                raise RdmaException(CommonVariables.unknown_error)
-        else:
-            raise RdmaException(CommonVariables.install_hv_utils_failed)
+        UpdateOrchestrator(self, self.logger).run()
 
     def check_rdma(self):
         nd_driver_version = self.get_nd_driver_version()
         if(nd_driver_version is None or nd_driver_version == ""):
             return CommonVariables.DriverVersionNotFound
         package_version = self.get_rdma_package_version()
+        return self.compare_rdma_version(nd_driver_version, package_version)
+
+    def compare_rdma_version(self, nd_driver_version, package_version):
         if(package_version is None or package_version == ""):
             return CommonVariables.OutOfDate
         else:
@@ -150,33 +140,22 @@ class SuSEPatching(AbstractPatching):
         else:
             return CommonVariables.common_failed
 
-    def check_install_hv_utils(self):
+    def install_hv_utils(self):
         commandExecuter = CommandExecuter(self.logger)
-        error, output = commandExecuter.RunGetOutput(self.ps_path + " -ef")
+        error,output = commandExecuter.RunGetOutput(self.zypper_path + " -n install --force hyper-v")
+        self.logger.log("install hyper-v return code: " + str(error) + " output:" + str(output))
         if(error != CommonVariables.process_success):
-            return CommonVariables.common_failed
-        else:
-            r = re.search("hv_kvp_daemon", output)
-            if r is None :
-                self.logger.log("KVP deamon is not running, install it")
-                error,output = commandExecuter.RunGetOutput(self.zypper_path + " -n install --force hyper-v")
-                self.logger.log("install hyper-v return code: " + str(error) + " output:" + str(output))
-                if(error != CommonVariables.process_success):
-                    return CommonVariables.common_failed
-                secondStageMarkConfig = SecondStageMarkConfig()
-                secondStageMarkConfig.MarkIt()
-                self.reboot_machine()
-                return CommonVariables.process_success
-            else :
-                self.logger.log("KVP deamon is running")
-                return CommonVariables.process_success
+            raise RdmaException(CommonVariables.install_hv_utils_failed)
+        secondStageMarkConfig = SecondStageMarkConfig()
+        secondStageMarkConfig.MarkIt()
+        self.reboot_machine()
 
     def get_nd_driver_version(self):
         """
         if error happens, raise a RdmaException
         """
         try:
-            with open("/var/lib/hyperv/.kvp_pool_0", "r") as f:
+            with open(CommonVariables.kvp_pool_file, "r") as f:
                 lines = f.read()
             r = re.search("NdDriverVersion\0+(\d\d\d\.\d)", lines)
             if r is not None:
@@ -192,58 +171,20 @@ class SuSEPatching(AbstractPatching):
 
     def get_rdma_package_version(self):
         """
+        Query the rpm database instead of zypper info, which loads the
+        repository metadata.
         """
         commandExecuter = CommandExecuter(self.logger)
-        error, output = commandExecuter.RunGetOutput(self.zypper_path + " info msft-lis-rdma-kmp-default")
+        error, output = commandExecuter.RunGetOutput(self.rpm_path + " -q --qf '%{VERSION}-%{RELEASE}' " + CommonVariables.driver_package_name)
         if(error == CommonVariables.process_success):
-            r = re.search("Version: (\S+)", output)
-            if r is not None:
-                package_version = r.groups()[0]# e.g.  package_version is "20150707_k3.12.28_4-3.1.140.0"
+            package_version = output.strip()# e.g.  package_version is "20150707_k3.12.28_4-3.1.140.0"
+            if package_version != "":
                 return package_version
             else:
                 return None
         else:
             return None
 
-    def update_rdma_driver(self, host_version, rdma_package_installed_version):
-        """
-        """
-        commandExecuter = CommandExecuter(self.logger)
-        error, output = commandExecuter.RunGetOutput(self.zypper_path + " lr -u")
-        rdma_pack_result = re.search("msft-rdma-pack", output)
-        if rdma_pack_result is None :
-            self.logger.log("rdma_pack_result is None")
-            error, output = commandExecuter.RunGetOutput(self.zypper_path + " ar https://drivers.suse.com/microsoft/Microsoft-LIS-RDMA/sle-12/updates msft-rdma-pack")
-            #wait for the cache build.
-            time.sleep(20)
-            self.logger.log("error result is " + str(error) + " output is : " + str(output))
-        else:
-            self.logger.log("output is: "+str(output))
-            self.logger.log("msft-rdma-pack found")
-        returnCode,message = commandExecuter.RunGetOutput(self.zypper_path + " --no-gpg-checks refresh")
-        self.logger.log("refresh repro return code is " + str(returnCode) + " output is: " + str(message))
-        #install the wrapper package, that will put the driver RPM packages under /opt/microsoft/rdma
-        returnCode,message = commandExecuter.RunGetOutput(self.zypper_path + " -n remove " + CommonVariables.wrapper_package_name)
-        self.logger.log("remove wrapper package return code is " + str(returnCode) + " output is: " + str(message))
-        returnCode,message = commandExecuter.RunGetOutput(self.zypper_path + " --non-interactive install --force " + CommonVariables.wrapper_package_name)
-        self.logger.log("install wrapper package return code is " + str(returnCode) + " output is: " + str(message))
-        r = os.listdir("/opt/microsoft/rdma")
-        if r is not None :
-            for filename in r :
-                if re.match("msft-lis-rdma-kmp-default-\d{8}\.(%s).+" % host_version, filename) :
-                    error,output = commandExecuter.RunGetOutput(self.zypper_path + " --non-interactive remove msft-lis-rdma-kmp-default")
-                    self.logger.log("remove msft-lis-rdma-kmp-default result is " + str(error) + " output is: " + str(output))
-                    self.logger.log("Installing RPM /opt/microsoft/rdma/" + filename)
-                    error,output = commandExecuter.RunGetOutput(self.zypper_path + " --non-interactive install --force /opt/microsoft/rdma/%s" % filename)
-                    self.logger.log("Install msft-lis-rdma-kmp-default result is " + str(error) + " output is: " + str(output))
-                    if(error == CommonVariables.process_success):
-                        self.reboot_machine()
-                    else:
-                        raise RdmaException(CommonVariables.package_install_failed)
-        else:
-            self.logger.log("RDMA drivers not found in /opt/microsoft/rdma")
-            raise RdmaException(CommonVariables.package_not_found)
-
     def reboot_machine(self):
         self.logger.log("rebooting machine")
         commandExecuter = CommandExecuter(self.logger)
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+#
+# Copyright 2015 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.4+
+
+"""
+Drive the RDMA driver update from readiness conditions instead of fixed
+sleeps:
+  - the KVP daemon is running when its pid shows up in /proc
+  - the host driver version is known as soon as the KVP pool file holds
+    NdDriverVersion
+  - the driver repository is ready when zypper refresh of it returns
+The installed driver package is replaced in a single zypper transaction and
+the duration of every step is logged.
+"""
+
+import os
+import re
+import time
+import glob
+
+from Common import *
+from CommandExecuter import CommandExecuter
+from RdmaException import RdmaException
+
+ZypperReposDir = '/etc/zypp/repos.d'
+
+
+class UpdateOrchestrator(object):
+    def __init__(self, patching, logger):
+        self.patching = patching
+        self.logger = logger
+        self.commandExecuter = CommandExecuter(logger)
+        self.proc_root = '/proc'
+        self.poll_interval = 1
+        self.kvp_daemon_timeout = 60
+        self.nd_driver_timeout = 60
+        self.durations = []
+
+    def timed(self, step, func, *args):
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.durations.append((step, time.time() - start))
+
+    def format_durations(self):
+        return ", ".join(["%s %.1fs" % (step, duration) for step, duration in self.durations])
+
+    def wait_until(self, condition, timeout):
+        """
+        Poll condition until it returns a value or timeout seconds passed.
+        Return the last value.
+        """
+        deadline = time.time() + timeout
+        value = condition()
+        while not value and time.time() < deadline:
+            time.sleep(max(0, min(self.poll_interval, deadline - time.time())))
+            value = condition()
+        return value
+
+    def find_pid(self, name):
+        for entry in os.listdir(self.proc_root):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.proc_root, entry, 'comm'), 'r') as f:
+                    if f.read().strip() == name:
+                        return int(entry)
+            except (IOError, OSError):
+                # The process exited while scanning
+                continue
+        return None
+
+    def wait_for_kvp_daemon(self):
+        """
+        Return the pid of the KVP daemon. Right after boot the daemon may
+        not be started yet, so wait for it if hyper-v is installed.
+        """
+        pid = self.find_pid(CommonVariables.kvp_daemon_name)
+        if pid is None:
+            error, output = self.commandExecuter.RunGetOutput(self.patching.rpm_path + " -q " + CommonVariables.hv_utils_package_name)
+            if error == CommonVariables.process_success:
+                self.logger.log("hyper-v is installed, wait for the KVP daemon")
+                pid = self.wait_until(lambda: self.find_pid(CommonVariables.kvp_daemon_name), self.kvp_daemon_timeout)
+        return pid
+
+    def read_nd_driver_version(self):
+        try:
+            return self.patching.get_nd_driver_version()
+        except RdmaException:
+            # The KVP daemon has not written the pool file yet
+            return None
+
+    def wait_for_nd_driver_version(self):
+        return self.wait_until(self.read_nd_driver_version, self.nd_driver_timeout)
+
+    def is_repo_configured(self):
+        for repo_file in glob.glob(os.path.join(ZypperReposDir, '*.repo')):
+            try:
+                with open(repo_file, 'r') as f:
+                    if ("[%s]" % CommonVariables.rdma_repo_name) in f.read():
+                        return True
+            except (IOError, OSError):
+                continue
+        return False
+
+    def prepare_repo(self):
+        if not self.is_repo_configured():
+            error, output = self.commandExecuter.RunGetOutput(self.patching.zypper_path + " ar " + CommonVariables.rdma_repo_url + " " + CommonVariables.rdma_repo_name)
+            self.logger.log("add repo return code: " + str(error) + " output: " + str(output))
+        # The repository is ready once the refresh returns
+        error, output = self.commandExecuter.RunGetOutput(self.patching.zypper_path + " --non-interactive --no-gpg-checks refresh --repo " + CommonVariables.rdma_repo_name)
+        self.logger.log("refresh repo return code: " + str(error) + " output: " + str(output))
+
+    def install_wrapper(self):
+        """
+        Install the wrapper package, that will put the driver RPM packages
+        under /opt/microsoft/rdma. --force reinstalls it in the same
+        transaction if it is installed already.
+        """
+        error, output = self.commandExecuter.RunGetOutput(self.patching.zypper_path + " --non-interactive install --force " + CommonVariables.wrapper_package_name)
+        self.logger.log("install wrapper package return code: " + str(error) + " output: " + str(output))
+
+    def find_driver_rpm(self, nd_driver_version):
+        if not os.path.isdir(CommonVariables.rdma_package_dir):
+            return None
+        for filename in os.listdir(CommonVariables.rdma_package_dir):
+            if re.match("msft-lis-rdma-kmp-default-\d{8}\.(%s).+" % nd_driver_version, filename):
+                return os.path.join(CommonVariables.rdma_package_dir, filename)
+        return None
+
+    def install_driver(self, rpm_file):
+        """
+        Replace the installed driver package, whatever its version, in one
+        transaction.
+        """
+        self.logger.log("Installing RPM " + rpm_file)
+        error, output = self.commandExecuter.RunGetOutput(self.patching.zypper_path + " --non-interactive install --force --oldpackage " + rpm_file)
+        self.logger.log("Install " + CommonVariables.driver_package_name + " result is " + str(error) + " output is: " + str(output))
+        if error != CommonVariables.process_success:
+            raise RdmaException(CommonVariables.package_install_failed)
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.logger.log("RDMA update steps: " + self.format_durations())
+
+    def _run(self):
+        pid = self.timed('kvp_daemon', self.wait_for_kvp_daemon)
+        if pid is None:
+            self.logger.log("KVP deamon is not running, install it")
+            self.timed('install_hv_utils', self.patching.install_hv_utils)
+            return
+        self.logger.log("KVP deamon is running with pid " + str(pid))
+
+        nd_driver_version = self.timed('nd_driver_version', self.wait_for_nd_driver_version)
+        if not nd_driver_version:
+            self.logger.log("Error: NdDriverVersion not found.")
+            raise RdmaException(CommonVariables.driver_version_not_found)
+        package_version = self.timed('package_version', self.patching.get_rdma_package_version)
+        if self.patching.compare_rdma_version(nd_driver_version, package_version) == CommonVariables.UpToDate:
+            return
+
+        rpm_file = self.find_driver_rpm(nd_driver_version)
+        if rpm_file is None:
+            self.timed('refresh_repo', self.prepare_repo)
+            self.timed('install_wrapper', self.install_wrapper)
+            rpm_file = self.find_driver_rpm(nd_driver_version)
+        if rpm_file is None:
+            self.logger.log("RDMA drivers not found in " + CommonVariables.rdma_package_dir)
+            raise RdmaException(CommonVariables.package_not_found)
+        self.timed('install_driver', self.install_driver, rpm_file)
+        self.patching.reboot_machine()
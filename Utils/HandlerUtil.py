@@ -57,18 +57,42 @@ import os.path
 import sys
 import imp
 import base64
+import hashlib
 import json
 import time
 
 from xml.etree import ElementTree
 from os.path import join
 from Utils.WAAgentUtil import waagent
+from Utils import SeqNoUtil
 from waagent import LoggerInit
 
+try:
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key, pkcs7
+    # pkcs7 decryption was only added in later releases of cryptography
+    _in_process_decrypt = hasattr(pkcs7, 'pkcs7_decrypt_der')
+except ImportError:
+    _in_process_decrypt = False
+
 DateTimeFormat = "%Y-%m-%dT%H:%M:%SZ"
 
 MANIFEST_XML = "manifest.xml"
 
+# Decrypted protectedSettings, keyed by (thumbprint, sha256 of the encrypted
+# settings). Plain text is only ever kept in memory, for the lifetime of the
+# process, so re-parsing the same configuration doesn't decrypt it again.
+_protected_settings_cache = {}
+
+
+def _decrypt_smime_in_process(cert_file, pkey_file, data):
+    with open(cert_file, 'rb') as f:
+        cert = x509.load_pem_x509_certificate(f.read(), default_backend())
+    with open(pkey_file, 'rb') as f:
+        pkey = load_pem_private_key(f.read(), None, default_backend())
+    return pkcs7.pkcs7_decrypt_der(data, cert, pkey, []).decode('utf-8')
+
 class HandlerContext:
     def __init__(self,name):
         self._name = name
@@ -123,24 +147,7 @@ class HandlerUtility:
             return (long_name, short_name, version)
 
     def _get_current_seq_no(self, config_folder):
-        seq_no = -1
-        cur_seq_no = -1
-        freshest_time = None
-        for subdir, dirs, files in os.walk(config_folder):
-            for file in files:
-                try:
-                    cur_seq_no = int(os.path.basename(file).split('.')[0])
-                    if(freshest_time == None):
-                        freshest_time = os.path.getmtime(join(config_folder,file))
-                        seq_no = cur_seq_no
-                    else:
-                        current_file_m_time = os.path.getmtime(join(config_folder,file))
-                        if(current_file_m_time > freshest_time):
-                            freshest_time=current_file_m_time
-                            seq_no = cur_seq_no
-                except ValueError:
-                    continue
-        return seq_no
+        return SeqNoUtil.get_current_seq_no(config_folder)
 
     def log(self, message):
         self._log(self._get_log_prefix() + message)
@@ -165,11 +172,7 @@ class HandlerUtility:
                     handlerSettings["protectedSettingsCertThumbprint"] is not None:
                 protectedSettings = handlerSettings['protectedSettings']
                 thumb=handlerSettings['protectedSettingsCertThumbprint']
-                cert=waagent.LibDir+'/'+thumb+'.crt'
-                pkey=waagent.LibDir+'/'+thumb+'.prv'
-                unencodedSettings = base64.standard_b64decode(protectedSettings)
-                openSSLcmd = "openssl smime -inform DER -decrypt -recip {0} -inkey {1}"
-                cleartxt = waagent.RunSendStdin(openSSLcmd.format(cert, pkey), unencodedSettings)[1]
+                cleartxt = self._decrypt_protected_settings(thumb, protectedSettings)
                 if cleartxt is None:
                     self.error("OpenSSL decode error using  thumbprint " + thumb )
                     self.do_exit(1,"Enable",'error','1', 'Failed to decrypt protectedSettings')
@@ -182,6 +185,32 @@ class HandlerUtility:
                 self.log('Config decoded correctly.')
         return config
 
+    def _decrypt_protected_settings(self, thumb, protectedSettings):
+        cache_key = (thumb, hashlib.sha256(protectedSettings.encode('ascii')).hexdigest())
+        cleartxt = _protected_settings_cache.get(cache_key)
+        if cleartxt is not None:
+            self.log('Using cached decryption of protectedSettings.')
+            return cleartxt
+
+        cert=waagent.LibDir+'/'+thumb+'.crt'
+        pkey=waagent.LibDir+'/'+thumb+'.prv'
+        unencodedSettings = base64.standard_b64decode(protectedSettings)
+        # cryptography only handles some content ciphers (no 3DES), so
+        # openssl remains the fallback
+        if _in_process_decrypt:
+            try:
+                cleartxt = _decrypt_smime_in_process(cert, pkey, unencodedSettings)
+            except Exception as e:
+                self.log('In-process decryption failed, falling back to openssl: ' + str(e))
+        if cleartxt is None:
+            openSSLcmd = "openssl smime -inform DER -decrypt -recip {0} -inkey {1}"
+            code, cleartxt = waagent.RunSendStdin(openSSLcmd.format(cert, pkey), unencodedSettings)
+            if code != 0:
+                return cleartxt
+        if cleartxt is not None:
+            _protected_settings_cache[cache_key] = cleartxt
+        return cleartxt
+
     def do_parse_context(self,operation):
         _context = self.try_parse_context()
         if not _context:
@@ -0,0 +1,151 @@
+# Settings sequence number utilities
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The current settings sequence number is the one of the most recently
+modified <seq>.settings file in the config folder. The config folder keeps
+every historical settings file, so instead of stat'ing all of them on every
+invocation, the result is remembered in a small index file together with a
+watermark: the mtime of the config folder and of the current settings file.
+As long as neither has changed, the remembered sequence number is returned
+without scanning the folder.
+
+Example ./seqindex
+{"configFolder": "/var/lib/waagent/Ext-1.0/config", "seqNo": 12,
+ "folderMtime": 1500000000.25, "settingsMtime": 1500000000.2}
+"""
+
+import json
+import os
+import os.path
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+SeqIndexFile = 'seqindex'
+
+# Filesystems with coarse timestamps can modify a folder twice within the
+# same mtime tick. A watermark younger than this is not persisted, so that
+# such a change can't go unnoticed.
+RacyWindowSeconds = 2
+
+SettingsSuffix = '.settings'
+
+
+def _parse_seq_no(file_name):
+    if not file_name.endswith(SettingsSuffix):
+        return None
+    try:
+        return int(file_name[:-len(SettingsSuffix)])
+    except ValueError:
+        return None
+
+
+def _iter_settings_files(config_folder):
+    """
+    Yield (seq_no, mtime) for every <seq>.settings file directly inside
+    config_folder.
+    """
+    if scandir is not None:
+        for entry in scandir(config_folder):
+            seq_no = _parse_seq_no(entry.name)
+            if seq_no is not None and entry.is_file():
+                yield seq_no, entry.stat().st_mtime
+    else:
+        for file_name in os.listdir(config_folder):
+            seq_no = _parse_seq_no(file_name)
+            if seq_no is None:
+                continue
+            file_path = os.path.join(config_folder, file_name)
+            if os.path.isfile(file_path):
+                yield seq_no, os.path.getmtime(file_path)
+
+
+def scan_current_seq_no(config_folder):
+    """
+    Return (seq_no, mtime) of the most recently modified settings file,
+    or (-1, None) if there is none.
+    """
+    seq_no = -1
+    freshest_time = None
+    for cur_seq_no, cur_time in _iter_settings_files(config_folder):
+        if freshest_time is None or cur_time > freshest_time:
+            freshest_time = cur_time
+            seq_no = cur_seq_no
+    return seq_no, freshest_time
+
+
+def _read_index(index_file):
+    try:
+        with open(index_file, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_index(index_file, index):
+    tmp = '{0}.tmp'.format(index_file)
+    try:
+        with open(tmp, 'w+') as f:
+            f.write(json.dumps(index))
+        os.rename(tmp, index_file)
+    except (IOError, OSError):
+        pass
+
+
+def get_current_seq_no(config_folder, index_file=SeqIndexFile):
+    """
+    Return the current settings sequence number in config_folder, or -1
+    if there is no settings file. index_file must not live inside
+    config_folder, since writing it would move the folder's mtime.
+    """
+    try:
+        folder_mtime = os.stat(config_folder).st_mtime
+    except OSError:
+        return -1
+
+    index = _read_index(index_file)
+    if index is not None and \
+            index.get('configFolder') == config_folder and \
+            index.get('folderMtime') == folder_mtime:
+        settings_file = os.path.join(config_folder,
+                                     '{0}{1}'.format(index.get('seqNo'), SettingsSuffix))
+        try:
+            if os.stat(settings_file).st_mtime == index.get('settingsMtime'):
+                return int(index['seqNo'])
+        except (OSError, TypeError, ValueError):
+            pass
+
+    try:
+        seq_no, settings_mtime = scan_current_seq_no(config_folder)
+    except OSError:
+        return -1
+
+    if seq_no >= 0 and \
+            time.time() - max(folder_mtime, settings_mtime) > RacyWindowSeconds:
+        _write_index(index_file, {
+            'configFolder': config_folder,
+            'seqNo': seq_no,
+            'folderMtime': folder_mtime,
+            'settingsMtime': settings_mtime
+        })
+    return seq_no
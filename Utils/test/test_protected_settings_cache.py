@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Sample Extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import HandlerUtil as Util
+
+def mock_log(*args, **kwargs):
+    pass
+
+Thumbprint = "1BE9A13AA1321C7C515EF109746998BAB6D86FD1"
+
+class TestProtectedSettingsCache(unittest.TestCase):
+    def setUp(self):
+        self.lib_dir = tempfile.mkdtemp()
+        self.orig_lib_dir = Util.waagent.LibDir
+        self.orig_run_send_stdin = Util.waagent.RunSendStdin
+        self.orig_in_process_decrypt = Util._in_process_decrypt
+        Util.waagent.LoggerInit('/dev/null', '/dev/null')
+        Util.waagent.LibDir = self.lib_dir
+        Util._in_process_decrypt = False
+        Util._protected_settings_cache.clear()
+
+        cert = os.path.join(self.lib_dir, Thumbprint + '.crt')
+        pkey = os.path.join(self.lib_dir, Thumbprint + '.prv')
+        subprocess.check_call(['openssl', 'req', '-x509', '-nodes', '-batch',
+                               '-subj', '/CN=UnitTest', '-newkey', 'rsa:2048',
+                               '-keyout', pkey, '-out', cert],
+                              stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+        encrypt = subprocess.Popen(['openssl', 'smime', '-encrypt', '-outform', 'DER', cert],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        encrypted = encrypt.communicate(json.dumps({"password": "secret"}))[0]
+        self.settings = json.dumps({
+            "runtimeSettings": [{
+                "handlerSettings": {
+                    "protectedSettingsCertThumbprint": Thumbprint,
+                    "protectedSettings": base64.standard_b64encode(encrypted),
+                    "publicSettings": {}
+                }
+            }]
+        })
+
+        self.openssl_calls = 0
+        def counting_run_send_stdin(*args, **kwargs):
+            self.openssl_calls += 1
+            return self.orig_run_send_stdin(*args, **kwargs)
+        Util.waagent.RunSendStdin = counting_run_send_stdin
+
+    def tearDown(self):
+        Util.waagent.LibDir = self.orig_lib_dir
+        Util.waagent.RunSendStdin = self.orig_run_send_stdin
+        Util._in_process_decrypt = self.orig_in_process_decrypt
+        Util._protected_settings_cache.clear()
+        shutil.rmtree(self.lib_dir)
+
+    def test_decrypts_once(self):
+        hutil = Util.HandlerUtility(mock_log, mock_log, "UnitTest", "HandlerUtil.UnitTest", "0.0.1")
+        for i in range(3):
+            config = hutil._parse_config(self.settings)
+            handlerSettings = config['runtimeSettings'][0]['handlerSettings']
+            self.assertEquals(handlerSettings["protectedSettings"], {"password": "secret"})
+        self.assertEquals(self.openssl_calls, 1)
+
+    def test_failed_decryption_not_cached(self):
+        hutil = Util.HandlerUtility(mock_log, mock_log, "UnitTest", "HandlerUtil.UnitTest", "0.0.1")
+        os.remove(os.path.join(self.lib_dir, Thumbprint + '.prv'))
+        for i in range(2):
+            self.assertNotEquals(hutil._decrypt_protected_settings(Thumbprint, "AAAA"), None)
+        self.assertEquals(self.openssl_calls, 2)
+        self.assertEquals(len(Util._protected_settings_cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import SeqNoUtil
+
+
+class TestSeqNoUtil(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.config_dir = os.path.join(self.work_dir, 'config')
+        os.mkdir(self.config_dir)
+        self.index_file = os.path.join(self.work_dir, 'seqindex')
+        self.now = time.time()
+
+        self.scans = 0
+        self.orig_scan = SeqNoUtil.scan_current_seq_no
+        def counting_scan(config_folder):
+            self.scans += 1
+            return self.orig_scan(config_folder)
+        SeqNoUtil.scan_current_seq_no = counting_scan
+
+    def tearDown(self):
+        SeqNoUtil.scan_current_seq_no = self.orig_scan
+        shutil.rmtree(self.work_dir)
+
+    def _add_settings(self, seq_no, age):
+        path = os.path.join(self.config_dir, '{0}.settings'.format(seq_no))
+        with open(path, 'w') as f:
+            f.write('{}')
+        os.utime(path, (self.now - age, self.now - age))
+        os.utime(self.config_dir, (self.now - age, self.now - age))
+
+    def _get(self):
+        return SeqNoUtil.get_current_seq_no(self.config_dir, self.index_file)
+
+    def test_no_settings(self):
+        self.assertEquals(-1, self._get())
+        self.assertEquals(-1, SeqNoUtil.get_current_seq_no(os.path.join(self.work_dir, 'missing'),
+                                                           self.index_file))
+
+    def test_newest_mtime_wins(self):
+        self._add_settings(3, 300)
+        self._add_settings(1, 100)
+        self._add_settings(2, 200)
+        with open(os.path.join(self.config_dir, 'HandlerState'), 'w') as f:
+            f.write('Enabled')
+        os.utime(self.config_dir, (self.now - 50, self.now - 50))
+        self.assertEquals(1, self._get())
+
+    def test_index_fast_path(self):
+        for i in range(10):
+            self._add_settings(i, 100 - i)
+        self.assertEquals(9, self._get())
+        self.assertEquals(9, self._get())
+        self.assertEquals(9, self._get())
+        self.assertEquals(1, self.scans)
+
+    def test_rescan_on_change(self):
+        self._add_settings(0, 100)
+        self.assertEquals(0, self._get())
+        self._add_settings(1, 50)
+        self.assertEquals(1, self._get())
+        self.assertEquals(2, self.scans)
+
+        # rewriting the current settings file in place is noticed as well
+        os.utime(os.path.join(self.config_dir, '1.settings'), (self.now - 10, self.now - 10))
+        self.assertEquals(1, self._get())
+        self.assertEquals(3, self.scans)
+
+    def test_recent_change_not_indexed(self):
+        self._add_settings(0, 0)
+        self.assertEquals(0, self._get())
+        self.assertEquals(0, self._get())
+        self.assertEquals(2, self.scans)
+        self.assertFalse(os.path.exists(self.index_file))
+
+if __name__ == '__main__':
+    unittest.main()
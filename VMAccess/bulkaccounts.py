@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+#
+# VMAccess extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Provision a list of user accounts in one pass, e.g. with the protected
+settings
+{"users": [{"username": "alice", "ssh_key": "ssh-rsa AAAA..."},
+           {"username": "bob", "password": "...", "expiration": "2017-12-31"}]}
+
+Under a single lock: the missing accounts are created, all the passwords
+are set with one chpasswd, /etc/sudoers.d/waagent is rewritten once and
+each authorized_keys file is replaced atomically. Certificates are converted
+to ssh keys through pipes instead of temporary files. The caller restarts
+sshd once afterwards.
+"""
+
+import fcntl
+import os
+import pwd
+import re
+
+SudoersFile = '/etc/sudoers.d/waagent'
+LockFileName = 'vmaccess-accounts.lock'
+LoginDefsFile = '/etc/login.defs'
+SshKeyPrefixes = ('ssh-', 'ecdsa-')
+BeginCertificateTag = '-----BEGIN CERTIFICATE-----'
+
+
+class BulkAccounts(object):
+    def __init__(self, waagent, log, error):
+        self.waagent = waagent
+        self.log = log
+        self.error = error
+        self.lock_file = os.path.join(waagent.LibDir, LockFileName)
+
+    def parse_users(self, users):
+        """
+        Validate the "users" setting and return it as a list of dicts with
+        username, password, ssh_key and expiration. Empty passwords are
+        ignored, as for a single user.
+        """
+        if not isinstance(users, list):
+            raise Exception("users must be a list of accounts.")
+        parsed = []
+        names = set()
+        for user in users:
+            if not isinstance(user, dict) or not user.get('username'):
+                raise Exception("Every account in users must have a username.")
+            name = user['username']
+            if name in names:
+                raise Exception("User {0} is specified more than once.".format(name))
+            names.add(name)
+            password = user.get('password') or None
+            ssh_key = user.get('ssh_key') or None
+            if password is None and ssh_key is None:
+                raise Exception("No password or ssh_key is specified for {0}.".format(name))
+            parsed.append({'username': name,
+                           'password': password,
+                           'ssh_key': ssh_key,
+                           'expiration': user.get('expiration')})
+        return parsed
+
+    def provision(self, users):
+        """
+        Create or update all the accounts. Return a dict of username ->
+        error message for the accounts which failed.
+        """
+        failures = dict()
+        with open(self.lock_file, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                users = self._create_accounts(users, failures)
+                self._set_passwords(users, failures)
+                self._write_sudoers(users)
+                for user in users:
+                    if user['ssh_key'] and user['username'] not in failures:
+                        error = self._deploy_key(user['username'], user['ssh_key'])
+                        if error:
+                            failures[user['username']] = error
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return failures
+
+    def _uid_min(self):
+        try:
+            with open(LoginDefsFile, 'r') as f:
+                for line in f:
+                    if line.startswith('UID_MIN'):
+                        return int(line.split()[1])
+        except (IOError, OSError, ValueError, IndexError):
+            pass
+        return 100
+
+    def _create_accounts(self, users, failures):
+        existing = dict((entry.pw_name, entry) for entry in pwd.getpwall())
+        uid_min = self._uid_min()
+        accounts = []
+        for user in users:
+            name = user['username']
+            entry = existing.get(name)
+            if entry is not None:
+                if entry.pw_uid < uid_min:
+                    failures[name] = "Failed to set password for system user: " + name
+                    continue
+                self.log("{0} already exists. Will update it.".format(name))
+            else:
+                command = "useradd -m " + name
+                if user['expiration'] is not None:
+                    command += " -e " + user['expiration'].split('.')[0]
+                if self.waagent.Run(command):
+                    failures[name] = "Failed to create user account: " + name
+                    continue
+            accounts.append(user)
+        return accounts
+
+    def _set_passwords(self, users, failures):
+        with_password = [user for user in users if user['password'] is not None]
+        if not with_password:
+            return
+        distro = self.waagent.MyDistro
+        if not hasattr(distro, 'gen_password_hash'):
+            for user in with_password:
+                if distro.changePass(user['username'], user['password']):
+                    failures[user['username']] = "Failed to set the password"
+            return
+        crypt_id = self.waagent.Config.get("Provisioning.PasswordCryptId") or "6"
+        lines = []
+        for user in with_password:
+            password_hash = distro.gen_password_hash(user['password'], crypt_id, 10)
+            lines.append("{0}:{1}".format(user['username'], password_hash))
+        retcode, output = self.waagent.RunSendStdin("chpasswd -e", "\n".join(lines) + "\n", log_cmd=False)
+        if retcode != 0:
+            self.error("chpasswd failed: " + output)
+            for user in with_password:
+                failures[user['username']] = "Failed to set the password"
+
+    def _write_sudoers(self, users):
+        names = set(user['username'] for user in users)
+        if not names:
+            return
+        others = []
+        if os.path.isfile(SudoersFile):
+            for line in self.waagent.GetFileContents(SudoersFile).split("\n"):
+                match = re.match(r'^(\S+)\s', line)
+                if line and not (match and match.group(1) in names):
+                    others.append(line)
+        entries = []
+        for user in users:
+            if user['password'] is None:
+                entries.append(user['username'] + " ALL = (ALL) NOPASSWD: ALL")
+            else:
+                entries.append(user['username'] + " ALL = (ALL) ALL")
+        if not os.path.isdir(os.path.dirname(SudoersFile)):
+            os.mkdir(os.path.dirname(SudoersFile))
+            self.waagent.AppendFileContents('/etc/sudoers', '\n#includedir /etc/sudoers.d\n')
+        self.waagent.ReplaceFileContentsAtomic(SudoersFile, "\n".join(entries + others) + "\n")
+        os.chmod(SudoersFile, 0o440)
+
+    def _to_ssh_key(self, cert_txt):
+        """
+        Convert a PEM certificate to an ssh public key without temp files.
+        """
+        if BeginCertificateTag not in cert_txt:
+            cert_txt = "{0}\n{1}\n-----END CERTIFICATE-----\n".format(BeginCertificateTag, cert_txt.strip())
+        retcode, pub_key = self.waagent.RunSendStdin(self.waagent.Openssl + " x509 -noout -pubkey", cert_txt)
+        if retcode != 0:
+            return None
+        retcode, ssh_key = self.waagent.RunSendStdin("ssh-keygen -i -m PKCS8 -f /dev/stdin", pub_key)
+        if retcode != 0 or not ssh_key.startswith(SshKeyPrefixes):
+            return None
+        return ssh_key
+
+    def _deploy_key(self, name, key_txt):
+        key_txt = key_txt.strip()
+        if not key_txt.startswith(SshKeyPrefixes):
+            key_txt = self._to_ssh_key(key_txt)
+            if key_txt is None:
+                return "Failed to generate public key file."
+            key_txt = key_txt.strip()
+        ssh_dir = os.path.join(self.waagent.MyDistro.GetHome(), name, '.ssh')
+        pub_path = os.path.join(ssh_dir, 'authorized_keys')
+        self.waagent.CreateDir(ssh_dir, name, 0o700)
+        keys = []
+        if os.path.isfile(pub_path):
+            keys = [line for line in self.waagent.GetFileContents(pub_path).split("\n") if line]
+        if key_txt not in keys:
+            keys.append(key_txt)
+        self.waagent.ReplaceFileContentsAtomic(pub_path, "\n".join(keys) + "\n")
+        os.chmod(pub_path, 0o600)
+        self.waagent.MyDistro.setSelinuxContext(pub_path, 'unconfined_u:object_r:ssh_home_t:s0')
+        self.waagent.ChangeOwner(pub_path, name)
+        return None
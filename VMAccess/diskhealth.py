@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+#
+# VMAccess extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Check and repair only the filesystems that were asked for.
+
+The requested disk is resolved through the mount table and fstab. Each
+filesystem is checked with its own fsck. Filesystems on independent
+physical disks are checked in parallel; those sharing a disk are checked
+one after another, as fsck -A does. An ext2/3/4 filesystem whose superblock
+says it is clean is skipped without running fsck.
+"""
+
+import os
+import struct
+import threading
+
+MountsFile = '/proc/mounts'
+FstabFile = '/etc/fstab'
+SysBlockDir = '/sys/class/block'
+
+# ext2/3/4 superblock
+ExtSuperblockOffset = 1024
+ExtMagic = 0xEF53
+ExtStateValid = 0x0001      # Cleanly unmounted
+ExtStateError = 0x0002      # Errors detected
+ExtFsTypes = ('ext2', 'ext3', 'ext4')
+
+# Filesystems fsck has nothing to do with
+SkippedFsTypes = ('swap', 'proc', 'sysfs', 'devpts', 'tmpfs', 'devtmpfs', 'nfs', 'nfs4', 'cifs', 'none')
+
+# fsck exit codes
+FsckOk = 0
+FsckCorrected = 1
+FsckUncorrected = 4
+FsckOperationalError = 8
+
+
+class Filesystem(object):
+    def __init__(self, device, mount_point, fs_type, pass_no=1, mounted=False):
+        self.device = device
+        self.mount_point = mount_point
+        self.fs_type = fs_type
+        self.pass_no = pass_no
+        self.mounted = mounted
+
+    def __repr__(self):
+        return '{0} ({1})'.format(self.device, self.mount_point)
+
+
+def _unescape(field):
+    # The mount table escapes spaces and tabs in paths as octal
+    return field.replace('\\040', ' ').replace('\\011', '\t')
+
+
+def read_mounts(mounts_file=MountsFile):
+    filesystems = []
+    try:
+        with open(mounts_file, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and fields[0].startswith('/dev/'):
+                    filesystems.append(Filesystem(resolve_device(_unescape(fields[0])), _unescape(fields[1]),
+                                                  fields[2], mounted=True))
+    except (IOError, OSError):
+        pass
+    return filesystems
+
+
+def read_fstab(fstab_file=FstabFile):
+    filesystems = []
+    try:
+        with open(fstab_file, 'r') as f:
+            for line in f:
+                fields = line.split('#', 1)[0].split()
+                if len(fields) < 3 or fields[2] in SkippedFsTypes:
+                    continue
+                pass_no = 0
+                if len(fields) >= 6 and fields[5].isdigit():
+                    pass_no = int(fields[5])
+                filesystems.append(Filesystem(resolve_device(_unescape(fields[0])), _unescape(fields[1]),
+                                              fields[2], pass_no))
+    except (IOError, OSError):
+        pass
+    return filesystems
+
+
+def resolve_device(spec):
+    """
+    Return the /dev path of an fstab device spec (path, UUID=, LABEL=,
+    PARTUUID=, PARTLABEL=).
+    """
+    for tag, by_dir in (('UUID=', 'by-uuid'), ('LABEL=', 'by-label'),
+                        ('PARTUUID=', 'by-partuuid'), ('PARTLABEL=', 'by-partlabel')):
+        if spec.startswith(tag):
+            spec = os.path.join('/dev/disk', by_dir, spec[len(tag):].strip('"'))
+            break
+    if spec.startswith('/dev/'):
+        return os.path.realpath(spec)
+    return spec
+
+
+def physical_disks(device, sys_block_dir=SysBlockDir):
+    """
+    Return the names of the physical disks a block device lives on: the
+    parent disk of a partition, or the disks under a device-mapper/md
+    device.
+    """
+    name = os.path.basename(os.path.realpath(device))
+    path = os.path.join(sys_block_dir, name)
+    if not os.path.exists(path):
+        return set([name])
+    slaves_dir = os.path.join(path, 'slaves')
+    slaves = os.listdir(slaves_dir) if os.path.isdir(slaves_dir) else []
+    if slaves:
+        disks = set()
+        for slave in slaves:
+            disks.update(physical_disks(slave, sys_block_dir))
+        return disks
+    if os.path.exists(os.path.join(path, 'partition')):
+        return set([os.path.basename(os.path.dirname(os.path.realpath(path)))])
+    return set([name])
+
+
+def read_ext_state(device):
+    """
+    Return the state field of an ext2/3/4 superblock, or None if the device
+    does not hold an ext filesystem or can't be read.
+    """
+    try:
+        with open(device, 'rb') as f:
+            f.seek(ExtSuperblockOffset)
+            superblock = f.read(64)
+    except (IOError, OSError):
+        return None
+    if len(superblock) < 60:
+        return None
+    magic, state = struct.unpack_from('<HH', superblock, 56)
+    if magic != ExtMagic:
+        return None
+    return state
+
+
+def group_by_disk(filesystems, sys_block_dir=SysBlockDir):
+    """
+    Split filesystems into groups which share no physical disk.
+    """
+    groups = []
+    for fs in filesystems:
+        disks = physical_disks(fs.device, sys_block_dir)
+        members = [fs]
+        for group in [g for g in groups if g[0] & disks]:
+            groups.remove(group)
+            disks = disks | group[0]
+            members = group[1] + members
+        groups.append((disks, members))
+    return [sorted(members, key=lambda fs: fs.pass_no) for disks, members in groups]
+
+
+class DiskHealth(object):
+    def __init__(self, waagent, progress=None):
+        self.waagent = waagent
+        self.progress = progress
+        self.lock = threading.Lock()
+        self.done_count = 0
+        self.total_count = 0
+
+    def _report(self, message):
+        self.waagent.Log(message)
+        if self.progress is not None:
+            self.progress(message)
+
+    def resolve(self, disk_name=None, skip_root=False):
+        """
+        Return the filesystems disk_name refers to: a mount point (with or
+        without the leading /) or a device. Without disk_name, every fstab
+        entry fsck -A would check.
+        """
+        mounts = read_mounts()
+        fstab = read_fstab()
+        mounted = dict((fs.device, fs) for fs in mounts)
+        if disk_name:
+            names = set([disk_name, '/' + disk_name.lstrip('/'), '/dev/' + disk_name.lstrip('/')])
+            names.update([resolve_device(name) for name in list(names)])
+            candidates = [fs for fs in mounts + fstab if fs.device in names or fs.mount_point in names]
+        else:
+            candidates = [fs for fs in fstab if fs.pass_no > 0]
+            if skip_root:
+                candidates = [fs for fs in candidates if fs.mount_point != '/']
+        filesystems = []
+        devices = set()
+        for fs in candidates:
+            if fs.device in devices or not fs.device.startswith('/dev/'):
+                continue
+            devices.add(fs.device)
+            current = mounted.get(fs.device)
+            fs.mounted = current is not None
+            if current is not None and fs.fs_type == 'auto':
+                fs.fs_type = current.fs_type
+            filesystems.append(fs)
+        return filesystems
+
+    def check(self, disk_name=None):
+        """
+        Check the filesystems of disk_name, or all of them, and return the
+        worst fsck exit code.
+        """
+        filesystems = self.resolve(disk_name)
+        if disk_name and not filesystems:
+            self._report("No filesystem found for disk: {0}".format(disk_name))
+            return FsckOperationalError
+        return self._run(filesystems)
+
+    def repair(self, disk_name=None):
+        """
+        Unmount the filesystems of disk_name (all but root without it),
+        repair and remount them. Return the worst fsck exit code.
+        """
+        filesystems = self.resolve(disk_name, skip_root=True)
+        if not filesystems:
+            self._report("No filesystem found for disk: {0}".format(disk_name))
+            return FsckOperationalError
+        remount = []
+        for fs in filesystems:
+            if not fs.mounted:
+                continue
+            if self.waagent.Run("umount -f '{0}'".format(fs.mount_point), chk_err=False) == 0:
+                fs.mounted = False
+                remount.append(fs)
+            else:
+                self._report("Failed to unmount disk: {0}".format(fs.mount_point))
+        retcode = self._run(filesystems)
+        for fs in remount:
+            if self.waagent.Run("mount '{0}'".format(fs.mount_point), chk_err=False) != 0:
+                self._report("Failed to remount disk: {0}".format(fs.mount_point))
+        return retcode
+
+    def _needs_fsck(self, fs):
+        if fs.fs_type not in ExtFsTypes and fs.fs_type != 'auto':
+            # Only ext records whether it is clean; a mounted xfs/btrfs
+            # can't be checked offline either
+            return not fs.mounted
+        state = read_ext_state(fs.device)
+        if state is None:
+            return not fs.mounted
+        if state & ExtStateError:
+            return True
+        # A mounted ext filesystem is never marked clean
+        return not fs.mounted and not state & ExtStateValid
+
+    def _check_one(self, fs):
+        if not self._needs_fsck(fs):
+            retcode = FsckOk
+            result = "clean, skipped"
+        elif fs.mounted:
+            # The superblock reports errors, but fsck can't fix a mounted filesystem
+            retcode = FsckUncorrected
+            result = "has errors and is mounted, repair_disk is needed"
+        else:
+            retcode, output = self.waagent.RunGetOutput("fsck -y '{0}'".format(fs.device), chk_err=False)
+            result = "fsck exit code {0}".format(retcode)
+        with self.lock:
+            self.done_count += 1
+            self._report("{0}: {1} ({2}/{3})".format(fs, result, self.done_count, self.total_count))
+        return retcode
+
+    def _run(self, filesystems):
+        self.done_count = 0
+        self.total_count = len(filesystems)
+        results = []
+
+        def check_group(group):
+            for fs in group:
+                retcode = self._check_one(fs)
+                with self.lock:
+                    results.append(retcode)
+
+        threads = [threading.Thread(target=check_group, args=(group,)) for group in group_by_disk(filesystems)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return max(results) if results else FsckOk
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#
+# VMAccess extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Reconcile the firewall with a set of rules to delete and rules to insert.
+
+The ruleset is read once, the changes are computed from it and applied in a
+single transaction: iptables-restore --noflush for iptables (including the
+iptables-nft compatibility layer), or nft -f when only nftables is
+installed. One more read verifies the result.
+"""
+
+import re
+
+IptablesSaveCmd = 'iptables-save -t filter'
+IptablesRestoreCmd = 'iptables-restore --noflush'
+NftListCmd = 'nft -a list ruleset'
+NftApplyCmd = 'nft -f -'
+
+# iptables chain -> nftables hook of the base chains it corresponds to
+ChainHooks = {
+    'INPUT': 'input',
+    'OUTPUT': 'output',
+    'FORWARD': 'forward',
+}
+
+NftFamilies = ('ip', 'ip6', 'inet')
+
+
+def parse_iptables_save(dump):
+    """
+    Return the rules of the filter table as a list of "CHAIN spec" strings,
+    in the order of iptables-save.
+    """
+    rules = []
+    table = None
+    for line in dump.split('\n'):
+        line = line.strip()
+        if line.startswith('*'):
+            table = line[1:]
+        elif table == 'filter' and line.startswith('-A '):
+            rules.append(line[3:])
+    return rules
+
+
+def _iptables_rule_matches(rule, pattern):
+    # iptables-save prints REJECT with its "--reject-with ..." option, even
+    # the default icmp-port-unreachable one
+    return rule == pattern or (pattern.endswith(' -j REJECT') and
+                               rule.startswith(pattern + ' --reject-with '))
+
+
+def plan_iptables(rules, to_delete, to_insert):
+    """
+    Return the iptables-restore lines which delete every copy of the rules
+    in to_delete and insert the rules of to_insert which are missing.
+    """
+    lines = []
+    remaining = []
+    for rule in rules:
+        if any(_iptables_rule_matches(rule, pattern) for pattern in to_delete):
+            lines.append('-D ' + rule)
+        else:
+            remaining.append(rule)
+    for rule in to_insert:
+        if rule not in remaining:
+            remaining.append(rule)
+            lines.append('-I ' + rule)
+    return lines
+
+
+def _nft_normalize(rule):
+    # Counters change on every read and don't belong to the rule's identity
+    return re.sub(r'\s*counter packets \d+ bytes \d+', '', rule).strip()
+
+
+def iptables_rule_to_nft(rule):
+    """
+    Translate "CHAIN -p tcp -m tcp --dport N -j TARGET" into
+    (chain, "tcp dport N target"). Return None for anything else.
+    """
+    match = re.match(r'^(\w+) -p (tcp|udp) -m \2 --([sd]port) (\d+) -j (ACCEPT|DROP|REJECT)$', rule)
+    if match is None:
+        return None
+    chain, proto, port_type, port, target = match.groups()
+    return chain, '{0} {1} {2} {3}'.format(proto, port_type, port, target.lower())
+
+
+def parse_nft_ruleset(text):
+    """
+    Parse "nft -a list ruleset" into a list of base chains:
+    {'family', 'table', 'chain', 'hook', 'rules': [(rule, handle)]}
+    """
+    chains = []
+    # Open blocks: ('table', (family, name)), ('chain', chain) or (None, None)
+    blocks = []
+    for line in text.split('\n'):
+        line = line.strip()
+        # Tables and chains are listed as "table inet filter { # handle 1"
+        block = re.sub(r'\s*# handle \d+$', '', line)
+        if block.endswith('{') and '}' not in block:
+            table_match = re.match(r'^table (\S+) (\S+) \{', block)
+            chain_match = re.match(r'^chain (\S+) \{', block)
+            if table_match and not blocks:
+                blocks.append(('table', table_match.groups()))
+            elif chain_match and len(blocks) == 1:
+                family, table = blocks[0][1]
+                chain = {'family': family, 'table': table, 'chain': chain_match.group(1),
+                         'hook': None, 'rules': []}
+                chains.append(chain)
+                blocks.append(('chain', chain))
+            else:
+                blocks.append((None, None))
+            continue
+        if line == '}':
+            if blocks:
+                blocks.pop()
+            continue
+        if not blocks or blocks[-1][0] != 'chain':
+            continue
+        chain = blocks[-1][1]
+        match = re.match(r'^type \S+ hook (\S+) ', line)
+        if match:
+            chain['hook'] = match.group(1)
+            continue
+        match = re.match(r'^(.*\S)\s+# handle (\d+)$', line)
+        if match:
+            chain['rules'].append((_nft_normalize(match.group(1)), match.group(2)))
+    return [c for c in chains if c['hook'] is not None and c['family'] in NftFamilies]
+
+
+def _nft_rule_matches(rule, patterns):
+    for pattern in patterns:
+        # "reject" may carry a "with ..." clause
+        if rule == pattern or (pattern.endswith(' reject') and rule.startswith(pattern + ' with ')):
+            return True
+    return False
+
+
+def plan_nft(chains, to_delete, to_insert):
+    """
+    Apply the iptables rules in to_delete/to_insert to the nftables base
+    chains with the corresponding hook. Return the nft commands.
+    """
+    def by_hook(rules):
+        translated = dict()
+        for rule in rules:
+            nft_rule = iptables_rule_to_nft(rule)
+            if nft_rule is not None and nft_rule[0] in ChainHooks:
+                translated.setdefault(ChainHooks[nft_rule[0]], []).append(nft_rule[1])
+        return translated
+
+    delete_by_hook = by_hook(to_delete)
+    insert_by_hook = by_hook(to_insert)
+    commands = []
+    for chain in chains:
+        name = ' '.join([chain['family'], chain['table'], chain['chain']])
+        deletes = delete_by_hook.get(chain['hook'], [])
+        existing = set()
+        for rule, handle in chain['rules']:
+            if _nft_rule_matches(rule, deletes):
+                commands.append('delete rule {0} handle {1}'.format(name, handle))
+            else:
+                existing.add(rule)
+        for rule in insert_by_hook.get(chain['hook'], []):
+            if rule not in existing:
+                existing.add(rule)
+                commands.append('insert rule {0} {1}'.format(name, rule))
+    return commands
+
+
+class FirewallReconciler(object):
+    def __init__(self, waagent):
+        self.waagent = waagent
+
+    def reconcile(self, to_delete, to_insert):
+        """
+        Delete all the copies of the rules in to_delete and insert the
+        missing rules of to_insert, atomically. Rules are given in
+        iptables-save syntax, e.g. "INPUT -p tcp -m tcp --dport 22 -j DROP".
+        Return True if the firewall is in the desired state afterwards.
+        """
+        retcode, dump = self.waagent.RunGetOutput(IptablesSaveCmd, chk_err=False)
+        if retcode == 0:
+            return self._reconcile_iptables(parse_iptables_save(dump), to_delete, to_insert)
+        retcode, ruleset = self.waagent.RunGetOutput(NftListCmd, chk_err=False)
+        if retcode == 0:
+            return self._reconcile_nft(parse_nft_ruleset(ruleset), to_delete, to_insert)
+        self.waagent.Log("Neither iptables nor nft is available, skip the firewall rules.")
+        return True
+
+    def _reconcile_iptables(self, rules, to_delete, to_insert):
+        lines = plan_iptables(rules, to_delete, to_insert)
+        if not lines:
+            return True
+        self.waagent.Log("Apply firewall rules: " + "; ".join(lines))
+        retcode, output = self.waagent.RunSendStdin(IptablesRestoreCmd,
+                                                    '\n'.join(['*filter'] + lines + ['COMMIT', '']))
+        if retcode != 0:
+            self.waagent.Error("iptables-restore failed: " + output)
+        retcode, dump = self.waagent.RunGetOutput(IptablesSaveCmd, chk_err=False)
+        return retcode == 0 and not plan_iptables(parse_iptables_save(dump), to_delete, to_insert)
+
+    def _reconcile_nft(self, chains, to_delete, to_insert):
+        commands = plan_nft(chains, to_delete, to_insert)
+        if not commands:
+            return True
+        self.waagent.Log("Apply firewall rules: " + "; ".join(commands))
+        retcode, output = self.waagent.RunSendStdin(NftApplyCmd, '\n'.join(commands + ['']))
+        if retcode != 0:
+            self.waagent.Error("nft failed: " + output)
+        retcode, ruleset = self.waagent.RunGetOutput(NftListCmd, chk_err=False)
+        return retcode == 0 and not plan_nft(parse_nft_ruleset(ruleset), to_delete, to_insert)
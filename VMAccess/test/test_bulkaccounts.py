@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import env
+import bulkaccounts
+from Utils.WAAgentUtil import waagent
+
+
+class TestBulkAccounts(unittest.TestCase):
+    def setUp(self):
+        self.bulk_accounts = bulkaccounts.BulkAccounts(waagent, lambda msg: None, lambda msg: None)
+
+    def test_parse_users(self):
+        users = self.bulk_accounts.parse_users([
+            {'username': 'alice', 'ssh_key': 'ssh-rsa AAAA'},
+            {'username': 'bob', 'password': '', 'ssh_key': 'ssh-rsa BBBB', 'expiration': '2020-01-01'}])
+        self.assertEqual(['alice', 'bob'], [user['username'] for user in users])
+        self.assertEqual(None, users[1]['password'])
+        self.assertEqual('2020-01-01', users[1]['expiration'])
+
+    def test_parse_users_invalid(self):
+        self.assertRaises(Exception, self.bulk_accounts.parse_users, {'username': 'alice'})
+        self.assertRaises(Exception, self.bulk_accounts.parse_users, [{'password': 'x'}])
+        self.assertRaises(Exception, self.bulk_accounts.parse_users, [{'username': 'alice'}])
+        self.assertRaises(Exception, self.bulk_accounts.parse_users,
+                          [{'username': 'alice', 'password': 'x'}, {'username': 'alice', 'password': 'y'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
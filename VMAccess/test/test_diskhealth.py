@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import env
+import diskhealth
+
+
+class TestDiskHealth(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_block(self, path, partition=False):
+        os.makedirs(path)
+        if partition:
+            open(os.path.join(path, 'partition'), 'w').close()
+
+    def test_group_by_disk(self):
+        sys_block = os.path.join(self.tmp_dir, 'class')
+        devices = os.path.join(self.tmp_dir, 'devices')
+        os.makedirs(sys_block)
+        for disk, parts in (('sdc', ['sdc1', 'sdc2']), ('sdd', ['sdd1'])):
+            for part in parts:
+                self._make_block(os.path.join(devices, disk, part), partition=True)
+                os.symlink(os.path.join(devices, disk, part), os.path.join(sys_block, part))
+        self._make_block(os.path.join(sys_block, 'dm-0', 'slaves', 'sdd1'))
+
+        filesystems = [diskhealth.Filesystem('/dev/sdc1', '/data1', 'ext4', 2),
+                       diskhealth.Filesystem('/dev/sdd1', '/data3', 'ext4', 2),
+                       diskhealth.Filesystem('/dev/sdc2', '/data2', 'ext4', 1),
+                       diskhealth.Filesystem('/dev/dm-0', '/data4', 'ext4', 2)]
+        groups = diskhealth.group_by_disk(filesystems, sys_block)
+        groups = sorted([[fs.mount_point for fs in group] for group in groups])
+        self.assertEqual([['/data2', '/data1'], ['/data3', '/data4']], groups)
+
+    def test_read_ext_state(self):
+        image = os.path.join(self.tmp_dir, 'image')
+        with open(image, 'wb') as f:
+            f.write(b'\0' * (diskhealth.ExtSuperblockOffset + 56))
+            f.write(struct.pack('<HH', diskhealth.ExtMagic, diskhealth.ExtStateValid))
+            f.write(b'\0' * 64)
+        self.assertEqual(diskhealth.ExtStateValid, diskhealth.read_ext_state(image))
+
+        with open(image, 'wb') as f:
+            f.write(b'\0' * 4096)
+        self.assertEqual(None, diskhealth.read_ext_state(image))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import env
+import firewall
+
+IptablesDump = """# Generated by iptables-save v1.6.0
+*filter
+:INPUT ACCEPT [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+-A INPUT -p tcp -m tcp --dport 22 -j DROP
+-A INPUT -s 10.0.0.0/8 -p tcp -m tcp --dport 22 -j DROP
+-A INPUT -p tcp -m tcp --dport 22 -j DROP
+-A OUTPUT -p tcp -m tcp --dport 22 -j ACCEPT
+COMMIT
+*nat
+-A PREROUTING -p tcp -m tcp --dport 22 -j DROP
+COMMIT
+"""
+
+# As printed by iptables-save after "iptables -A INPUT -p tcp --dport 22 -j REJECT"
+IptablesRejectDump = """# Generated by iptables-save v1.8.4 on Mon Jan  6 10:12:01 2020
+*filter
+:INPUT ACCEPT [1523:112024]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [1187:140311]
+-A INPUT -p tcp -m tcp --dport 22 -j REJECT --reject-with icmp-port-unreachable
+-A INPUT -p tcp -m tcp --dport 22 -j REJECT --reject-with tcp-reset
+-A OUTPUT -p tcp -m tcp --sport 22 -j REJECT --reject-with icmp-port-unreachable
+-A OUTPUT -p tcp -m tcp --dport 2222 -j REJECT --reject-with icmp-port-unreachable
+COMMIT
+# Completed on Mon Jan  6 10:12:01 2020
+"""
+
+NftRuleset = """table inet filter { # handle 1
+	set blocked { # handle 2
+		type ipv4_addr
+		elements = { 10.0.0.1 }
+	}
+	chain input { # handle 3
+		type filter hook input priority filter; policy accept;
+		tcp dport 22 counter packets 12 bytes 720 drop # handle 4
+		tcp dport 22 reject with tcp reset # handle 5
+		tcp dport 80 drop # handle 6
+	}
+	chain helper { # handle 7
+		tcp dport 22 drop # handle 8
+	}
+}
+"""
+
+ToDelete = ['INPUT -p tcp -m tcp --dport 22 -j DROP',
+            'INPUT -p tcp -m tcp --dport 22 -j REJECT']
+ToInsert = ['INPUT -p tcp -m tcp --dport 22 -j ACCEPT',
+            'OUTPUT -p tcp -m tcp --dport 22 -j ACCEPT']
+
+
+class TestFirewall(unittest.TestCase):
+    def test_plan_iptables(self):
+        rules = firewall.parse_iptables_save(IptablesDump)
+        self.assertEqual(4, len(rules))
+        lines = firewall.plan_iptables(rules, ToDelete, ToInsert)
+        self.assertEqual(['-D INPUT -p tcp -m tcp --dport 22 -j DROP',
+                          '-D INPUT -p tcp -m tcp --dport 22 -j DROP',
+                          '-I INPUT -p tcp -m tcp --dport 22 -j ACCEPT'], lines)
+
+    def test_plan_iptables_converged(self):
+        rules = ['INPUT -p tcp -m tcp --dport 22 -j ACCEPT',
+                 'OUTPUT -p tcp -m tcp --dport 22 -j ACCEPT']
+        self.assertEqual([], firewall.plan_iptables(rules, ToDelete, ToInsert))
+
+    def test_plan_iptables_reject_with(self):
+        rules = firewall.parse_iptables_save(IptablesRejectDump)
+        to_delete = ToDelete + ['OUTPUT -p tcp -m tcp --sport 22 -j REJECT']
+        lines = firewall.plan_iptables(rules, to_delete, ToInsert)
+        self.assertEqual(['-D INPUT -p tcp -m tcp --dport 22 -j REJECT --reject-with icmp-port-unreachable',
+                          '-D INPUT -p tcp -m tcp --dport 22 -j REJECT --reject-with tcp-reset',
+                          '-D OUTPUT -p tcp -m tcp --sport 22 -j REJECT --reject-with icmp-port-unreachable',
+                          '-I INPUT -p tcp -m tcp --dport 22 -j ACCEPT',
+                          '-I OUTPUT -p tcp -m tcp --dport 22 -j ACCEPT'], lines)
+
+    def test_plan_nft(self):
+        chains = firewall.parse_nft_ruleset(NftRuleset)
+        self.assertEqual(1, len(chains))
+        self.assertEqual('input', chains[0]['hook'])
+        commands = firewall.plan_nft(chains, ToDelete, ToInsert)
+        self.assertEqual(['delete rule inet filter input handle 4',
+                          'delete rule inet filter input handle 5',
+                          'insert rule inet filter input tcp dport 22 accept'], commands)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,6 +26,9 @@ import time
 import traceback
 
 import Utils.HandlerUtil as Util
+from bulkaccounts import BulkAccounts
+from diskhealth import DiskHealth, FsckCorrected
+from firewall import FirewallReconciler
 from waagentloader import load_waagent
 
 waagent = load_waagent()
@@ -106,6 +109,8 @@ def enable():
 
         _set_user_account_pub_key(protect_settings, hutil)
 
+        _set_user_accounts(protect_settings, hutil)
+
         if _is_sshd_config_modified(protect_settings):
             waagent.MyDistro.restartSshService()
 
@@ -134,7 +139,14 @@ def _forcibly_reset_chap(hutil):
 
 def _is_sshd_config_modified(protected_settings):
     result = protected_settings.get('reset_ssh') or protected_settings.get('password')
-    return result is not None
+    return result is not None or _has_user_with_password(protected_settings)
+
+
+def _has_user_with_password(protected_settings):
+    users = protected_settings.get('users')
+    if not isinstance(users, list):
+        return False
+    return any(isinstance(user, dict) and user.get('password') for user in users)
 
 
 def uninstall():
@@ -176,13 +188,13 @@ def _remove_user_account(user_name, hutil):
 
 
 def _set_user_account_pub_key(protect_settings, hutil):
-    ovf_xml = waagent.GetFileContents('/var/lib/waagent/ovf-env.xml')
-    ovf_env = waagent.OvfEnv().Parse(ovf_xml)
-
     # user name must be provided if set ssh key or password
     if not protect_settings or not protect_settings.has_key('username'):
         return
 
+    ovf_xml = waagent.GetFileContents('/var/lib/waagent/ovf-env.xml')
+    ovf_env = waagent.OvfEnv().Parse(ovf_xml)
+
     user_name = protect_settings['username']
     user_pass = protect_settings.get('password')
     cert_txt = protect_settings.get('ssh_key')
@@ -271,6 +283,37 @@ def _set_user_account_pub_key(protect_settings, hutil):
                                       message="(02100)Failed to reset ssh key.")
 
 
+def _set_user_accounts(protect_settings, hutil):
+    if not protect_settings or not protect_settings.get('users'):
+        return
+
+    bulk_accounts = BulkAccounts(waagent, hutil.log, hutil.error)
+    try:
+        users = bulk_accounts.parse_users(protect_settings['users'])
+    except Exception:
+        waagent.AddExtensionEvent(name=hutil.get_name(),
+                                  op=waagent.WALAEventOperation.Enable,
+                                  isSuccess=False,
+                                  message="(03003)Argument error, invalid users")
+        raise
+
+    failures = bulk_accounts.provision(users)
+    if any(user['password'] is not None and user['username'] not in failures for user in users):
+        _allow_password_auth()
+
+    waagent.AddExtensionEvent(name=hutil.get_name(), op="scenario", isSuccess=True,
+                              message="create-users:{0}".format(len(users)))
+    if failures:
+        err_msg = "Failed to provision {0} of {1} users".format(len(failures), len(users))
+        waagent.AddExtensionEvent(name=hutil.get_name(),
+                                  op=waagent.WALAEventOperation.Enable,
+                                  isSuccess=False,
+                                  message="(02103)" + err_msg)
+        raise Exception(err_msg + ": " + "; ".join(
+            "{0}: {1}".format(name, error) for name, error in sorted(failures.items())))
+    hutil.log("Succeeded in provisioning {0} users.".format(len(users)))
+
+
 def _get_other_sudoers(userName):
     sudoersFile = '/etc/sudoers.d/waagent'
     if not os.path.isfile(sudoersFile):
@@ -384,30 +427,26 @@ def _save_cert_str_as_file(cert_txt, file_name):
 
 
 def _open_ssh_port():
-    _del_rule_if_exists('INPUT -p tcp -m tcp --dport 22 -j DROP')
-    _del_rule_if_exists('INPUT -p tcp -m tcp --dport 22 -j REJECT')
-    _del_rule_if_exists('INPUT -p -j DROP')
-    _del_rule_if_exists('INPUT -p -j REJECT')
-    _insert_rule_if_not_exists('INPUT -p tcp -m tcp --dport 22 -j ACCEPT')
-
-    _del_rule_if_exists('OUTPUT -p tcp -m tcp --sport 22 -j DROP')
-    _del_rule_if_exists('OUTPUT -p tcp -m tcp --sport 22 -j REJECT')
-    _del_rule_if_exists('OUTPUT -p -j DROP')
-    _del_rule_if_exists('OUTPUT -p -j REJECT')
-    _insert_rule_if_not_exists('OUTPUT -p tcp -m tcp --dport 22 -j ACCEPT')
+    to_delete = ['INPUT -p tcp -m tcp --dport 22 -j DROP',
+                 'INPUT -p tcp -m tcp --dport 22 -j REJECT',
+                 'INPUT -p -j DROP',
+                 'INPUT -p -j REJECT',
+                 'OUTPUT -p tcp -m tcp --sport 22 -j DROP',
+                 'OUTPUT -p tcp -m tcp --sport 22 -j REJECT',
+                 'OUTPUT -p -j DROP',
+                 'OUTPUT -p -j REJECT']
+    to_insert = ['INPUT -p tcp -m tcp --dport 22 -j ACCEPT',
+                 'OUTPUT -p tcp -m tcp --dport 22 -j ACCEPT']
+    if not FirewallReconciler(waagent).reconcile(to_delete, to_insert):
+        waagent.Error("The firewall rules for the ssh port could not be verified.")
 
 
 def _del_rule_if_exists(rule_string):
-    cmd_result = waagent.RunGetOutput("iptables-save")
-    while cmd_result[0] == 0 and (rule_string in cmd_result[1]):
-        waagent.Run("iptables -D %s" % rule_string)
-        cmd_result = waagent.RunGetOutput("iptables-save")
+    FirewallReconciler(waagent).reconcile([rule_string], [])
 
 
 def _insert_rule_if_not_exists(rule_string):
-    cmd_result = waagent.RunGetOutput("iptables-save")
-    if cmd_result[0] == 0 and (rule_string not in cmd_result[1]):
-        waagent.Run("iptables -I %s" % rule_string)
+    FirewallReconciler(waagent).reconcile([], [rule_string])
 
 
 def check_and_repair_disk(hutil):
@@ -425,7 +464,7 @@ def check_and_repair_disk(hutil):
 
         if check_disk:
             waagent.AddExtensionEvent(name=hutil.get_name(), op="scenario", isSuccess=True, message="check_disk")
-            outretcode = _fsck_check(hutil)
+            outretcode = _fsck_check(hutil, disk_name)
             hutil.log("Successfully checked disk")
             return outretcode
 
@@ -436,9 +475,15 @@ def check_and_repair_disk(hutil):
             return outdata
 
 
-def _fsck_check(hutil):
+def _get_disk_health(hutil):
+    def progress(message):
+        hutil.do_status_report('Enable', 'transitioning', '0', message)
+    return DiskHealth(waagent, progress)
+
+
+def _fsck_check(hutil, disk_name=None):
     try:
-        retcode = waagent.Run("fsck -As -y")
+        retcode = _get_disk_health(hutil).check(disk_name)
         if retcode > 0:
             hutil.log(retcode)
             raise Exception("Disk check was not successful")
@@ -451,16 +496,11 @@ def _fsck_check(hutil):
 
 
 def _fsck_repair(hutil, disk_name):
-    # first unmount disks and loop devices lazy + forced
+    # unmount only the requested disks, repair them and mount them back
     try:
-        cmd_result = waagent.Run("umount -f /%s" % disk_name)
-        if cmd_result != 0:
-            # Fail fast
-            hutil.log("Failed to unmount disk: %s" % disk_name)
-            # run repair
-            retcode = waagent.Run("fsck -AR -y")
-            hutil.log("Ran fsck with return code: %d" % retcode)
-        if retcode == 0:
+        retcode = _get_disk_health(hutil).repair(disk_name)
+        hutil.log("Ran fsck with return code: %d" % retcode)
+        if retcode <= FsckCorrected:
             retcode, output = waagent.RunGetOutput("mount")
             hutil.log(output)
             return output
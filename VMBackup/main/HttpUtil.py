@@ -28,14 +28,17 @@ import subprocess
 import sys
 from common import CommonVariables
 from subprocess import *
+from Utils import WAAgentUtil
 from Utils.WAAgentUtil import waagent
 import sys
 
 class HttpUtil(object):
     """description of class"""
-    def __init__(self, hutil):
+    def __init__(self, hutil, keep_alive = False):
         try:
-            waagent.MyDistro = waagent.GetMyDistro()
+            # the lazily loaded agent reads waagent.conf without detecting the distribution
+            if(WAAgentUtil.GetPathUsed() == 0):
+                waagent.MyDistro = waagent.GetMyDistro()
             Config = waagent.ConfigurationProvider(None)
         except Exception as e:
             errorMsg = "Failed to construct ConfigurationProvider, which may due to the old wala code."
@@ -45,6 +48,52 @@ class HttpUtil(object):
         self.proxyHost = Config.get("HttpProxy.Host")
         self.proxyPort = Config.get("HttpProxy.Port")
         self.tmpFile = './tmp_file_FD76C85E-406F-4CFA-8EB0-CF18B123365C'
+        # with keep_alive, the connection is reused by the next call to the same host
+        self.keep_alive = keep_alive
+        self.connection = None
+        self.connection_key = None
+
+    def close(self):
+        if(self.connection is not None):
+            try:
+                self.connection.close()
+            except Exception as e:
+                self.logger.log("Failed to close the http connection: " + str(e))
+            self.connection = None
+            self.connection_key = None
+
+    def get_connection(self, hostname, isHttpCall):
+        connection_key = (hostname, isHttpCall)
+        if(self.connection is not None and self.connection_key != connection_key):
+            self.close()
+        if(self.connection is None):
+            if(isHttpCall):
+                self.connection = httplibs.HTTPConnection(hostname, timeout = 10)
+            else:
+                self.connection = httplibs.HTTPSConnection(hostname, timeout = 10)
+            self.connection_key = connection_key
+        return self.connection
+
+    def KeepAliveCallGetResponse(self, method, sasuri_obj, data, headers, isHttpCall):
+        """
+        Returns the response and its body, which is always read so that the connection can take the next request.
+        """
+        # A reused connection may have been closed by the server while idle, retry it once on a new one
+        for attempt in range(0, 2):
+            reused = self.connection is not None and self.connection_key == (sasuri_obj.hostname, isHttpCall)
+            try:
+                connection = self.get_connection(sasuri_obj.hostname, isHttpCall)
+                connection.request(method=method, url=(sasuri_obj.path + '?' + sasuri_obj.query), body=data, headers = headers)
+                resp = connection.getresponse()
+                body = resp.read()
+                if(resp.will_close):
+                    self.close()
+                return resp, body
+            except Exception as e:
+                self.close()
+                if(not reused):
+                    raise
+                self.logger.log("Reused http connection failed, retrying on a new one: " + str(e))
 
     """
     snapshot also called this. so we should not write the file/read the file in this method.
@@ -75,17 +124,16 @@ class HttpUtil(object):
 
     def Call(self, method, sasuri_obj, data, headers, fallback_to_curl = False):
         try:
-            result, resp, errorMsg = self.HttpCallGetResponse(method, sasuri_obj, data, headers)
+            result, resp, errorMsg, responseBody = self.HttpCallGetResponse(method, sasuri_obj, data, headers, responseBodyRequired = True)
             self.logger.log("HttpUtil Call : result: " + str(result) + ", errorMsg: " + str(errorMsg))
             if(result == CommonVariables.success and resp != None):
                 self.logger.log("resp-header: " + str(resp.getheaders()))
             else:
                 self.logger.log("Http connection response is None")
 
-            responseBody = resp.read()
             self.logger.log(" resp status: " + str(resp.status))
             if(responseBody is not None):
-                self.logger.log("responseBody: " + (responseBody).decode('utf-8-sig'))
+                self.logger.log("responseBody: " + responseBody)
 
             if(resp.status == 200 or resp.status == 201):
                 return CommonVariables.success
@@ -107,7 +155,11 @@ class HttpUtil(object):
         responseBody = None
         try:
             resp = None
-            if(self.proxyHost == None or self.proxyPort == None):
+            if((self.proxyHost == None or self.proxyPort == None) and self.keep_alive):
+                resp, body = self.KeepAliveCallGetResponse(method, sasuri_obj, data, headers, isHttpCall)
+                if(responseBodyRequired):
+                    responeBody = body.decode('utf-8-sig')
+            elif(self.proxyHost == None or self.proxyPort == None):
                 if(isHttpCall):
                     connection = httplibs.HTTPConnection(sasuri_obj.hostname, timeout = 10) # making call with port 80 to make it http call
                 else:
@@ -125,6 +177,8 @@ class HttpUtil(object):
                 path = "https://{0}:{1}{2}".format(sasuri_obj.hostname, 443, (sasuri_obj.path + '?' + sasuri_obj.query))
                 connection.request(method=method, url=(path), body=data, headers=headers)
                 resp = connection.getresponse()
+                if(responseBodyRequired):
+                    responeBody = resp.read().decode('utf-8-sig')
                 connection.close()
             result = CommonVariables.success
         except Exception as e:
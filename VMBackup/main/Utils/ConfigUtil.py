@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+#
+# VM Backup extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import threading
+try:
+    import ConfigParser as ConfigParsers
+except ImportError:
+    import configparser as ConfigParsers
+
+VMBACKUP_CONFIG_FILE = '/etc/azure/vmbackup.conf'
+SNAPSHOT_SECTION = 'SnapshotThread'
+
+class ConfigUtility(object):
+    """
+    Reads a config file once and keeps it in memory. The file is parsed again
+    only when its inode, size or modification time changes, so that checking a
+    value costs a stat. Writes rewrite the file atomically.
+    """
+    def __init__(self, config_file = VMBACKUP_CONFIG_FILE, section = SNAPSHOT_SECTION):
+        self.config_file = config_file
+        self.section = section
+        self.config = None
+        self.file_signature = None
+        self.lock = threading.Lock()
+
+    def get_file_signature(self):
+        try:
+            stat = os.stat(self.config_file)
+            return (stat.st_ino, stat.st_size, stat.st_mtime)
+        except OSError:
+            return None
+
+    def load(self):
+        """
+        Returns the parsed file, reading it again if it changed since the last read.
+        """
+        signature = self.get_file_signature()
+        if self.config is None or signature != self.file_signature:
+            config = ConfigParsers.ConfigParser()
+            if signature is not None:
+                config.read(self.config_file)
+            self.config = config
+            self.file_signature = signature
+        return self.config
+
+    def get(self, key, default = None):
+        with self.lock:
+            config = self.load()
+            if config.has_option(self.section, key):
+                return config.get(self.section, key)
+        return default
+
+    def get_int(self, key, default = None):
+        value = self.get(key)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
+
+    def get_bool(self, key, default = None):
+        value = self.get(key)
+        if value is None:
+            return default
+        value = value.strip().lower()
+        if value in ('1', 'true', 'yes', 'on'):
+            return True
+        if value in ('0', 'false', 'no', 'off'):
+            return False
+        return default
+
+    def set(self, key, value):
+        self.set_values({key : value})
+
+    def set_values(self, values):
+        """
+        Sets all the key-value pairs of values with one rewrite of the file.
+        """
+        with self.lock:
+            config = self.load()
+            if not config.has_section(self.section):
+                config.add_section(self.section)
+            changed = False
+            for key, value in values.items():
+                value = str(value)
+                if not config.has_option(self.section, key) or config.get(self.section, key, raw = True) != value:
+                    config.set(self.section, key, value)
+                    changed = True
+            if changed:
+                self.write(config)
+
+    def write(self, config):
+        config_dir = os.path.dirname(self.config_file)
+        if not os.path.exists(config_dir):
+            os.makedirs(config_dir)
+        fd, temp_file = tempfile.mkstemp(dir = config_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                config.write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp_file, 0o644)
+            os.rename(temp_file, self.config_file)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            # the file is read again on next use
+            self.config = None
+            raise
+        self.file_signature = self.get_file_signature()
+
+config_utility = None
+
+def get_config_utility():
+    """
+    Returns the ConfigUtility of vmbackup.conf shared by the whole process.
+    """
+    global config_utility
+    if config_utility is None:
+        config_utility = ConfigUtility()
+    return config_utility
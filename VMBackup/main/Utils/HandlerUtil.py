@@ -65,15 +65,12 @@ import Utils.WAAgentUtil
 from Utils.WAAgentUtil import waagent
 import logging
 import logging.handlers
-try:
-        import ConfigParser as ConfigParsers
-except ImportError:
-        import configparser as ConfigParsers
 from common import CommonVariables
 import platform
 import subprocess
 import datetime
 import Utils.Status
+from Utils import ConfigUtil
 from MachineIdentity import MachineIdentity
 import ExtensionErrorCodeHelper
 import traceback
@@ -89,6 +86,7 @@ class HandlerContext:
 class HandlerUtility:
     telemetry_data = {} 
     serializable_telemetry_data = []
+    static_telemetry_added = False
     ExtErrorCode = ExtensionErrorCodeHelper.ExtensionErrorCodeEnum.success
     def __init__(self, log, error, short_name):
         self._log = log
@@ -99,6 +97,7 @@ class HandlerUtility:
         self.storageDetailsObj = None
         self.partitioncount = 0
         self.logging_file = None
+        self.machine_id = None
 
     def _get_log_prefix(self):
         return '[%s-%s]' % (self._context._name, self._context._version)
@@ -285,45 +284,27 @@ class HandlerUtility:
     def get_value_from_configfile(self, key):
         global backup_logger
         value = None
-        configfile = '/etc/azure/vmbackup.conf'
         try :
-            if os.path.exists(configfile):
-                config = ConfigParsers.ConfigParser()
-                config.read(configfile)
-                if config.has_option('SnapshotThread',key):
-                    value = config.get('SnapshotThread',key)
-                else:
-                    self.log("Config File doesn't have the key :" + key, 'Info')
+            value = ConfigUtil.get_config_utility().get(key)
+            if value is None:
+                self.log("Config File doesn't have the key :" + key, 'Info')
         except Exception as e:
             errorMsg = " Unable to get config file.key is "+ key +"with error: %s, stack trace: %s" % (str(e), traceback.format_exc())
             self.log(errorMsg, 'Warning')
         return value
  
     def set_value_to_configfile(self, key, value):
-        configfile = '/etc/azure/vmbackup.conf'
         try :
             self.log('setting doseq flag in config file', 'Info')
-            if not os.path.exists(os.path.dirname(configfile)):
-                os.makedirs(os.path.dirname(configfile))
-            config = ConfigParsers.RawConfigParser()
-            if os.path.exists(configfile):
-                config.read(configfile)
-                if config.has_section('SnapshotThread'):
-                    if config.has_option('SnapshotThread', key):
-                        config.remove_option('SnapshotThread', key)
-                else:
-                    config.add_section('SnapshotThread')
-            else:
-                config.add_section('SnapshotThread')
-            config.set('SnapshotThread', key, value)
-            with open(configfile, 'w') as config_file:
-                config.write(config_file)
+            ConfigUtil.get_config_utility().set(key, value)
         except Exception as e:
             errorMsg = " Unable to set config file.key is "+ key +"with error: %s, stack trace: %s" % (str(e), traceback.format_exc())
             self.log(errorMsg, 'Warning')
         return value
 
     def get_machine_id(self):
+        if self.machine_id:
+            return self.machine_id
         machine_id_file = "/etc/azure/machine_identity_FD76C85E-406F-4CFA-8EB0-CF18B123358B"
         machine_id = ""
         try:
@@ -345,6 +326,7 @@ class HandlerUtility:
             self.log(errMsg, False, 'Error')
  
         self.log("Unique Machine Id  : {0}".format(machine_id))
+        self.machine_id = machine_id
         return machine_id
 
     def get_total_used_size(self):
@@ -513,6 +495,10 @@ class HandlerUtility:
         HandlerUtility.telemetry_data[key]=value
 
     def add_telemetry_data(self):
+        # these do not change during the run, and reading them scans the waagent log
+        if HandlerUtility.static_telemetry_added:
+            return
+        HandlerUtility.static_telemetry_added = True
         os_version,kernel_version = self.get_dist_info()
         HandlerUtility.add_to_telemetery_data("guestAgentVersion",self.get_wala_version())
         HandlerUtility.add_to_telemetery_data("extensionVersion",self.get_extension_version())
@@ -560,8 +546,13 @@ class HandlerUtility:
     def write_to_status_file(self, stat_rept_file):
         try:
             if self._context._status_file:
-                with open(self._context._status_file,'w+') as f:
+                # write to a temporary file and rename it, so that the agent never reads a partial status
+                temp_file = self._context._status_file + '.tmp'
+                with open(temp_file,'w+') as f:
                     f.write(stat_rept_file)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(temp_file, self._context._status_file)
         except Exception as e:
             errMsg = 'Status file creation failed with error: %s, stack trace: %s' % (str(e), traceback.format_exc())
             self.log(errMsg)
@@ -20,6 +20,7 @@
 import imp
 import os
 import os.path
+from Utils import WAAgentLite
 
 #
 # The following code will search and load waagent code and expose
@@ -47,11 +48,78 @@ def searchWAAgentOld():
             return agentPath
     return None
 
+# Names served by WAAgentLite until the agent itself is loaded
+LITE_NAMES = ["GuestAgentName", "GuestAgentLongName", "GuestAgentVersion", "LibDir",
+              "GetFileContents", "SetFileContents", "Run", "RunGetOutput",
+              "Logger", "Log", "LogWithPrefix", "LogIfVerbose", "LogWithPrefixIfVerbose",
+              "Error", "ErrorWithPrefix", "Warn", "NoLog", "ThrottleLog", "myLogger",
+              "WALAEventOperation", "GetConfigurationPath", "ConfigurationProvider"]
+
+def addMissingAPIs(agent):
+    if not hasattr(agent, "AddExtensionEvent"):
+        """
+        If AddExtensionEvent is not defined, provide a dummy impl.
+        """
+        def _AddExtensionEvent(*args, **kwargs):
+            pass
+        agent.AddExtensionEvent = _AddExtensionEvent
+
+    if not hasattr(agent, "WALAEventOperation"):
+        class _WALAEventOperation:
+            HeartBeat = "HeartBeat"
+            Provision = "Provision"
+            Install = "Install"
+            UnIsntall = "UnInstall"
+            Disable = "Disable"
+            Enable = "Enable"
+            Download = "Download"
+            Upgrade = "Upgrade"
+            Update = "Update"           
+        agent.WALAEventOperation = _WALAEventOperation
+
+class LazyWAAgent(object):
+    """
+    Stands for the waagent module of main/WaagentLib.py. The logger, file
+    and command helpers come from WAAgentLite, the agent is only loaded the
+    first time anything else is used.
+    """
+    def __init__(self, agentPath):
+        self.__dict__['_agentPath'] = agentPath
+        self.__dict__['_agent'] = None
+
+    def load(self):
+        if self._agent is None:
+            agent = imp.load_source('waagent', self._agentPath)
+            addMissingAPIs(agent)
+            if WAAgentLite.LoggerArgs is not None:
+                agent.LoggerInit(*WAAgentLite.LoggerArgs)
+            self.__dict__['_agent'] = agent
+        return self._agent
+
+    def isLoaded(self):
+        return self._agent is not None
+
+    def LoggerInit(self, log_file_path, log_con_path, verbose=False):
+        WAAgentLite.LoggerInit(log_file_path, log_con_path, verbose)
+        if self._agent is not None:
+            self._agent.LoggerInit(log_file_path, log_con_path, verbose)
+
+    def __getattr__(self, name):
+        if name in LITE_NAMES:
+            return getattr(WAAgentLite, name)
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        if name in LITE_NAMES:
+            setattr(WAAgentLite, name, value)
+        else:
+            setattr(self.load(), name, value)
+
 pathUsed = 1 
 try:
     agentPath = searchWAAgent()
     if(agentPath):
-        waagent = imp.load_source('waagent', agentPath)
+        waagent = LazyWAAgent(agentPath)
     else:
         raise Exception("Can't load new waagent.")
 except Exception as e:
@@ -59,30 +127,10 @@ except Exception as e:
     agentPath = searchWAAgentOld()
     if(agentPath):
         waagent = imp.load_source('waagent', agentPath)
+        addMissingAPIs(waagent)
     else:
         raise Exception("Can't load old waagent.")
 
-if not hasattr(waagent, "AddExtensionEvent"):
-    """
-    If AddExtensionEvent is not defined, provide a dummy impl.
-    """
-    def _AddExtensionEvent(*args, **kwargs):
-        pass
-    waagent.AddExtensionEvent = _AddExtensionEvent
-
-if not hasattr(waagent, "WALAEventOperation"):
-    class _WALAEventOperation:
-        HeartBeat = "HeartBeat"
-        Provision = "Provision"
-        Install = "Install"
-        UnIsntall = "UnInstall"
-        Disable = "Disable"
-        Enable = "Enable"
-        Download = "Download"
-        Upgrade = "Upgrade"
-        Update = "Update"           
-    waagent.WALAEventOperation = _WALAEventOperation
-
 __ExtensionName__ = None
 def InitExtensionEventLog(name):
     __ExtensionName__ = name
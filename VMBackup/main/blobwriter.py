@@ -37,6 +37,17 @@ class BlobWriter(object):
     """description of class"""
     def __init__(self, hutil):
         self.hutil = hutil
+        self.http_util = None
+
+    def get_http_util(self):
+        # one keep-alive connection for the properties, clear and write calls of the blob
+        if(self.http_util is None):
+            self.http_util = HttpUtil(self.hutil, keep_alive = True)
+        return self.http_util
+
+    def close(self):
+        if(self.http_util is not None):
+            self.http_util.close()
     """
     network call should have retry.
     """
@@ -63,7 +74,7 @@ class BlobWriter(object):
             try:
                 # get the blob type
                 if(blobUri is not None):
-                    http_util = HttpUtil(self.hutil)
+                    http_util = self.get_http_util()
                     sasuri_obj = urlparse.urlparse(blobUri)
                     headers = {}
                     headers["x-ms-blob-type"] = 'BlockBlob'
@@ -91,7 +102,7 @@ class BlobWriter(object):
                     PAGE_SIZE_BYTES = 512
                     PAGE_UPLOAD_LIMIT_BYTES = 4194304 # 4 MB
                     STATUS_BLOB_LIMIT_BYTES = 10485760 # 10 MB
-                    http_util = HttpUtil(self.hutil)
+                    http_util = self.get_http_util()
                     sasuri_obj = urlparse.urlparse(blobUri + '&comp=page')
                     # Get Blob-properties to know content-length
                     blobProperties = self.GetBlobProperties(blobUri)
@@ -159,7 +170,7 @@ class BlobWriter(object):
             retry_times = 3
             while(retry_times > 0):
                 try:
-                    http_util = HttpUtil(self.hutil)
+                    http_util = self.get_http_util()
                     sasuri_obj = urlparse.urlparse(blobUri + '&comp=page')
                     # Get Blob-properties to know content-length
                     blobProperties = self.GetBlobProperties(blobUri)
@@ -198,10 +209,10 @@ class BlobWriter(object):
             retry_times = 3
             while(retry_times > 0):
                 try:
-                    http_util = HttpUtil(self.hutil)
+                    http_util = self.get_http_util()
                     sasuri_obj = urlparse.urlparse(blobUri)
                     headers = {}
-                    result, httpResp, errMsg = http_util.HttpCallGetResponse('GET', sasuri_obj, None, headers = headers)
+                    result, httpResp, errMsg = http_util.HttpCallGetResponse('HEAD', sasuri_obj, None, headers = headers)
                     self.hutil.log("GetBlobProperties: HttpCallGetResponse : result :" + str(result) + ", errMsg :" + str(errMsg))
                     blobProperties = self.httpresponse_get_blob_properties(httpResp)
                     self.hutil.log("GetBlobProperties: blobProperties :" + str(blobProperties))
@@ -213,7 +224,7 @@ class BlobWriter(object):
         return blobProperties
 
     def put_page_clear(self, blobUri, pageBlobIndex, clearLength):
-        http_util = HttpUtil(self.hutil)
+        http_util = self.get_http_util()
         sasuri_obj = urlparse.urlparse(blobUri + '&comp=page')
         headers = {}
         headers["x-ms-page-write"] = 'clear'
@@ -223,7 +234,7 @@ class BlobWriter(object):
         return result
 
     def put_page_update(self, pageContent, blobUri, pageBlobIndex):
-        http_util = HttpUtil(self.hutil)
+        http_util = self.get_http_util()
         sasuri_obj = urlparse.urlparse(blobUri + '&comp=page')
         headers = {}
         headers["x-ms-page-write"] = 'update'
@@ -236,7 +247,7 @@ class BlobWriter(object):
         isSuccessful = False
         if (size % 512 == 0):
             try:
-                http_util = HttpUtil(self.hutil)
+                http_util = self.get_http_util()
                 sasuri_obj = urlparse.urlparse(blobUri + '&comp=properties')
                 headers = {}
                 headers["x-ms-blob-content-length"] = size
@@ -34,9 +34,11 @@ from common import CommonVariables
 from HttpUtil import HttpUtil
 from Utils import Status
 from Utils import HandlerUtil
+from Utils import ConfigUtil
 from fsfreezer import FsFreezer
 from guestsnapshotter import GuestSnapshotter
 from hostsnapshotter import HostSnapshotter
+from hostsnapshotsession import HostSnapshotSession
 from Utils import HostSnapshotObjects
 import ExtensionErrorCodeHelper
 
@@ -53,6 +55,7 @@ class FreezeSnapshotter(object):
         self.takeSnapshotFrom = CommonVariables.firstGuestThenHost
         self.isManaged = False
         self.taskId = self.para_parser.taskId
+        self.host_snapshot_session = HostSnapshotSession(logger)
         try:
             if(para_parser.customSettings != None and para_parser.customSettings != ''):
                 self.logger.log('customSettings : ' + str(para_parser.customSettings))
@@ -81,6 +84,7 @@ class FreezeSnapshotter(object):
         elif(self.takeSnapshotFrom == CommonVariables.onlyHost):
             run_result, run_status, blob_snapshot_info_array, all_failed = self.takeSnapshotFromOnlyHost()
 
+        self.host_snapshot_session.close()
         snapshot_info_array = self.update_snapshotinfoarray(blob_snapshot_info_array)
 
         return run_result, run_status, snapshot_info_array
@@ -230,9 +234,8 @@ class FreezeSnapshotter(object):
 
         run_result, run_status, blob_snapshot_info_array, all_failed, all_snapshots_failed  = self.takeSnapshotFromGuest()
 
-        time.sleep(60) #sleeping for 60 seconds so that previous binary execution completes
-
         if(run_result != CommonVariables.success and all_snapshots_failed):
+            self.wait_for_guest_freeze_completion()
             run_result, run_status, blob_snapshot_info_array,all_failed = self.takeSnapshotFromOnlyHost()
 
         if all_failed and run_result != CommonVariables.success:
@@ -240,6 +243,18 @@ class FreezeSnapshotter(object):
 
         return run_result, run_status, blob_snapshot_info_array, all_failed
 
+    def wait_for_guest_freeze_completion(self):
+        # The safefreeze binary of the guest attempt must be done before the host attempt freezes again.
+        # It thaws and exits by itself after the freeze timeout at the latest.
+        if not self.g_fsfreeze_on:
+            return
+        timeout = ConfigUtil.get_config_utility().get_int('timeout', 60)
+        time_before_wait = datetime.datetime.now()
+        thawed = self.freezer.wait_for_thaw(timeout + 10)
+        time_after_wait = datetime.datetime.now()
+        HandlerUtil.HandlerUtility.add_to_telemetery_data("FallbackWaitTime", str(time_after_wait-time_before_wait))
+        self.logger.log('T:S guest freeze completed before fallback to host: ' + str(thawed), True)
+
     def takeSnapshotFromFirstHostThenGuest(self):
 
         run_result = CommonVariables.success
@@ -248,7 +263,7 @@ class FreezeSnapshotter(object):
         all_failed= False
         is_inconsistent =  False
         blob_snapshot_info_array = None
-        snap_shotter = HostSnapshotter(self.logger)
+        snap_shotter = HostSnapshotter(self.logger, self.host_snapshot_session)
         pre_snapshot_statuscode = snap_shotter.pre_snapshot(self.para_parser, self.taskId)
 
         if(pre_snapshot_statuscode == 200 or pre_snapshot_statuscode == 201):
@@ -274,10 +289,11 @@ class FreezeSnapshotter(object):
         blob_snapshot_info_array = None
         self.logger.log('Taking Snapshot through Host')
         HandlerUtil.HandlerUtility.add_to_telemetery_data("snapshotCreator", "backupHostService")
+        snap_shotter = HostSnapshotter(self.logger, self.host_snapshot_session)
+        snap_shotter.prepare_snapshot(self.para_parser, self.taskId)
         if self.g_fsfreeze_on :
             run_result, run_status = self.freeze()
         if(run_result == CommonVariables.success):
-            snap_shotter = HostSnapshotter(self.logger)
             self.logger.log('T:S doing snapshot now...')
             time_before_snapshot = datetime.datetime.now()
             blob_snapshot_info_array, all_failed, is_inconsistent, unable_to_sleep  = snap_shotter.snapshotall(self.para_parser, self.freezer, self.g_fsfreeze_on, self.taskId)
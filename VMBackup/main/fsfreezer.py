@@ -18,6 +18,8 @@
 
 import subprocess
 from mounts import Mounts
+import errno
+import fcntl
 import datetime
 import threading
 import os
@@ -27,6 +29,9 @@ import signal
 import traceback
 import threading
 
+# _IOWR('X', 120, int), the ioctl safefreeze thaws with
+FITHAW = 0xC0045878
+
 def thread_for_binary(self,args):
     self.logger.log("Thread for binary is called",True)
     time.sleep(5)
@@ -56,6 +61,7 @@ class FreezeHandler(object):
         # sig_handle valid values(0:nothing done,1: freezed successfully, 2:freeze failed)
         self.sig_handle = 0
         self.child= None
+        self.binary_thread = None
         self.logger=logger
 
     def sigusr1_handler(self,signal,frame):
@@ -71,11 +77,13 @@ class FreezeHandler(object):
     def reset_signals(self):
         self.sig_handle = 0
         self.child= None
+        self.binary_thread = None
 
 
     def startproc(self,args):
         binary_thread = threading.Thread(target=thread_for_binary, args=[self, args])
         binary_thread.start()
+        self.binary_thread = binary_thread
         for i in range(0,33):
             if(self.sig_handle==0):
                 self.logger.log("inside while with sig_handle "+str(self.sig_handle))
@@ -104,6 +112,7 @@ class FsFreezer:
             self.mounts = None
         self.frozen_items = set()
         self.unfrozen_items = set()
+        self.freeze_mount_points = []
         self.freeze_handler = FreezeHandler(self.logger)
 
 
@@ -130,6 +139,7 @@ class FsFreezer:
                     args.append(str(mount.mount_point))
             if(self.root_seen):
                 args.append('/')
+            self.freeze_mount_points = args[2:]
             self.logger.log("arg : " + str(args),True)
             self.freeze_handler.reset_signals()
             self.freeze_handler.signal_receiver()
@@ -214,4 +224,52 @@ class FsFreezer:
         self.logger.enforce_local_flag(True)
         return thaw_result, unable_to_sleep
 
+    def wait_for_thaw(self, timeout):
+        """
+        Wait until the safefreeze binary of the last freeze has exited and
+        its filesystems are thawed, for at most timeout seconds. Return True
+        if they are.
+        """
+        deadline = time.time() + timeout
+        if(self.freeze_handler.binary_thread is not None):
+            # The binary is started 5 seconds after the thread
+            self.freeze_handler.binary_thread.join(max(0, deadline - time.time()))
+        child = self.freeze_handler.child
+        if(child is not None):
+            while(child.poll() is None and time.time() < deadline):
+                time.sleep(0.5)
+            if(child.poll() is None):
+                self.logger.log("safefreeze still running after " + str(timeout) + " seconds, sending sigusr1", True, 'Warning')
+                child.send_signal(signal.SIGUSR1)
+                for i in range(0,10):
+                    if(child.poll() is None):
+                        time.sleep(1)
+                    else:
+                        break
+            if(child.poll() is None):
+                self.logger.log("safefreeze did not exit", True, 'Error')
+                return False
+            self.logger.log("safefreeze exited with " + str(child.returncode), True)
+        return self.ensure_thawed()
 
+    def ensure_thawed(self):
+        """
+        FITHAW every mount point of the last freeze. It fails with EINVAL on
+        a filesystem which is not frozen, so this confirms they are thawed
+        and thaws any left frozen.
+        """
+        all_thawed = True
+        for mount_point in self.freeze_mount_points:
+            fd = None
+            try:
+                fd = os.open(mount_point, os.O_RDONLY)
+                fcntl.ioctl(fd, FITHAW, 0)
+                self.logger.log("thawed " + mount_point + " which was still frozen", True, 'Warning')
+            except (IOError, OSError) as e:
+                if(e.errno != errno.EINVAL):
+                    self.logger.log("failed to check the freeze state of " + mount_point + ": " + str(e), True, 'Warning')
+                    all_thawed = False
+            finally:
+                if(fd is not None):
+                    os.close(fd)
+        return all_thawed
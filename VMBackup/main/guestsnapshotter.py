@@ -23,16 +23,13 @@ except ImportError:
     import urllib.parse as urlparser
 import traceback
 import datetime
-try:
-    import ConfigParser as ConfigParsers
-except ImportError:
-    import configparser as ConfigParsers
 import multiprocessing as mp
 import datetime
 from common import CommonVariables
 from HttpUtil import HttpUtil
 from Utils import Status
 from Utils import HandlerUtil
+from Utils import ConfigUtil
 from fsfreezer import FsFreezer
 from Utils import HostSnapshotObjects
 
@@ -309,15 +306,10 @@ class GuestSnapshotter(object):
 
     def get_value_from_configfile(self, key):
         value = None
-        configfile = '/etc/azure/vmbackup.conf'
         try :
-            if os.path.exists(configfile):
-                config = ConfigParsers.ConfigParser()
-                config.read(configfile)
-                if config.has_option('SnapshotThread',key):
-                    value = config.get('SnapshotThread',key)
-                else:
-                    self.logger.log("Config File doesn't have the key :" + key)
+            value = ConfigUtil.get_config_utility().get(key)
+            if value is None:
+                self.logger.log("Config File doesn't have the key :" + key)
         except Exception as e:
             errorMsg = " Unable to ed config file.key is "+ key +"with error: %s, stack trace: %s" % (str(e), traceback.format_exc())
             self.logger.log(errorMsg)
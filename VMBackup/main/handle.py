@@ -31,10 +31,6 @@ import shlex
 import traceback
 import xml.parsers.expat
 import datetime
-try:
-    import ConfigParser as ConfigParsers
-except ImportError:
-    import configparser as ConfigParsers
 from threading import Thread
 from time import sleep
 from os.path import join
@@ -46,10 +42,11 @@ from common import CommonVariables
 from parameterparser import ParameterParser
 from Utils import HandlerUtil
 from Utils import SizeCalculation
+from Utils import ConfigUtil
 from Utils import Status
 from freezesnapshotter import FreezeSnapshotter
 from backuplogger import Backuplogger
-from blobwriter import BlobWriter
+from statuspublisher import StatusPublisher
 from taskidentity import TaskIdentity
 from MachineIdentity import MachineIdentity
 import ExtensionErrorCodeHelper
@@ -59,7 +56,7 @@ from PluginHost import PluginHostResult
 #Main function is the only entrence to this extension handler
 
 def main():
-    global MyPatching,backup_logger,hutil,run_result,run_status,error_msg,freezer,freeze_result,snapshot_info_array,total_used_size,size_calculation_failed
+    global MyPatching,backup_logger,hutil,run_result,run_status,error_msg,freezer,freeze_result,snapshot_info_array,total_used_size,size_calculation_failed,status_publisher
     try:
         run_result = CommonVariables.success
         run_status = 'success'
@@ -72,6 +69,7 @@ def main():
 ##        HandlerUtil.waagent.Logger.Log((CommonVariables.extension_name) + " started to handle." ) 
         hutil = HandlerUtil.HandlerUtility(HandlerUtil.waagent.Log, HandlerUtil.waagent.Error, CommonVariables.extension_name)
         backup_logger = Backuplogger(hutil)
+        status_publisher = StatusPublisher(hutil, backup_logger)
         MyPatching = GetMyPatching(backup_logger)
         hutil.patching = MyPatching
         for a in sys.argv[1:]:
@@ -101,26 +99,12 @@ def timedelta_total_seconds(delta):
     else:
         return delta.total_seconds()
 
-def status_report_to_file(file_report_msg):
-    global backup_logger,hutil
-    hutil.write_to_status_file(file_report_msg)
-    backup_logger.log("file status report message:",True)
-    backup_logger.log(file_report_msg,True)
-
-def status_report_to_blob(blob_report_msg):
-    global backup_logger,hutil,para_parser
-    try:
-        if(para_parser is not None and para_parser.statusBlobUri is not None and para_parser.statusBlobUri != ""):
-            blobWriter = BlobWriter(hutil)
-            if(blob_report_msg is not None):
-                blobWriter.WriteBlob(blob_report_msg,para_parser.statusBlobUri)
-                backup_logger.log("blob status report message:",True)
-                backup_logger.log(blob_report_msg,True)
-            else:
-                backup_logger.log("blob_report_msg is none",True)
-    except Exception as e:
-        err_msg='cannot write status to the status blob'+traceback.format_exc()
-        backup_logger.log(err_msg, True, 'Warning')
+def status_report(blob_report_msg, file_report_msg, write_file = True):
+    global status_publisher,para_parser
+    status_blob_uri = None
+    if(para_parser is not None):
+        status_blob_uri = para_parser.statusBlobUri
+    status_publisher.publish(blob_report_msg, file_report_msg, status_blob_uri, write_file)
 
 def get_status_to_report(status, status_code, message, snapshot_info = None):
     global MyPatching,backup_logger,hutil,para_parser,total_used_size,size_calculation_failed
@@ -150,17 +134,17 @@ def get_status_to_report(status, status_code, message, snapshot_info = None):
     return blob_report_msg, file_report_msg
 
 def exit_with_commit_log(status,result,error_msg, para_parser):
-    global backup_logger
+    global backup_logger,status_publisher
     backup_logger.log(error_msg, True, 'Error')
     if(para_parser is not None and para_parser.logsBlobUri is not None and para_parser.logsBlobUri != ""):
         backup_logger.commit(para_parser.logsBlobUri)
     blob_report_msg, file_report_msg = get_status_to_report(status, result, error_msg, None)
-    status_report_to_file(file_report_msg)
-    status_report_to_blob(blob_report_msg)
+    status_report(blob_report_msg, file_report_msg)
+    status_publisher.flush()
     sys.exit(0)
 
 def exit_if_same_taskId(taskId):
-    global backup_logger,hutil,para_parser
+    global backup_logger,hutil,para_parser,status_publisher
     trans_report_msg = None
     taskIdentity = TaskIdentity()
     last_taskId = taskIdentity.stored_identity()
@@ -178,7 +162,8 @@ def exit_if_same_taskId(taskId):
                         taskId=taskId,\
                         commandStartTimeUTCTicks=para_parser.commandStartTimeUTCTicks,\
                         snapshot_info=None)
-                status_report_to_file(file_report_msg)
+                status_report(None, file_report_msg)
+                status_publisher.flush()
         except Exception as e:
             err_msg='cannot write status to the status file, Exception %s, stack trace: %s' % (str(e), traceback.format_exc())
             backup_logger.log(err_msg, True, 'Warning')
@@ -190,9 +175,10 @@ def convert_time(utcTicks):
 def freeze_snapshot(timeout):
     try:
         global hutil,backup_logger,run_result,run_status,error_msg,freezer,freeze_result,para_parser,snapshot_info_array,g_fsfreeze_on
-        if(hutil.get_value_from_configfile('doseq') == '2'):
+        doseq = hutil.get_value_from_configfile('doseq')
+        if(doseq == '2'):
             hutil.set_value_to_configfile('doseq', '1')
-        if(hutil.get_value_from_configfile('doseq') != '1'):
+        elif(doseq != '1'):
             hutil.set_value_to_configfile('doseq', '2')
         freeze_snap_shotter = FreezeSnapshotter(backup_logger, hutil, freezer, g_fsfreeze_on, para_parser)
         backup_logger.log("Calling do snapshot method", True, 'Info')
@@ -220,14 +206,13 @@ def check_snapshot_array_fail():
     return snapshot_array_fail
 
 def daemon():
-    global MyPatching,backup_logger,hutil,run_result,run_status,error_msg,freezer,para_parser,snapshot_done,snapshot_info_array,g_fsfreeze_on,total_used_size
+    global MyPatching,backup_logger,hutil,run_result,run_status,error_msg,freezer,para_parser,snapshot_done,snapshot_info_array,g_fsfreeze_on,total_used_size,status_publisher
     #this is using the most recent file timestamp.
     hutil.do_parse_context('Executing')
     freezer = FsFreezer(patching= MyPatching, logger = backup_logger)
     global_error_result = None
     # precheck
     freeze_called = False
-    configfile='/etc/azure/vmbackup.conf'
     thread_timeout=str(60)
 
     #Adding python version to the telemetry
@@ -242,11 +227,9 @@ def daemon():
     try:
         if(freezer.mounts is not None):
             hutil.partitioncount = len(freezer.mounts.mounts)
-        backup_logger.log(" configfile " + str(configfile), True)
-        config = ConfigParsers.ConfigParser()
-        config.read(configfile)
-        if config.has_option('SnapshotThread','timeout'):
-            thread_timeout= config.get('SnapshotThread','timeout')
+        config_utility = ConfigUtil.get_config_utility()
+        backup_logger.log(" configfile " + str(config_utility.config_file), True)
+        thread_timeout = config_utility.get('timeout', thread_timeout)
     except Exception as e:
         errMsg='cannot read config file or file not present'
         backup_logger.log(errMsg, True, 'Warning')
@@ -295,9 +278,7 @@ def daemon():
                 temp_result=CommonVariables.ExtensionTempTerminalState
                 temp_msg='Transitioning state in extension'
                 blob_report_msg, file_report_msg = get_status_to_report(temp_status, temp_result, temp_msg, None)
-                if(hutil.is_status_file_exists()):
-                    status_report_to_file(file_report_msg)
-                status_report_to_blob(blob_report_msg)
+                status_report(blob_report_msg, file_report_msg, hutil.is_status_file_exists())
                 #partial logging before freeze
                 if(para_parser is not None and para_parser.logsBlobUri is not None and para_parser.logsBlobUri != ""):
                     backup_logger.commit_to_blob(para_parser.logsBlobUri)
@@ -334,6 +315,8 @@ def daemon():
                         dobackup = False
 
                 if dobackup:
+                    # no status write may be in flight while the file systems are frozen
+                    status_publisher.flush()
                     freeze_snapshot(thread_timeout)
 
                 if not doFsConsistentbackup:
@@ -427,17 +410,17 @@ def daemon():
         HandlerUtil.HandlerUtility.add_to_telemetery_data("extErrorCode", str(ExtensionErrorCodeHelper.ExtensionErrorCodeHelper.ExtensionErrorCodeNameDict[hutil.ExtErrorCode]))
         total_used_size = -1
         blob_report_msg, file_report_msg = get_status_to_report(run_status,run_result,error_msg, snapshot_info_array)
-        if(hutil.is_status_file_exists()):
-            status_report_to_file(file_report_msg)
-        status_report_to_blob(blob_report_msg)
+        status_report(blob_report_msg, file_report_msg, hutil.is_status_file_exists())
     except Exception as e:
         errMsg = 'Failed to log status in extension'
         backup_logger.log(errMsg, True, 'Error')
+    # the final status is uploaded while the logs are committed
     if(para_parser is not None and para_parser.logsBlobUri is not None and para_parser.logsBlobUri != ""):
         backup_logger.commit(para_parser.logsBlobUri)
     else:
         backup_logger.log("the logs blob uri is not there, so do not upload log.")
         backup_logger.commit_to_local()
+    status_publisher.flush()
 
     sys.exit(0)
 
@@ -454,7 +437,7 @@ def update():
     hutil.do_exit(0,'Update','success','0', 'Update Succeeded')
 
 def enable():
-    global backup_logger,hutil,error_msg,para_parser
+    global backup_logger,hutil,error_msg,para_parser,status_publisher
     hutil.do_parse_context('Enable')
     try:
         backup_logger.log('starting to enable', True)
@@ -510,10 +493,7 @@ def enable():
         temp_result=CommonVariables.success
         temp_msg='Transitioning state in enable'
         blob_report_msg, file_report_msg = get_status_to_report(temp_status, temp_result, temp_msg, None)
-        file_status_upload_thread=Thread(target=status_report_to_file, args=(file_report_msg,))
-        file_status_upload_thread.start()
-        blob_status_upload_thread=Thread(target=status_report_to_blob, args=(blob_report_msg,))
-        blob_status_upload_thread.start()
+        status_report(blob_report_msg, file_report_msg)
         if(hutil.is_prev_in_transition()):
             backup_logger.log('retrieving the previous logs for this', True)
             backup_logger.set_prev_log()
@@ -521,8 +501,7 @@ def enable():
             log_upload_thread=Thread(target=thread_for_log_upload)
             log_upload_thread.start()
             log_upload_thread.join(60)
-        file_status_upload_thread.join(30)
-        blob_status_upload_thread.join(60)
+        status_publisher.flush(60)
         start_daemon();
         sys.exit(0)
     except Exception as e:
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+#
+# VM Backup extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import socket
+import time
+import traceback
+try:
+    import httplib as httplibs
+except ImportError:
+    import http.client as httplibs
+from common import CommonVariables
+from HttpUtil import HttpUtil
+from Utils import HandlerUtil
+
+class HostSnapshotSession(object):
+    """
+    One keep-alive HTTP/1.1 connection to the WireServer shared by the presnapshot
+    and dosnapshot calls of a backup job, so that the dosnapshot call made while
+    the file systems are frozen does not pay for the connection setup.
+    """
+    def __init__(self, logger, hostname = '168.63.129.16', timeout = 10):
+        self.logger = logger
+        self.hostname = hostname
+        self.timeout = timeout
+        self.connection = None
+        self.http_util = None
+
+    def connect(self):
+        """
+        Opens the connection if it is not open yet and returns the seconds it took.
+        """
+        if(self.connection is not None):
+            return 0
+        time_before_connect = time.time()
+        connection = httplibs.HTTPConnection(self.hostname, timeout = self.timeout)
+        connection.connect()
+        self.connection = connection
+        return time.time() - time_before_connect
+
+    def close(self):
+        if(self.connection is not None):
+            try:
+                self.connection.close()
+            except Exception as e:
+                self.logger.log("Failed to close the host snapshot connection: " + str(e))
+            self.connection = None
+
+    def get_http_util(self):
+        if(self.http_util is None):
+            self.http_util = HttpUtil(self.logger)
+        return self.http_util
+
+    def is_stale_connection_error(self, e):
+        """
+        True for the errors of a connection the WireServer closed while it was idle.
+        """
+        if(isinstance(e, socket.timeout)):
+            return False
+        if(isinstance(e, httplibs.BadStatusLine)):
+            return True
+        return isinstance(e, socket.error) and getattr(e, 'errno', None) in (errno.ECONNRESET, errno.EPIPE)
+
+    def post(self, uri_obj, body_content, headers, telemetry_suffix):
+        """
+        Posts the pre-serialized body_content and reads the whole response, which
+        leaves the connection ready for the next request. The connection, time to
+        first byte and total latencies are added to the telemetry as
+        hostConnectTime<suffix>, hostTtfb<suffix> and hostTotalTime<suffix>.
+
+        A reused connection that turns out to be stale is retried once on a new one,
+        but only when the WireServer cannot have received the request, since the
+        dosnapshot request is not idempotent.
+
+        Returns the same tuple as HttpUtil.HttpCallGetResponse with responseBodyRequired.
+        """
+        http_util = self.get_http_util()
+        if(http_util.proxyHost != None and http_util.proxyPort != None):
+            return http_util.HttpCallGetResponse('POST', uri_obj, body_content, headers = headers, responseBodyRequired = True, isHttpCall = True)
+
+        result = CommonVariables.error_http_failure
+        resp = None
+        errorMsg = None
+        responseBody = ""
+        url = uri_obj.path + '?' + uri_obj.query
+        time_before_call = time.time()
+        connect_time = 0
+        ttfb = None
+        # A reused connection may have been closed by the WireServer while idle, retry it once on a new one
+        for attempt in range(0, 2):
+            reused = self.connection is not None
+            sent = False
+            try:
+                connect_time = connect_time + self.connect()
+                time_before_request = time.time()
+                self.connection.request('POST', url, body = body_content, headers = headers)
+                sent = True
+                resp = self.connection.getresponse()
+                ttfb = time.time() - time_before_request
+                responseBody = resp.read().decode('utf-8-sig')
+                if(resp.getheader('connection', '').lower() == 'close'):
+                    self.close()
+                result = CommonVariables.success
+                break
+            except Exception as e:
+                self.close()
+                resp = None
+                errorMsg = "Failed to call " + uri_obj.path + " with error: %s, stack trace: %s" % (str(e), traceback.format_exc())
+                self.logger.log(errorMsg)
+                # Once sent, the request may have reached the WireServer; only a stale
+                # socket proves it did not. A timeout proves nothing.
+                if(not reused or isinstance(e, socket.timeout)
+                   or (sent and not self.is_stale_connection_error(e))):
+                    break
+        total_time = time.time() - time_before_call
+
+        HandlerUtil.HandlerUtility.add_to_telemetery_data("hostConnectTime" + telemetry_suffix, "%.3f" % connect_time)
+        if(ttfb is not None):
+            HandlerUtil.HandlerUtility.add_to_telemetery_data("hostTtfb" + telemetry_suffix, "%.3f" % ttfb)
+        HandlerUtil.HandlerUtility.add_to_telemetery_data("hostTotalTime" + telemetry_suffix, "%.3f" % total_time)
+        self.logger.log("host " + telemetry_suffix + " connect: %.3fs, ttfb: %s, total: %.3fs" % (connect_time, str(ttfb), total_time))
+        return result, resp, errorMsg, responseBody
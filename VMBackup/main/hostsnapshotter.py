@@ -31,7 +31,7 @@ import multiprocessing as mp
 import datetime
 import json
 from common import CommonVariables
-from HttpUtil import HttpUtil
+from hostsnapshotsession import HostSnapshotSession
 from Utils import Status
 from Utils import HostSnapshotObjects
 from Utils import HandlerUtil
@@ -40,12 +40,30 @@ import sys
 
 class HostSnapshotter(object):
     """description of class"""
-    def __init__(self, logger):
+    def __init__(self, logger, session = None):
         self.logger = logger
+        if(session is None):
+            session = HostSnapshotSession(logger)
+        self.session = session
+        self.snapshot_body_content = None
         self.configfile='/etc/azure/vmbackup.conf'
         self.snapshoturi = 'http://168.63.129.16/metadata/recsvc/snapshot/dosnapshot?api-version=2017-12-01'
         self.presnapshoturi = 'http://168.63.129.16/metadata/recsvc/snapshot/presnapshot?api-version=2017-12-01'
 
+    def prepare_snapshot(self, paras, taskId):
+        """
+        Serializes the dosnapshot request and opens the WireServer connection, so that
+        only the call itself is left for the time the file systems are frozen.
+        """
+        try:
+            diskIds = []
+            hostDoSnapshotRequestBodyObj = HostSnapshotObjects.HostDoSnapshotRequestBody(taskId, diskIds, paras.snapshotTaskToken, paras.backup_metadata)
+            self.snapshot_body_content = json.dumps(hostDoSnapshotRequestBodyObj, cls = HandlerUtil.ComplexEncoder)
+            self.session.connect()
+        except Exception as e:
+            errorMsg = "Failed to prepare the snapshot in host with error: %s, stack trace: %s" % (str(e), traceback.format_exc())
+            self.logger.log(errorMsg, False, 'Warning')
+
     def snapshotall(self, paras, freezer, g_fsfreeze_on, taskId):
         result = None
         blob_snapshot_info_array = []
@@ -63,18 +81,19 @@ class HostSnapshotter(object):
                 all_failed = True
             else:
                 diskIds = []
-                body_content = ''
+                body_content = self.snapshot_body_content
                 headers = {}
                 headers['Backup'] = 'true'
                 headers['Content-type'] = 'application/json'
-                hostDoSnapshotRequestBodyObj = HostSnapshotObjects.HostDoSnapshotRequestBody(taskId, diskIds, paras.snapshotTaskToken, meta_data)
-                body_content = json.dumps(hostDoSnapshotRequestBodyObj, cls = HandlerUtil.ComplexEncoder)
-                self.logger.log('Headers : ' + str(headers))
-                self.logger.log('Host Request body : ' + str(body_content))
-                http_util = HttpUtil(self.logger)
+                if(body_content is None):
+                    hostDoSnapshotRequestBodyObj = HostSnapshotObjects.HostDoSnapshotRequestBody(taskId, diskIds, paras.snapshotTaskToken, meta_data)
+                    body_content = json.dumps(hostDoSnapshotRequestBodyObj, cls = HandlerUtil.ComplexEncoder)
                 self.logger.log("start calling the snapshot rest api")
                 # initiate http call for blob-snapshot and get http response
-                result, httpResp, errMsg,responseBody = http_util.HttpCallGetResponse('POST', snapshoturi_obj, body_content, headers = headers, responseBodyRequired = True, isHttpCall = True)
+                # dosnapshot is not idempotent; the session retries it only if the WireServer cannot have received it
+                result, httpResp, errMsg,responseBody = self.session.post(snapshoturi_obj, body_content, headers, "DoSnapshot")
+                self.logger.log('Headers : ' + str(headers))
+                self.logger.log('Host Request body : ' + str(body_content))
                 self.logger.log("dosnapshot responseBody: " + responseBody)
                 if(httpResp != None):
                     HandlerUtil.HandlerUtility.add_to_telemetery_data("hotStatusCodeDoSnapshot", str(httpResp.status))
@@ -119,10 +138,9 @@ class HostSnapshotter(object):
                 body_content = json.dumps(hostPreSnapshotRequestBodyObj, cls = HandlerUtil.ComplexEncoder)
                 self.logger.log('Headers : ' + str(headers))
                 self.logger.log('Host Request body : ' + str(body_content))
-                http_util = HttpUtil(self.logger)
                 self.logger.log("start calling the presnapshot rest api")
                 # initiate http call for blob-snapshot and get http response
-                result, httpResp, errMsg,responseBody = http_util.HttpCallGetResponse('POST', presnapshoturi_obj, body_content, headers = headers, responseBodyRequired = True, isHttpCall = True)
+                result, httpResp, errMsg,responseBody = self.session.post(presnapshoturi_obj, body_content, headers, "PreSnapshot")
                 self.logger.log("presnapshot responseBody: " + responseBody)
                 if(httpResp != None):
                     statusCode = httpResp.status
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# VM Backup extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+import traceback
+from blobwriter import BlobWriter
+
+class StatusReport(object):
+    def __init__(self, blob_report_msg, file_report_msg, status_blob_uri, write_file):
+        self.blob_report_msg = blob_report_msg
+        self.file_report_msg = file_report_msg
+        self.status_blob_uri = status_blob_uri
+        self.write_file = write_file
+
+class StatusPublisher(object):
+    """
+    Writes the status file and uploads the status blob on a background thread.
+    Only the latest report is kept, so a report published while the previous
+    one is still being uploaded replaces any report still waiting.
+    """
+    def __init__(self, hutil, logger):
+        self.hutil = hutil
+        self.logger = logger
+        self.blob_writer = BlobWriter(hutil)
+        self.condition = threading.Condition()
+        self.pending = None
+        self.busy = False
+        self.thread = None
+
+    def publish(self, blob_report_msg, file_report_msg, status_blob_uri, write_file = True):
+        with self.condition:
+            if(self.pending is not None):
+                self.logger.log("status report replaced by a newer one before it was published", True)
+            self.pending = StatusReport(blob_report_msg, file_report_msg, status_blob_uri, write_file)
+            if(self.thread is None):
+                self.thread = threading.Thread(target = self.run)
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    def flush(self, timeout = None):
+        """
+        Waits until the latest report is published, for at most timeout seconds.
+        Returns True if it was.
+        """
+        deadline = None
+        if(timeout is not None):
+            deadline = time.time() + timeout
+        with self.condition:
+            while(self.pending is not None or self.busy):
+                if(deadline is None):
+                    self.condition.wait(1)
+                else:
+                    remaining = deadline - time.time()
+                    if(remaining <= 0):
+                        self.logger.log("status report not published after " + str(timeout) + " seconds", True, 'Warning')
+                        return False
+                    self.condition.wait(min(remaining, 1))
+        return True
+
+    def run(self):
+        while(True):
+            with self.condition:
+                while(self.pending is None):
+                    self.condition.wait()
+                report = self.pending
+                self.pending = None
+                self.busy = True
+            try:
+                self.write(report)
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def write(self, report):
+        if(report.write_file and report.file_report_msg is not None):
+            self.hutil.write_to_status_file(report.file_report_msg)
+            self.logger.log("file status report message:", True)
+            self.logger.log(report.file_report_msg, True)
+        try:
+            if(report.status_blob_uri is not None and report.status_blob_uri != ""):
+                if(report.blob_report_msg is not None):
+                    self.blob_writer.WriteBlob(report.blob_report_msg, report.status_blob_uri)
+                    self.logger.log("blob status report message:", True)
+                    self.logger.log(report.blob_report_msg, True)
+                else:
+                    self.logger.log("blob_report_msg is none", True)
+        except Exception as e:
+            err_msg = 'cannot write status to the status blob' + traceback.format_exc()
+            self.logger.log(err_msg, True, 'Warning')
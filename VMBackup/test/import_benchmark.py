@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# VM Backup extension
+#
+# Copyright 2014 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# Measures the time a new handler process takes to import the waagent
+# wrapper and initialize its logger, with the agent loaded lazily and with
+# the whole agent loaded up front as before.
+# Run it from the VMBackup directory: python test/import_benchmark.py [runs]
+#
+
+import os
+import subprocess
+import sys
+import time
+
+LAZY = """
+from Utils.WAAgentUtil import waagent
+waagent.LoggerInit('/dev/null', '/dev/null')
+"""
+
+FULL = LAZY + """
+waagent.load()
+"""
+
+def measure(code, runs):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.join(os.getcwd(), 'main')
+    timings = []
+    for i in range(0, runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env = env)
+        timings.append(time.time() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+def main():
+    runs = 20
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+    baseline = measure('pass', runs)
+    lazy = measure(LAZY, runs)
+    full = measure(FULL, runs)
+    print("median of %d runs, interpreter startup excluded" % runs)
+    print("lazy agent : %.1f ms" % ((lazy - baseline) * 1000))
+    print("full agent : %.1f ms" % ((full - baseline) * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -21,22 +21,109 @@
 
 import os
 import os.path
+import re
+import select
 import shlex
+import signal
 import sys
+import threading
+import time
 
+from collections import deque, namedtuple
 from subprocess import *
 
+ProcessProgress = namedtuple('ProcessProgress', ['percent', 'bytes_done'])
+
+# "Progress:  45.2%, ETA 01:23, ..." of cryptsetup-reencrypt
+PERCENT_PROGRESS_PATTERN = re.compile(r'Progress:\s*([\d.]+)%')
+# "1073741824 bytes (1.1 GB, 1.0 GiB) copied, ..." of dd status=progress
+BYTES_PROGRESS_PATTERN = re.compile(r'^(\d+) bytes')
+
+def parse_progress(line):
+    """
+    Returns the ProcessProgress printed in line by dd or cryptsetup-reencrypt, or None.
+    """
+    match = PERCENT_PROGRESS_PATTERN.search(line)
+    if match:
+        return ProcessProgress(percent=float(match.group(1)), bytes_done=None)
+
+    match = BYTES_PROGRESS_PATTERN.match(line)
+    if match:
+        return ProcessProgress(percent=None, bytes_done=int(match.group(1)))
+
+    return None
+
 class ProcessCommunicator(object):
     def __init__(self):
         self.stdout = None
         self.stderr = None
 
+class ProcessOutput(object):
+    """
+    One output stream of a process, split in lines as it is read. Only the last
+    lines are kept, unless the whole output was asked for.
+    """
+    def __init__(self, keep_all, tail_lines):
+        self.chunks = [] if keep_all else None
+        self.tail = deque(maxlen=tail_lines)
+        self.partial_line = ''
+
+    def feed(self, data):
+        """
+        Adds data to the output and returns the lines it completes. Progress
+        meters rewrite their line with a carriage return, so that ends a line too.
+        """
+        if self.chunks is not None:
+            self.chunks.append(data)
+
+        lines = re.split(r'[\r\n]', self.partial_line + data)
+        self.partial_line = lines.pop()
+
+        return self._add_lines(lines)
+
+    def close(self):
+        lines = [self.partial_line]
+        self.partial_line = ''
+
+        return self._add_lines(lines)
+
+    def getvalue(self):
+        return ''.join(self.chunks) if self.chunks is not None else None
+
+    def get_tail(self):
+        return '\n'.join(self.tail)
+
+    def _add_lines(self, lines):
+        lines = [line for line in lines if line.strip()]
+        self.tail.extend(lines)
+        return lines
+
 class CommandExecutor(object):
     """description of class"""
+
+    # lines of each output stream kept for the failure message
+    tail_lines = 100
+    # seconds a stopped process tree gets between SIGTERM and SIGKILL
+    kill_grace_period = 5
+
     def __init__(self, logger):
         self.logger = logger
 
-    def Execute(self, command_to_execute, raise_exception_on_failure=False, communicator=None, input=None, suppress_logging=False):
+    def Execute(self, command_to_execute, raise_exception_on_failure=False, communicator=None, input=None, suppress_logging=False,
+                timeout=None, cancel_event=None, progress_callback=None, stream_output=False):
+        """
+        Runs the command and returns its exit code.
+
+        The output is read as it is written: the whole of it is returned through
+        communicator, otherwise only its last lines are kept for the failure
+        message. With stream_output, every line is logged as it arrives, and
+        progress_callback is called with the ProcessProgress parsed from the lines
+        that report it.
+
+        The command and the processes it started are killed when timeout seconds
+        have passed or cancel_event is set. The command stays in the process group
+        of the handler, so that killing the handler kills it too.
+        """
         if type(command_to_execute) == unicode:
             command_to_execute = command_to_execute.encode('ascii', 'ignore')
 
@@ -55,16 +142,33 @@ class CommandExecutor(object):
                     self.logger.log("Process creation failed: " + str(e))
                 return -1
 
-        stdout, stderr = proc.communicate(input=input)
+        keep_all = isinstance(communicator, ProcessCommunicator)
+        stdout = ProcessOutput(keep_all, self.tail_lines)
+        stderr = ProcessOutput(keep_all, self.tail_lines)
+
+        deadline = time.time() + timeout if timeout is not None else None
+
+        def on_line(line):
+            if stream_output and not suppress_logging:
+                self.logger.log(line)
+            if progress_callback:
+                progress = parse_progress(line)
+                if progress:
+                    progress_callback(progress)
+
+        stop_reason = self._communicate(proc, input, {proc.stdout: stdout, proc.stderr: stderr}, on_line, deadline, cancel_event)
         return_code = proc.returncode
 
-        if isinstance(communicator, ProcessCommunicator):
-            communicator.stdout, communicator.stderr = stdout, stderr
+        if keep_all:
+            communicator.stdout, communicator.stderr = stdout.getvalue(), stderr.getvalue()
 
-        if int(return_code) != 0:
-            msg = "Command {0} failed with return code {1}".format(command_to_execute, return_code)
-            msg += "\nstdout:\n" + stdout
-            msg += "\nstderr:\n" + stderr
+        if stop_reason or int(return_code) != 0:
+            if stop_reason:
+                msg = "Command {0} {1} and was killed".format(command_to_execute, stop_reason)
+            else:
+                msg = "Command {0} failed with return code {1}".format(command_to_execute, return_code)
+            msg += "\nstdout:\n" + stdout.get_tail()
+            msg += "\nstderr:\n" + stderr.get_tail()
 
             if not suppress_logging:
                 self.logger.log(msg)
@@ -73,9 +177,135 @@ class CommandExecutor(object):
                 raise Exception(msg)
 
         return return_code
-    
-    def ExecuteInBash(self, command_to_execute, raise_exception_on_failure=False, communicator=None, input=None, suppress_logging=False):
+
+    def _communicate(self, proc, input, outputs, on_line, deadline, cancel_event):
+        """
+        Feeds input to the process and its output to outputs until it exits.
+        Returns why the process was stopped, or None if it exited by itself.
+        """
+        stdin_writer = None
+        if input:
+            # written on a thread so that a process that writes before reading cannot block us
+            stdin_writer = threading.Thread(target=self._write_stdin, args=(proc.stdin, input))
+            stdin_writer.daemon = True
+            stdin_writer.start()
+        else:
+            proc.stdin.close()
+
+        streams = list(outputs.keys())
+        stop_reason = None
+
+        while streams or proc.poll() is None:
+            wait_time = 1.0
+
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    stop_reason = "timed out"
+                    break
+                wait_time = min(wait_time, remaining)
+
+            if cancel_event is not None and cancel_event.is_set():
+                stop_reason = "was cancelled"
+                break
+
+            if not streams:
+                time.sleep(min(wait_time, 0.1))
+                continue
+
+            readable, _, _ = select.select(streams, [], [], wait_time)
+
+            for stream in readable:
+                data = os.read(stream.fileno(), 65536)
+                if data:
+                    lines = outputs[stream].feed(data)
+                else:
+                    streams.remove(stream)
+                    lines = outputs[stream].close()
+                for line in lines:
+                    on_line(line)
+
+        if stop_reason:
+            self._kill_process_tree(proc)
+
+        proc.wait()
+
+        for stream in outputs.keys():
+            stream.close()
+
+        if stdin_writer:
+            stdin_writer.join()
+
+        return stop_reason
+
+    def _write_stdin(self, stdin, input):
+        try:
+            stdin.write(input)
+        except IOError:
+            # the process exited without reading all of its input
+            pass
+        finally:
+            try:
+                stdin.close()
+            except IOError:
+                pass
+
+    def _get_descendants(self, pid):
+        """
+        Returns the pids of the processes started by pid and by its children, read from /proc.
+        """
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(os.path.join('/proc', entry, 'stat')) as f:
+                    # the fields after the command name, which may contain spaces: state ppid ...
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (IOError, OSError, IndexError, ValueError):
+                # the process exited while /proc was read
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+
+        descendants = []
+        parents = [pid]
+        while parents:
+            for child in children.get(parents.pop(), []):
+                descendants.append(child)
+                parents.append(child)
+        return descendants
+
+    def _is_alive(self, pid):
+        try:
+            with open(os.path.join('/proc', str(pid), 'stat')) as f:
+                # a zombie has exited, it only waits for its new parent to reap it
+                return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+        except (IOError, OSError, IndexError):
+            return False
+
+    def _kill_process_tree(self, proc):
+        # collected before the first signal, the children of a killed process are reparented
+        descendants = self._get_descendants(proc.pid)
+
+        for sig in [signal.SIGTERM, signal.SIGKILL]:
+            descendants = [pid for pid in descendants if self._is_alive(pid)]
+            descendants.extend(pid for pid in self._get_descendants(proc.pid) if pid not in descendants)
+
+            for pid in ([proc.pid] if proc.poll() is None else []) + descendants:
+                try:
+                    os.kill(pid, sig)
+                except OSError:
+                    pass
+
+            deadline = time.time() + self.kill_grace_period
+            while time.time() < deadline:
+                if proc.poll() is None or any(self._is_alive(pid) for pid in descendants):
+                    time.sleep(0.1)
+                else:
+                    return
+
+    def ExecuteInBash(self, command_to_execute, raise_exception_on_failure=False, communicator=None, input=None, suppress_logging=False, **kwargs):
         command_to_execute = 'bash -c "{0}{1}"'.format('set -e; ' if raise_exception_on_failure else '',
                                                       command_to_execute)
         
-        return self.Execute(command_to_execute, raise_exception_on_failure, communicator, input, suppress_logging)
+        return self.Execute(command_to_execute, raise_exception_on_failure, communicator, input, suppress_logging, **kwargs)
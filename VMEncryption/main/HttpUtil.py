@@ -29,7 +29,7 @@ from Utils.WAAgentUtil import waagent
 
 class HttpUtil(object):
     """description of class"""
-    def __init__(self, logger):
+    def __init__(self, logger, keep_alive=False):
         self.logger = logger
         try:
             waagent.MyDistro = waagent.GetMyDistro()
@@ -40,7 +40,39 @@ class HttpUtil(object):
             Config = waagent.ConfigurationProvider()
         self.proxyHost = Config.get("HttpProxy.Host")
         self.proxyPort = Config.get("HttpProxy.Port")
+        # with keep_alive, the connection is reused by the next call to the same host,
+        # so the response of each call must be read before the next one is made
+        self.keep_alive = keep_alive
         self.connection = None
+        self.connection_host = None
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception as e:
+                self.logger.log("Failed to close the http connection: {0}".format(e))
+            self.connection = None
+            self.connection_host = None
+
+    def get_connection(self, uri_obj):
+        if self.keep_alive and self.connection is not None and self.connection_host == uri_obj.hostname:
+            return self.connection
+
+        self.close()
+
+        if self.proxyHost is None or self.proxyPort is None:
+            self.connection = httplib.HTTPSConnection(uri_obj.hostname, timeout = 10)
+        else:
+            self.logger.log("proxyHost is not empty, so use the proxy to call the http.")
+            self.connection = httplib.HTTPSConnection(self.proxyHost, self.proxyPort, timeout = 10)
+            if uri_obj.scheme.lower() == "https":
+                self.connection.set_tunnel(uri_obj.hostname, 443)
+            else:
+                self.connection.set_tunnel(uri_obj.hostname, 80)
+        self.connection_host = uri_obj.hostname
+
+        return self.connection
 
     """
     snapshot also called this. so we should not write the file/read the file in this method.
@@ -51,22 +83,25 @@ class HttpUtil(object):
             uri_obj = urlparse.urlparse(http_uri)
             #parse the uri str here
             if self.proxyHost is None or self.proxyPort is None:
-                self.connection = httplib.HTTPSConnection(uri_obj.hostname, timeout = 10)
                 if uri_obj.query is not None:
-                    self.connection.request(method = method, url=(uri_obj.path +'?'+ uri_obj.query), body = data, headers = headers)
+                    url = uri_obj.path +'?'+ uri_obj.query
                 else:
-                    self.connection.request(method = method, url=(uri_obj.path), body = data, headers = headers)
-                resp = self.connection.getresponse()
+                    url = uri_obj.path
             else:
-                self.logger.log("proxyHost is not empty, so use the proxy to call the http.")
-                self.connection = httplib.HTTPSConnection(self.proxyHost, self.proxyPort, timeout = 10)
-                if uri_obj.scheme.lower() == "https":
-                    self.connection.set_tunnel(uri_obj.hostname, 443)
-                else:
-                    self.connection.set_tunnel(uri_obj.hostname, 80)
-                self.connection.request(method = method, url = (http_uri), body = data, headers = headers)
-                resp = self.connection.getresponse()
-            return resp
+                url = http_uri
+
+            # a kept-alive connection may have been closed by the server while idle, retry it once on a new one
+            for attempt in range(0, 2):
+                reused = self.keep_alive and self.connection is not None and self.connection_host == uri_obj.hostname
+                try:
+                    connection = self.get_connection(uri_obj)
+                    connection.request(method = method, url = url, body = data, headers = headers)
+                    return connection.getresponse()
+                except (httplib.HTTPException, IOError) as e:
+                    self.close()
+                    if not reused:
+                        raise
+                    self.logger.log("Reused http connection failed, retrying on a new one: {0}".format(e))
         except Exception as e:
             errorMsg = "Failed to call http with error: {0}, stack trace: {1}".format(e, traceback.format_exc())
             self.logger.log(errorMsg)
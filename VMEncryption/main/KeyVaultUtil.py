@@ -25,15 +25,91 @@ import base64
 import traceback
 import re
 import os
+import time
 
 from HttpUtil import HttpUtil
 from Common import *
 from urlparse import urlparse
 
-class KeyVaultUtil(object):
+class KeyVaultSession(object):
+    """
+    State shared by the Key Vault calls of a process: the AAD authority of each
+    vault, the access tokens until they are about to expire and one keep-alive
+    connection per host, so that creating several secrets for the same vault and
+    KEK costs one authority discovery, one token request and one TLS handshake.
+    """
+    # a cached token is not used when it expires in less than this many seconds
+    token_expiry_margin = 300
+
     def __init__(self, logger):
+        self.logger = logger
+        self.authorize_uris = {}
+        self.access_tokens = {}
+        self.http_utils = {}
+
+    def call(self, method, http_uri, data, headers):
+        """
+        Returns the response and its body, which is always read so that the
+        connection can take the next request, or (None, None) if the call failed.
+        """
+        hostname = urlparse(http_uri).hostname
+
+        if hostname not in self.http_utils:
+            self.http_utils[hostname] = HttpUtil(self.logger, keep_alive=True)
+
+        http_util = self.http_utils[hostname]
+        result = http_util.Call(method=method, http_uri=http_uri, data=data, headers=headers)
+        if result is None:
+            return None, None
+
+        result_content = result.read()
+        if result.will_close:
+            http_util.close()
+
+        return result, result_content
+
+    def get_authorize_uri(self, key_vault_url):
+        return self.authorize_uris.get(key_vault_url)
+
+    def set_authorize_uri(self, key_vault_url, authorize_uri):
+        self.authorize_uris[key_vault_url] = authorize_uri
+
+    def get_access_token(self, authorize_uri, resource, client_id):
+        cached = self.access_tokens.get((authorize_uri, resource, client_id))
+        if cached is None:
+            return None
+
+        access_token, expires_on = cached
+        if expires_on - time.time() < self.token_expiry_margin:
+            return None
+
+        self.logger.log("using the cached access token for {0}".format(resource))
+        return access_token
+
+    def set_access_token(self, authorize_uri, resource, client_id, access_token, expires_in):
+        self.access_tokens[(authorize_uri, resource, client_id)] = (access_token, time.time() + int(expires_in))
+
+    def close(self):
+        for http_util in self.http_utils.values():
+            http_util.close()
+        self.http_utils = {}
+
+key_vault_session = None
+
+def get_key_vault_session(logger):
+    """
+    Returns the KeyVaultSession shared by the whole process.
+    """
+    global key_vault_session
+    if key_vault_session is None:
+        key_vault_session = KeyVaultSession(logger)
+    return key_vault_session
+
+class KeyVaultUtil(object):
+    def __init__(self, logger, session=None):
         self.api_version = "2015-06-01"
         self.logger = logger
+        self.session = session if session is not None else get_key_vault_session(logger)
 
     def urljoin(self,*args):
         """
@@ -52,20 +128,28 @@ class KeyVaultUtil(object):
             passphrase_encoded = base64.standard_b64encode(Passphrase)
             keys_uri = self.urljoin(KeyVaultURL, "keys")
 
-            http_util = HttpUtil(self.logger)
-            headers = {}
-            result = http_util.Call(method='GET', http_uri=keys_uri, data=None, headers=headers)
-            http_util.connection.close()
+            """
+            the authority of the vault is discovered from the challenge of an unauthenticated call
+            """
+            authorize_uri = self.session.get_authorize_uri(KeyVaultURL)
+            if authorize_uri is None:
+                headers = {}
+                result, result_content = self.session.call(method='GET', http_uri=keys_uri, data=None, headers=headers)
+                if result is None:
+                    self.logger.log("the call to {0} failed".format(keys_uri))
+                    return None
+                bearerHeader = result.getheader("www-authenticate")
+
+                authorize_uri = self.get_authorize_uri(bearerHeader)
+                if authorize_uri is None:
+                    self.logger.log("the authorize uri is None")
+                    return None
+                self.session.set_authorize_uri(KeyVaultURL, authorize_uri)
+
             """
             get the access token 
             """
             self.logger.log("getting the access token.")
-            bearerHeader = result.getheader("www-authenticate")
-
-            authorize_uri = self.get_authorize_uri(bearerHeader)
-            if authorize_uri is None:
-                self.logger.log("the authorize uri is None")
-                return None
 
             parsed_url = urlparse(KeyVaultURL)
             vault_domain = re.findall(r".*(vault.*)", parsed_url.netloc)[0]
@@ -101,6 +185,10 @@ class KeyVaultUtil(object):
         if AADClientSecret and AADClientCertThumbprint:
             raise Exception("Both AADClientSecret nor AADClientCertThumbprint were specified")
 
+        access_token = self.session.get_access_token(AuthorizeUri, KeyVaultResourceName, AADClientID)
+        if access_token is not None:
+            return access_token
+
         if AADClientCertThumbprint:
             try:
                 import adal
@@ -115,24 +203,25 @@ class KeyVaultUtil(object):
             context = adal.AuthenticationContext(AuthorizeUri)
             result_json = context.acquire_token_with_client_certificate(KeyVaultResourceName, AADClientID, prv_data, AADClientCertThumbprint)
             access_token = result_json["accessToken"]
+            self.session.set_access_token(AuthorizeUri, KeyVaultResourceName, AADClientID, access_token, result_json["expiresIn"])
             return access_token
 
 
         token_uri = AuthorizeUri + "/oauth2/token"
         request_content = "resource=" + urllib.quote(KeyVaultResourceName) + "&client_id=" + AADClientID + "&client_secret=" + urllib.quote(AADClientSecret) + "&grant_type=client_credentials"
         headers = {}
-        http_util = HttpUtil(self.logger)
-        result = http_util.Call(method='POST', http_uri=token_uri, data=request_content, headers=headers)
+        result, result_content = self.session.call(method='POST', http_uri=token_uri, data=request_content, headers=headers)
+        if result is None:
+            return None
 
         self.logger.log("{0} {1}".format(result.status, result.getheaders()))
-        result_content = result.read()
         if result.status != httplib.OK and result.status != httplib.ACCEPTED:
             self.logger.log(str(result_content))
             return None
-        http_util.connection.close()
 
         result_json = json.loads(result_content)
         access_token = result_json["access_token"]
+        self.session.set_access_token(AuthorizeUri, KeyVaultResourceName, AADClientID, access_token, result_json["expires_in"])
         return access_token
 
     """
@@ -151,15 +240,14 @@ class KeyVaultUtil(object):
             headers["Content-Type"] = "application/json"
             headers["Authorization"] = "Bearer " + str(AccessToken)
             relative_path = KeyEncryptionKeyURL + "/wrapkey" + '?api-version=' + self.api_version
-            http_util = HttpUtil(self.logger)
-            result = http_util.Call(method='POST', http_uri=relative_path, data=request_content, headers=headers)
+            result, result_content = self.session.call(method='POST', http_uri=relative_path, data=request_content, headers=headers)
+            if result is None:
+                return None
 
-            result_content = result.read()
             self.logger.log("result_content is: {0}".format(result_content))
             self.logger.log("{0} {1}".format(result.status, result.getheaders()))
             if result.status != httplib.OK and result.status != httplib.ACCEPTED:
                 return None
-            http_util.connection.close()
             result_json = json.loads(result_content)
             secret_value = result_json[u'value']
             return secret_value
@@ -182,18 +270,17 @@ class KeyVaultUtil(object):
             else:
                 request_content = '{{"value":"{0}","attributes":{{"enabled":"true"}},"tags":{{"DiskEncryptionKeyEncryptionAlgorithm":"{1}","DiskEncryptionKeyFileName":"{2}"}}}}'\
                     .format(str(secret_value), KeyEncryptionAlgorithm, DiskEncryptionKeyFileName)
-            http_util = HttpUtil(self.logger)
             headers = {}
             headers["Content-Type"] = "application/json"
             headers["Authorization"] = "Bearer " + AccessToken
-            result = http_util.Call(method='PUT', http_uri=secret_keyvault_uri + '?api-version=' + self.api_version, data=request_content, headers=headers)
+            result, result_content = self.session.call(method='PUT', http_uri=secret_keyvault_uri + '?api-version=' + self.api_version, data=request_content, headers=headers)
+            if result is None:
+                return None
 
             self.logger.log("{0} {1}".format(result.status, result.getheaders()))
-            result_content = result.read()
             self.logger.log("result_content is {0}".format(result_content))
             result_json = json.loads(result_content)
             secret_id = result_json["id"]
-            http_util.connection.close()
             if result.status != httplib.OK and result.status != httplib.ACCEPTED:
                 self.logger.log("the result status failed.")
                 return None
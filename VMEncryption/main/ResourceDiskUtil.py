@@ -19,14 +19,14 @@
 """ Functionality to encrypt the Azure resource disk"""
 
 import uuid
-import time
 import json
 import types
 import os
 
-from CommandExecutor import CommandExecutor
+from CommandExecutor import CommandExecutor, ProcessCommunicator
 from Common import CommonVariables
 from DiskUtil import DiskUtil
+from UdevUtil import UdevUtil
 
 class ResourceDiskUtil(object):
     """ Resource Disk Encryption Utilities """
@@ -41,11 +41,16 @@ class ResourceDiskUtil(object):
     RD_KEY_FILE = '/mnt/azure_bek_disk/LinuxPassPhraseFileName'
     RD_KEY_FILE_MOUNT_POINT = '/mnt/azure_bek_disk'
     RD_KEY_VOLUME_LABEL = 'BEK VOLUME'
+    # the longest wait for udev to create the partition made by prepare_partition
+    RD_PARTITION_TIMEOUT = 45
+    # a hung key test must not block the boot
+    RD_KEY_TEST_TIMEOUT = 60
 
     def __init__(self, hutil, logger, distro_patcher):
         self.hutil = hutil
         self.logger = logger
         self.executor = CommandExecutor(self.logger)
+        self.udev_util = UdevUtil(self.logger, self.executor)
         self.disk_util = DiskUtil(hutil=self.hutil, patching=distro_patcher, logger=self.logger, encryption_environment=None)
         self.mapper_name = str(uuid.uuid4())
         self.mapper_path = self.DM_PREFIX + self.mapper_name
@@ -67,10 +72,7 @@ class ResourceDiskUtil(object):
 
     def is_luks_device(self):
         """ checks if the device is set up with a luks header """
-        if not self.resource_disk_partition_exists():
-            return False
-        cmd = 'cryptsetup isLuks ' + self.RD_DEV_PATH
-        return (int)(self.executor.Execute(cmd, suppress_logging=True)) == CommonVariables.process_success
+        return self.udev_util.probe(self.RD_DEV_PATH).is_luks
 
     def is_luks_device_opened(self):
         """ check for presence of luks uuid to see if device was already opened """
@@ -86,17 +88,15 @@ class ResourceDiskUtil(object):
         if not self.resource_disk_partition_exists():
             return False
         cmd = 'cryptsetup luksOpen ' + self.RD_DEV_PATH + ' --test-passphrase --key-file ' + self.RD_KEY_FILE
-        return (int)(self.executor.Execute(cmd, suppress_logging=True)) == CommonVariables.process_success
+        return (int)(self.executor.Execute(cmd, suppress_logging=True, timeout=self.RD_KEY_TEST_TIMEOUT)) == CommonVariables.process_success
 
     def resource_disk_exists(self):
         """ true if the udev name for resource disk exists """
-        cmd = 'test -b ' + self.RD_BASE_DEV_PATH
-        return (int)(self.executor.Execute(cmd, suppress_logging=True)) == CommonVariables.process_success
+        return self.udev_util.is_block_device(self.RD_BASE_DEV_PATH)
 
     def resource_disk_partition_exists(self):
         """ true if udev name for resource disk partition exists """
-        cmd = 'test -b ' + self.RD_DEV_PATH
-        return (int)(self.executor.Execute(cmd, suppress_logging=True)) == CommonVariables.process_success
+        return self.udev_util.is_block_device(self.RD_DEV_PATH)
 
     def format_luks(self):
         """ set up resource disk crypt device layer using disk util """
@@ -123,7 +123,12 @@ class ResourceDiskUtil(object):
         """ attempt to mount the key volume and verify existence of key file"""
         if not os.path.exists(self.RD_KEY_FILE):
             self.disk_util.make_sure_path_exists(self.RD_KEY_FILE_MOUNT_POINT)
-            key_volume_device_name = os.popen('blkid -L "' + self.RD_KEY_VOLUME_LABEL + '"').read().strip()
+            key_volume_device_name = self.udev_util.find_device_by_label(self.RD_KEY_VOLUME_LABEL)
+            if not key_volume_device_name:
+                # the by-label link is missing when udev has not processed the key volume yet
+                proc_comm = ProcessCommunicator()
+                self.executor.Execute('blkid -L "' + self.RD_KEY_VOLUME_LABEL + '"', communicator=proc_comm, suppress_logging=True)
+                key_volume_device_name = (proc_comm.stdout or '').strip()
             self.disk_util.mount_filesystem(key_volume_device_name, self.RD_KEY_FILE_MOUNT_POINT)
         return os.path.exists(self.RD_KEY_FILE)
         
@@ -208,10 +213,8 @@ class ResourceDiskUtil(object):
         cmd = 'parted ' + self.RD_BASE_DEV_PATH + ' mkpart primary ext4 0% 100%'
         if self.executor.ExecuteInBash(cmd) == CommonVariables.process_success:
             # wait for the corresponding udev name to become available
-            for i in range(0, 10):
-                time.sleep(i)
-                if self.resource_disk_partition_exists():
-                    return True
+            if self.udev_util.wait_for_block_device(self.RD_DEV_PATH, self.RD_PARTITION_TIMEOUT):
+                return True
         self.logger.log('unable to make resource disk partition')
         return False
 
@@ -230,7 +233,8 @@ class ResourceDiskUtil(object):
             self.logger.log("resource disk already encrypted and mounted", level='Info')
             return True
 
-        if self.resource_disk_exists() and self.resource_disk_partition_exists() and self.is_luks_device() and self.is_valid_key():
+        # a luks header on the partition implies that the disk and the partition exist
+        if self.udev_util.probe(self.RD_DEV_PATH).is_luks and self.is_valid_key():
             # store the currently associated path and name
             current_mapper_name = self.get_rd_device_mapper()
             if current_mapper_name:
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# *********************************************************
+# Copyright (c) Microsoft. All rights reserved.
+#
+# Apache 2.0 License
+#
+# You may obtain a copy of the License at
+# http:#www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# *********************************************************
+
+""" Block device readiness through udev, and device state read without running tools """
+
+import math
+import os
+import stat
+import time
+
+from collections import namedtuple
+from Common import CommonVariables
+
+BlockDeviceState = namedtuple('BlockDeviceState', ['exists', 'is_luks'])
+
+class UdevUtil(object):
+    """ Udev Utilities """
+
+    LUKS_MAGIC = 'LUKS\xba\xbe'
+    BY_LABEL_PATH = '/dev/disk/by-label'
+    # interval between udev settles while a device the kernel has not announced yet is awaited
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, logger, executor):
+        self.logger = logger
+        self.executor = executor
+
+    def settle(self, timeout, exit_if_exists=None):
+        """ wait at most timeout seconds for udev to process its queued events """
+        cmd = 'udevadm settle --timeout=' + str(int(math.ceil(timeout)))
+        if exit_if_exists:
+            cmd += ' --exit-if-exists=' + exit_if_exists
+        return (int)(self.executor.Execute(cmd, suppress_logging=True)) == CommonVariables.process_success
+
+    def wait_for_block_device(self, dev_path, timeout):
+        """ wait until udev has created dev_path, for at most timeout seconds """
+        deadline = time.time() + timeout
+        while True:
+            if self.is_block_device(dev_path):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.logger.log('{0} did not appear within {1} seconds'.format(dev_path, timeout))
+                return False
+            # settle returns at once when the kernel event is not queued yet
+            self.settle(remaining, exit_if_exists=dev_path)
+            if not self.is_block_device(dev_path):
+                time.sleep(min(self.POLL_INTERVAL, max(deadline - time.time(), 0)))
+
+    def is_block_device(self, dev_path):
+        """ true if dev_path exists and is a block device """
+        try:
+            return stat.S_ISBLK(os.stat(dev_path).st_mode)
+        except OSError:
+            return False
+
+    def has_luks_header(self, dev_path):
+        """ true if the device starts with a luks header """
+        try:
+            with open(dev_path, 'rb') as f:
+                return f.read(len(self.LUKS_MAGIC)) == self.LUKS_MAGIC
+        except IOError:
+            return False
+
+    def probe(self, dev_path):
+        """ existence and luks header of a device, read with one stat and one superblock read """
+        if not self.is_block_device(dev_path):
+            return BlockDeviceState(exists=False, is_luks=False)
+        return BlockDeviceState(exists=True, is_luks=self.has_luks_header(dev_path))
+
+    def find_device_by_label(self, label):
+        """ device path of the file system labeled label, from the udev by-label links """
+        # udev escapes the characters of the label that are not allowed in a file name
+        escaped_label = ''.join(c if c.isalnum() or c in '#+-.:=@_' else '\\x{0:02x}'.format(ord(c)) for c in label)
+        label_path = os.path.join(self.BY_LABEL_PATH, escaped_label)
+        if os.path.exists(label_path):
+            return os.path.realpath(label_path)
+        return None
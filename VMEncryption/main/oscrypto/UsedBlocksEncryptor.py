@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+#
+# VM Backup extension
+#
+# Copyright 2015 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+#
+
+import hashlib
+import json
+import os
+import os.path
+import re
+import struct
+
+from CommandExecutor import *
+
+class UsedBlocksEncryptor(object):
+    """
+    Encrypts a block device in place by copying it from its raw device to the
+    dm-crypt device opened on top of it (the LUKS header is detached, so both
+    have the same layout).
+
+    Only the blocks the file system has allocated are copied. The list of
+    extents to copy is saved in state_dir before the first write, because the
+    file system cannot be read any more once encryption has started.
+
+    Progress is checkpointed to state_dir after every chunk so that an
+    interrupted run resumes where it stopped, and a completed run is not
+    repeated. Before a chunk is written, the digest of each of its plaintext
+    sectors is journaled; on resume, the sectors of the interrupted chunk that
+    still read back as plaintext are written again and the ones that were
+    already encrypted are left alone.
+    """
+
+    CHUNK_SIZE = 32 * 1024 * 1024
+    SECTOR_SIZE = 512
+    DIGEST_SIZE = 8
+    # used extents closer than this are copied as one
+    MERGE_GAP = 1024 * 1024
+
+    def __init__(self, source_device, target_device, state_dir, command_executor, logger, progress_callback=None):
+        self.source_device = source_device
+        self.target_device = target_device
+        self.state_dir = state_dir
+        self.command_executor = command_executor
+        self.logger = logger
+        self.progress_callback = progress_callback
+
+        self.extents_file = os.path.join(state_dir, 'osencrypt_extents')
+        self.checkpoint_file = os.path.join(state_dir, 'osencrypt_checkpoint')
+        self.journal_file = os.path.join(state_dir, 'osencrypt_journal')
+
+    def has_checkpoint(self):
+        return os.path.exists(self.checkpoint_file)
+
+    def encrypt(self, device_size):
+        checkpoint = self._read_json(self.checkpoint_file)
+        extents = self._read_json(self.extents_file)
+
+        if checkpoint and checkpoint.get('complete'):
+            self.logger.log("{0} is already encrypted".format(self.source_device))
+            return
+
+        if checkpoint is None or extents is None:
+            extents = self.get_used_extents(device_size)
+            self._write_json(self.extents_file, extents)
+            checkpoint = {'copied': 0, 'in_flight': None}
+            self._write_json(self.checkpoint_file, checkpoint)
+        else:
+            self.logger.log("Resuming encryption of {0} after {1} bytes".format(self.source_device, checkpoint['copied']))
+
+        total = sum(length for offset, length in extents)
+        self.logger.log("Encrypting {0} of {1} bytes of {2}".format(total, device_size, self.source_device))
+
+        # the raw device may still cache blocks that were overwritten through the dm-crypt device
+        self.command_executor.Execute('blockdev --flushbufs {0}'.format(self.source_device), False)
+
+        source_fd = os.open(self.source_device, os.O_RDONLY)
+        target_fd = os.open(self.target_device, os.O_WRONLY)
+
+        try:
+            copied = checkpoint['copied']
+
+            if checkpoint['in_flight']:
+                offset, length = checkpoint['in_flight']
+                self._recover_chunk(source_fd, target_fd, offset, length)
+                copied += length
+
+            reported_percent = None
+
+            for offset, length in self.get_chunks(extents, copied):
+                data = self._pread(source_fd, offset, length)
+
+                self._write_journal(offset, data)
+                self._write_json(self.checkpoint_file, {'copied': copied, 'in_flight': [offset, length]})
+
+                self._pwrite(target_fd, offset, data)
+                os.fsync(target_fd)
+
+                copied += length
+
+                percent = copied * 100 // total if total else 100
+                if percent != reported_percent:
+                    reported_percent = percent
+                    self._report_progress(percent)
+
+            self._write_json(self.checkpoint_file, {'copied': copied, 'in_flight': None, 'complete': True})
+        finally:
+            os.close(source_fd)
+            os.close(target_fd)
+
+        self.logger.log("Encrypted {0} bytes of {1}".format(copied, self.source_device))
+
+        # the checkpoint is kept so that a run interrupted from now on does not encrypt the device twice
+        for state_file in [self.journal_file, self.extents_file]:
+            if os.path.exists(state_file):
+                os.remove(state_file)
+
+    def get_chunks(self, extents, skip=0):
+        """
+        Splits extents into chunks of at most CHUNK_SIZE bytes, leaving out the
+        first skip bytes.
+        """
+        for offset, length in extents:
+            if skip >= length:
+                skip -= length
+                continue
+
+            offset += skip
+            length -= skip
+            skip = 0
+
+            while length > 0:
+                chunk_length = min(length, self.CHUNK_SIZE)
+                yield offset, chunk_length
+                offset += chunk_length
+                length -= chunk_length
+
+    def get_used_extents(self, device_size):
+        """
+        Returns the sorted list of [offset, length] byte ranges of the device that
+        are not free space of its file system. The whole device is returned when
+        the file system type is not known.
+        """
+        proc_comm = ProcessCommunicator()
+        self.command_executor.Execute('blkid -s TYPE -o value {0}'.format(self.source_device), communicator=proc_comm)
+        fs_type = (proc_comm.stdout or '').strip()
+
+        self.logger.log("File system on {0}: {1}".format(self.source_device, fs_type or 'unknown'))
+
+        layout = None
+
+        try:
+            if fs_type.startswith('ext'):
+                layout = self._get_ext_layout()
+            elif fs_type == 'xfs':
+                layout = self._get_xfs_layout()
+        except Exception as e:
+            self.logger.log("Could not read the free space of {0}: {1}".format(self.source_device, e))
+
+        if layout is None:
+            self.logger.log("Encrypting all blocks of {0}".format(self.source_device))
+            return [[0, device_size]]
+
+        fs_size, free_extents = layout
+        extents = self.get_used_extents_from_free(device_size, fs_size, free_extents)
+
+        self.logger.log("{0} bytes in {1} extents are in use on {2}".format(sum(length for offset, length in extents),
+                                                                             len(extents),
+                                                                             self.source_device))
+
+        return extents
+
+    def get_used_extents_from_free(self, device_size, fs_size, free_extents):
+        """
+        Returns the complement of free_extents on the device. Space past the end
+        of the file system is considered used.
+        """
+        used = []
+        position = 0
+
+        for offset, length in sorted(free_extents):
+            end = min(offset + length, fs_size)
+            if offset > position:
+                used.append([position, offset - position])
+            position = max(position, end)
+
+        if position < device_size:
+            used.append([position, device_size - position])
+
+        merged = []
+
+        for offset, length in used:
+            if merged and offset - (merged[-1][0] + merged[-1][1]) < self.MERGE_GAP:
+                merged[-1][1] = offset + length - merged[-1][0]
+            else:
+                merged.append([offset, length])
+
+        return merged
+
+    def _get_ext_layout(self):
+        proc_comm = ProcessCommunicator()
+        self.command_executor.Execute('dumpe2fs {0}'.format(self.source_device),
+                                      raise_exception_on_failure=True,
+                                      communicator=proc_comm,
+                                      suppress_logging=True)
+
+        return self.parse_dumpe2fs(proc_comm.stdout)
+
+    def _get_xfs_layout(self):
+        proc_comm = ProcessCommunicator()
+        self.command_executor.Execute("xfs_db -r -c 'sb 0' -c 'p blocksize agblocks dblocks' {0}".format(self.source_device),
+                                      raise_exception_on_failure=True,
+                                      communicator=proc_comm)
+        superblock = proc_comm.stdout
+
+        proc_comm = ProcessCommunicator()
+        self.command_executor.Execute("xfs_db -r -c 'freesp -d' {0}".format(self.source_device),
+                                      raise_exception_on_failure=True,
+                                      communicator=proc_comm,
+                                      suppress_logging=True)
+
+        return self.parse_xfs_freesp(superblock, proc_comm.stdout)
+
+    @staticmethod
+    def parse_dumpe2fs(output):
+        """
+        Returns the size in bytes and the free [offset, length] byte ranges of an
+        ext file system from the output of dumpe2fs.
+        """
+        block_size = int(re.search(r'^Block size:\s+(\d+)', output, re.MULTILINE).group(1))
+        block_count = int(re.search(r'^Block count:\s+(\d+)', output, re.MULTILINE).group(1))
+
+        free_extents = []
+
+        # the per-group lines are indented, unlike the free block count of the superblock
+        for ranges in re.findall(r'^\s+Free blocks: (.*)$', output, re.MULTILINE):
+            for block_range in ranges.split(','):
+                block_range = block_range.strip()
+                if not block_range:
+                    continue
+                first, _, last = block_range.partition('-')
+                first = int(first)
+                last = int(last) if last else first
+                free_extents.append([first * block_size, (last - first + 1) * block_size])
+
+        return block_count * block_size, free_extents
+
+    @staticmethod
+    def parse_xfs_freesp(superblock, freesp):
+        """
+        Returns the size in bytes and the free [offset, length] byte ranges of an
+        xfs file system from the output of xfs_db 'p blocksize agblocks dblocks'
+        and 'freesp -d'.
+        """
+        fields = dict(re.findall(r'^(\w+) = (\d+)', superblock, re.MULTILINE))
+        block_size = int(fields['blocksize'])
+        ag_blocks = int(fields['agblocks'])
+        data_blocks = int(fields['dblocks'])
+
+        free_extents = []
+
+        # 'freesp -d' prints one "agno agbno len" line per free extent before its histogram
+        for agno, agbno, length in re.findall(r'^\s*(\d+)\s+(\d+)\s+(\d+)\s*$', freesp, re.MULTILINE):
+            block = int(agno) * ag_blocks + int(agbno)
+            free_extents.append([block * block_size, int(length) * block_size])
+
+        return data_blocks * block_size, free_extents
+
+    def _recover_chunk(self, source_fd, target_fd, offset, length):
+        journal = None
+
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as f:
+                journal = f.read()
+
+        if not journal or struct.unpack('<QQ', journal[:16]) != (offset, length):
+            # the run stopped before journaling the next chunk, so this one was written completely
+            self.logger.log("Chunk at {0} was encrypted before the interruption".format(offset))
+            return
+
+        digests = journal[16:]
+        data = self._pread(source_fd, offset, length)
+        rewritten = 0
+
+        for index, sector_offset in enumerate(xrange(0, length, self.SECTOR_SIZE)):
+            sector = data[sector_offset:sector_offset + self.SECTOR_SIZE]
+            digest = digests[index * self.DIGEST_SIZE:(index + 1) * self.DIGEST_SIZE]
+
+            # a sector that still reads back as its journaled plaintext was not encrypted yet
+            if self._digest(sector) == digest:
+                self._pwrite(target_fd, offset + sector_offset, sector)
+                rewritten += 1
+
+        os.fsync(target_fd)
+
+        self.logger.log("Recovered chunk at {0}: {1} of {2} sectors were not encrypted yet".format(offset,
+                                                                                                   rewritten,
+                                                                                                   length // self.SECTOR_SIZE))
+
+    def _write_journal(self, offset, data):
+        digests = [self._digest(data[i:i + self.SECTOR_SIZE]) for i in xrange(0, len(data), self.SECTOR_SIZE)]
+
+        with open(self.journal_file, 'wb') as f:
+            f.write(struct.pack('<QQ', offset, len(data)))
+            f.write(''.join(digests))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _digest(self, sector):
+        return hashlib.md5(sector).digest()[:self.DIGEST_SIZE]
+
+    def _report_progress(self, percent):
+        self.logger.log("Encryption of {0} is {1}% complete".format(self.source_device, percent))
+
+        if self.progress_callback:
+            self.progress_callback(percent)
+
+    def _pread(self, fd, offset, length):
+        os.lseek(fd, offset, os.SEEK_SET)
+        chunks = []
+        remaining = length
+
+        while remaining > 0:
+            chunk = os.read(fd, remaining)
+            if not chunk:
+                raise Exception("Unexpected end of {0} at {1}".format(self.source_device, offset + length - remaining))
+            chunks.append(chunk)
+            remaining -= len(chunk)
+
+        return ''.join(chunks)
+
+    def _pwrite(self, fd, offset, data):
+        os.lseek(fd, offset, os.SEEK_SET)
+        written = 0
+
+        while written < len(data):
+            written += os.write(fd, data[written:])
+
+    def _read_json(self, path):
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _write_json(self, path, value):
+        temp_path = path + '.tmp'
+
+        with open(temp_path, 'w') as f:
+            json.dump(value, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(temp_path, path)
@@ -81,9 +81,25 @@ class EncryptBlockDeviceState(OSEncryptionState):
                                       raise_exception_on_failure=True)
 
     def _luks_reencrypt(self, bek_path):
-        self.command_executor.ExecuteInBash('cat {0} | cryptsetup-reencrypt -N --reduce-device-size 8192s {1} -v'.format(bek_path,
-                                                                                                                         self.rootfs_block_device),
-                                            raise_exception_on_failure=True)
+        with open(bek_path, 'rb') as f:
+            passphrase = f.read()
+
+        self.reported_percent = None
+
+        self.command_executor.Execute('cryptsetup-reencrypt -N --reduce-device-size 8192s {0} -v'.format(self.rootfs_block_device),
+                                      raise_exception_on_failure=True,
+                                      input=passphrase,
+                                      progress_callback=self._report_progress)
+
+    def _report_progress(self, progress):
+        if progress.percent is None or int(progress.percent) == self.reported_percent:
+            return
+
+        self.reported_percent = int(progress.percent)
+        self.context.hutil.do_status_report(operation='EnableEncryptionDataVolumes',
+                                            status=CommonVariables.extension_success_status,
+                                            status_code=str(CommonVariables.success),
+                                            message='OS disk encryption {0}% complete'.format(self.reported_percent))
 
     def _dump_passphrase(self, bek_path):
         proc_comm = ProcessCommunicator()
@@ -25,6 +25,7 @@ import sys
 from inspect import ismethod
 from time import sleep
 from OSEncryptionState import *
+from UsedBlocksEncryptor import *
 
 class EncryptBlockDeviceState(OSEncryptionState):
     def __init__(self, context):
@@ -49,16 +50,29 @@ class EncryptBlockDeviceState(OSEncryptionState):
         self.command_executor.Execute('mount /boot', False)
         self.command_executor.Execute('service udev restart', False)
 
-        # self._find_bek_and_execute_action('_dump_passphrase')
-        self._find_bek_and_execute_action('_luks_format')
-        self._find_bek_and_execute_action('_luks_open')
+        encryptor = UsedBlocksEncryptor(source_device=self.rootfs_block_device,
+                                        target_device='/dev/mapper/osencrypt',
+                                        state_dir='/boot/luks',
+                                        command_executor=self.command_executor,
+                                        logger=self.context.logger,
+                                        progress_callback=self._report_progress)
+
+        if encryptor.has_checkpoint():
+            self.context.logger.log("Resuming interrupted OS disk encryption")
+
+            if not os.path.exists('/dev/mapper/osencrypt'):
+                self._find_bek_and_execute_action('_luks_open')
+        else:
+            # self._find_bek_and_execute_action('_dump_passphrase')
+            self._find_bek_and_execute_action('_luks_format')
+            self._find_bek_and_execute_action('_luks_open')
 
         self.context.hutil.do_status_report(operation='EnableEncryptionDataVolumes',
                                             status=CommonVariables.extension_success_status,
                                             status_code=str(CommonVariables.success),
                                             message='OS disk encryption started')
 
-        self.command_executor.Execute('dd if={0} of=/dev/mapper/osencrypt bs=52428800'.format(self.rootfs_block_device), True)
+        encryptor.encrypt(self._get_block_device_size(self.rootfs_block_device))
 
     def should_exit(self):
         self.context.logger.log("Verifying if machine should exit encrypt_block_device state")
@@ -71,6 +85,12 @@ class EncryptBlockDeviceState(OSEncryptionState):
 
         return super(EncryptBlockDeviceState, self).should_exit()
 
+    def _report_progress(self, percent):
+        self.context.hutil.do_status_report(operation='EnableEncryptionDataVolumes',
+                                            status=CommonVariables.extension_success_status,
+                                            status_code=str(CommonVariables.success),
+                                            message='OS disk encryption {0}% complete'.format(percent))
+
     def _luks_format(self, bek_path):
         self.command_executor.Execute('rm -rf /boot/luks', True)
         self.command_executor.Execute('mkdir /boot/luks', True)
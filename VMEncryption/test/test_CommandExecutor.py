@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# *********************************************************
+# Copyright (c) Microsoft. All rights reserved.
+#
+# Apache 2.0 License
+#
+# You may obtain a copy of the License at
+# http:#www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# *********************************************************
+
+""" Unit tests for the CommandExecutor module """
+
+import unittest
+import os
+import threading
+import time
+
+import console_logger
+from CommandExecutor import CommandExecutor, ProcessCommunicator, ProcessOutput, parse_progress
+
+class TestCommandExecutorMethods(unittest.TestCase):
+    def setUp(self):
+        self.logger = console_logger.ConsoleLogger()
+        self.executor = CommandExecutor(self.logger)
+
+    def test_communicator(self):
+        proc_comm = ProcessCommunicator()
+        self.assertEqual(self.executor.Execute('cat', communicator=proc_comm, input='line1\nline2'), 0)
+        self.assertEqual(proc_comm.stdout, 'line1\nline2')
+        self.assertEqual(proc_comm.stderr, '')
+
+    def test_failure(self):
+        self.assertEqual(self.executor.Execute('false'), 1)
+        self.assertRaises(Exception, self.executor.Execute, 'false', True)
+
+    def test_timeout(self):
+        start = time.time()
+        self.assertNotEqual(self.executor.Execute('sleep 30', timeout=0.5), 0)
+        self.assertTrue(time.time() - start < 10)
+
+    def test_cancel(self):
+        cancel_event = threading.Event()
+        threading.Timer(0.5, cancel_event.set).start()
+        start = time.time()
+        self.assertRaises(Exception, self.executor.ExecuteInBash, 'sleep 30; sleep 30', True, cancel_event=cancel_event)
+        self.assertTrue(time.time() - start < 10)
+
+    def test_timeout_kills_children(self):
+        proc_comm = ProcessCommunicator()
+        self.executor.ExecuteInBash('sleep 30 & echo $!; wait', communicator=proc_comm, timeout=0.5)
+        child_pid = int(proc_comm.stdout.strip())
+        self.assertFalse(self.executor._is_alive(child_pid))
+
+    def test_same_process_group(self):
+        proc_comm = ProcessCommunicator()
+        self.executor.ExecuteInBash('ps -o pgid= -p $$', communicator=proc_comm)
+        self.assertEqual(int(proc_comm.stdout.strip()), os.getpgrp())
+
+    def test_progress(self):
+        progress = []
+        self.executor.ExecuteInBash("printf 'Progress:  12.5%%, ETA 01:00\\rProgress:  50.0%%, ETA 00:30\\n' >&2",
+                                    progress_callback=progress.append)
+        self.assertEqual([p.percent for p in progress], [12.5, 50.0])
+
+    def test_parse_progress(self):
+        self.assertEqual(parse_progress('1073741824 bytes (1.1 GB, 1.0 GiB) copied, 5 s, 215 MB/s').bytes_done, 1073741824)
+        self.assertEqual(parse_progress('Progress:   7.3%, ETA 10:02, 512 MiB written, speed 120.5 MiB/s').percent, 7.3)
+        self.assertEqual(parse_progress('Key slot 0 created.'), None)
+
+    def test_output_tail(self):
+        output = ProcessOutput(keep_all=False, tail_lines=2)
+        self.assertEqual(output.feed('a\nb\nc'), ['a', 'b'])
+        self.assertEqual(output.close(), ['c'])
+        self.assertEqual(output.get_tail(), 'b\nc')
+        self.assertEqual(output.getvalue(), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+# *********************************************************
+# Copyright (c) Microsoft. All rights reserved.
+#
+# Apache 2.0 License
+#
+# You may obtain a copy of the License at
+# http:#www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# *********************************************************
+
+""" Unit tests for the UdevUtil module """
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+
+import console_logger
+from UdevUtil import UdevUtil
+
+class FakeCommandExecutor(object):
+    def __init__(self):
+        self.commands = []
+
+    def Execute(self, command_to_execute, raise_exception_on_failure=False, communicator=None, input=None, suppress_logging=False):
+        self.commands.append(command_to_execute)
+        return 0
+
+class TestUdevUtilMethods(unittest.TestCase):
+    def setUp(self):
+        self.logger = console_logger.ConsoleLogger()
+        self.executor = FakeCommandExecutor()
+        self.udev_util = UdevUtil(self.logger, self.executor)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write_file(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_is_block_device(self):
+        self.assertFalse(self.udev_util.is_block_device(self._write_file('regular', '')))
+        self.assertFalse(self.udev_util.is_block_device(os.path.join(self.temp_dir, 'missing')))
+
+    def test_has_luks_header(self):
+        self.assertTrue(self.udev_util.has_luks_header(self._write_file('luks', 'LUKS\xba\xbe\x00\x01')))
+        self.assertFalse(self.udev_util.has_luks_header(self._write_file('ext4', '\x00' * 1024)))
+        self.assertFalse(self.udev_util.has_luks_header(os.path.join(self.temp_dir, 'missing')))
+
+    def test_find_device_by_label(self):
+        self.udev_util.BY_LABEL_PATH = self.temp_dir
+        device = self._write_file('sdc1', '')
+        os.symlink(device, os.path.join(self.temp_dir, 'BEK\\x20VOLUME'))
+        self.assertEqual(self.udev_util.find_device_by_label('BEK VOLUME'), device)
+        self.assertEqual(self.udev_util.find_device_by_label('OTHER'), None)
+
+    def test_wait_for_block_device_deadline(self):
+        dev_path = os.path.join(self.temp_dir, 'missing')
+        start = time.time()
+        self.assertFalse(self.udev_util.wait_for_block_device(dev_path, 0.3))
+        self.assertTrue(time.time() - start < 2)
+        self.assertTrue(self.executor.commands)
+        self.assertTrue(all('--exit-if-exists=' + dev_path in cmd for cmd in self.executor.commands))
+
+if __name__ == '__main__':
+    unittest.main()
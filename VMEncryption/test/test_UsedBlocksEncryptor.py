@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#
+# *********************************************************
+# Copyright (c) Microsoft. All rights reserved.
+#
+# Apache 2.0 License
+#
+# You may obtain a copy of the License at
+# http:#www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# *********************************************************
+
+""" Unit tests for the UsedBlocksEncryptor module """
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import console_logger
+from UsedBlocksEncryptor import UsedBlocksEncryptor
+
+DUMPE2FS_OUTPUT = """Filesystem volume name:   <none>
+Free blocks:              24
+Block count:              64
+Block size:               1024
+
+Group 0: (Blocks 1-32)
+  Free blocks: 8-15, 20
+Group 1: (Blocks 33-63)
+  Free blocks:
+Group 2: (Blocks 64-95)
+  Free blocks: 40-55
+"""
+
+XFS_SUPERBLOCK_OUTPUT = """blocksize = 4096
+agblocks = 100
+dblocks = 200
+"""
+
+XFS_FREESP_OUTPUT = """   agno   agbno     len
+      0      10       5
+      1      50      20
+   from      to extents  blocks    pct
+      1       1       0       0   0.00
+      4       7       1       5  20.00
+"""
+
+class FakeCommandExecutor(object):
+    def Execute(self, command_to_execute, raise_exception_on_failure=False, communicator=None, input=None, suppress_logging=False):
+        return 1
+
+class XorEncryptor(UsedBlocksEncryptor):
+    """ writes through a fake dm-crypt device that xors every byte, and can be stopped mid-chunk """
+    CHUNK_SIZE = 4096
+    MERGE_GAP = 512
+
+    def __init__(self, *args, **kwargs):
+        self.fail_at_chunk = kwargs.pop('fail_at_chunk', None)
+        self.chunks_written = 0
+        super(XorEncryptor, self).__init__(*args, **kwargs)
+
+    def _pwrite(self, fd, offset, data):
+        data = ''.join(chr(ord(c) ^ 0x5a) for c in data)
+        if self.chunks_written == self.fail_at_chunk:
+            # only the first sectors of the chunk reach the disk
+            super(XorEncryptor, self)._pwrite(fd, offset, data[:3 * self.SECTOR_SIZE])
+            os.fsync(fd)
+            raise IOError("interrupted")
+        super(XorEncryptor, self)._pwrite(fd, offset, data)
+        self.chunks_written += 1
+
+class TestUsedBlocksEncryptorMethods(unittest.TestCase):
+    def setUp(self):
+        self.logger = console_logger.ConsoleLogger()
+        self.state_dir = tempfile.mkdtemp()
+        self.device = os.path.join(self.state_dir, 'device')
+        self.plaintext = os.urandom(6 * XorEncryptor.CHUNK_SIZE + 1024)
+        with open(self.device, 'wb') as f:
+            f.write(self.plaintext)
+        self.progress = []
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def _create_encryptor(self, fail_at_chunk=None):
+        return XorEncryptor(self.device, self.device, self.state_dir, FakeCommandExecutor(), self.logger,
+                            progress_callback=self.progress.append, fail_at_chunk=fail_at_chunk)
+
+    def _assert_encrypted(self):
+        with open(self.device, 'rb') as f:
+            self.assertEqual(f.read(), ''.join(chr(ord(c) ^ 0x5a) for c in self.plaintext))
+
+    def test_parse_dumpe2fs(self):
+        fs_size, free_extents = UsedBlocksEncryptor.parse_dumpe2fs(DUMPE2FS_OUTPUT)
+        self.assertEqual(fs_size, 64 * 1024)
+        self.assertEqual(free_extents, [[8 * 1024, 8 * 1024], [20 * 1024, 1024], [40 * 1024, 16 * 1024]])
+
+    def test_parse_xfs_freesp(self):
+        fs_size, free_extents = UsedBlocksEncryptor.parse_xfs_freesp(XFS_SUPERBLOCK_OUTPUT, XFS_FREESP_OUTPUT)
+        self.assertEqual(fs_size, 200 * 4096)
+        self.assertEqual(free_extents, [[10 * 4096, 5 * 4096], [150 * 4096, 20 * 4096]])
+
+    def test_used_extents_from_free(self):
+        encryptor = self._create_encryptor()
+        extents = encryptor.get_used_extents_from_free(10000, 8192, [[1024, 1024], [2048 + 256, 256], [4096, 8192]])
+        # the 256 byte gap is merged, the space past the file system is used
+        self.assertEqual(extents, [[0, 1024], [2048, 4096 - 2048], [8192, 10000 - 8192]])
+
+    def test_get_chunks(self):
+        encryptor = self._create_encryptor()
+        chunks = list(encryptor.get_chunks([[0, 5000], [10000, 100]], skip=1000))
+        self.assertEqual(chunks, [(1000, 4000), (10000, 100)])
+
+    def test_encrypt(self):
+        encryptor = self._create_encryptor()
+        encryptor.encrypt(len(self.plaintext))
+        self._assert_encrypted()
+        self.assertEqual(self.progress[-1], 100)
+
+        # a completed encryption is not repeated
+        self._create_encryptor().encrypt(len(self.plaintext))
+        self._assert_encrypted()
+
+    def test_resume_interrupted_chunk(self):
+        encryptor = self._create_encryptor(fail_at_chunk=2)
+        self.assertRaises(IOError, encryptor.encrypt, len(self.plaintext))
+        self.assertTrue(encryptor.has_checkpoint())
+
+        self._create_encryptor().encrypt(len(self.plaintext))
+        self._assert_encrypted()
+
+if __name__ == '__main__':
+    unittest.main()